@@ -0,0 +1,101 @@
+"""
+Minimal HTTP/1.1 over asyncio streams: just enough for local JSON services and their
+clients without adding a web framework dependency. Reads Content-Length and chunked
+(Transfer-Encoding: chunked, as hosted APIs such as api.openai.com send) bodies and writes
+Content-Length ones; keep-alive connections only, no TLS termination.
+"""
+import asyncio
+import json
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           429: 'Too Many Requests', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+async def _read_chunked(reader):
+    """The body of a chunked message: hex-size lines, each followed by that many bytes, up to a 0 size."""
+    parts = []
+    while True:
+        size_line = (await reader.readuntil(b'\r\n')).split(b';', 1)[0].strip()
+        try:
+            size = int(size_line, 16)
+        except ValueError:
+            raise ValueError(f"Malformed chunk size line: {size_line[:40]!r}") from None
+        if size == 0:
+            break
+        parts.append(await reader.readexactly(size))
+        await reader.readexactly(2)
+    # Optional trailer headers, then the blank line ending the message
+    while await reader.readuntil(b'\r\n') != b'\r\n':
+        pass
+    return b''.join(parts)
+
+async def _read_message(reader):
+    """Returns (start_line, headers, body) or None when the peer closed the connection."""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        return None
+    lines = head.decode('latin-1').split('\r\n')
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        body = await _read_chunked(reader)
+    else:
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+    return lines[0], headers, body
+
+def _encode(start_line, body, headers):
+    head = [start_line, f"Content-Length: {len(body)}"]
+    head += [f"{name}: {value}" for name, value in headers.items()]
+    return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body
+
+def encode_json_response(status, payload):
+    body = json.dumps(payload).encode('utf-8')
+    return _encode(f"HTTP/1.1 {status} {REASONS.get(status, '')}", body,
+                   {'Content-Type': 'application/json'})
+
+def encode_json_request(method, host, path, payload=None, headers=None):
+    body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+    return _encode(f"{method} {path} HTTP/1.1", body,
+                   {'Host': host, 'Content-Type': 'application/json', **(headers or {})})
+
+def json_handler(route):
+    """
+    Wraps `async route(method, path, payload) -> (status, payload)` into an
+    asyncio.start_server / start_unix_server connection callback.
+    """
+    async def on_connection(reader, writer):
+        try:
+            while True:
+                message = await _read_message(reader)
+                if message is None:
+                    break
+                start_line, headers, body = message
+                method, path = start_line.split(' ')[:2]
+                try:
+                    payload = json.loads(body) if body else None
+                    status, response = await route(method, path, payload)
+                except json.JSONDecodeError as e:
+                    status, response = 400, {'error': f"Invalid JSON: {e}"}
+                except Exception as e:
+                    status, response = 500, {'error': str(e)}
+                writer.write(encode_json_response(status, response))
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+    return on_connection
+
+async def read_json_response(reader):
+    """Reads one response from a keep-alive connection: (status, payload, headers)."""
+    message = await _read_message(reader)
+    if message is None:
+        raise ConnectionError("Connection closed before a response was received")
+    start_line, headers, body = message
+    status = int(start_line.split(' ')[1])
+    return status, (json.loads(body) if body else None), headers
@@ -0,0 +1,150 @@
+import argparse
+import glob
+import importlib.util
+import os
+import shutil
+import time
+import joblib
+import numpy as np
+import pandas as pd
+
+from chunk_pool import map_chunks, peak_rss_mb
+from fast_scorer import LOOKUP_TABLE_PATH, MODEL_PATH, TRANSFORMER_PATH, FastScorer
+
+KEY_COLS = ['policy_id', 'month']
+# Partition file formats: parquet (needs pyarrow, see requirements.txt) or .npz column archives
+OUTPUT_FORMATS = ('parquet', 'npz')
+
+# Per-process model state, loaded once by _init_worker
+_scorer = None
+
+def _init_worker(model_path, transformer_path, lookup_table_path=None):
+    global _scorer
+    _scorer = FastScorer.load(model_path, transformer_path, lookup_table_path)
+
+def _write_partition(frame, path, output_format):
+    if output_format == 'parquet':
+        frame.to_parquet(path + '.parquet', index=False)
+    else:
+        # Strings as fixed-width unicode so the archive loads without pickle
+        columns = {col: frame[col].to_numpy() for col in frame.columns}
+        columns = {col: v.astype(str) if v.dtype == object else v for col, v in columns.items()}
+        np.savez(path + '.npz', **columns)
+
+def _score_chunk(chunk, part_no, output_dir, output_format):
+    """Scores one chunk and writes it into month=YYYY-MM/ partitions. Returns (rows, peak RSS MB)."""
+    out = chunk[KEY_COLS].copy()
+    out['p_lapse_3_m'] = _scorer.score_many(chunk)
+
+    for month, part in out.groupby('month', sort=False):
+        part_dir = os.path.join(output_dir, f"month={month}")
+        os.makedirs(part_dir, exist_ok=True)
+        _write_partition(part.drop(columns='month'), os.path.join(part_dir, f"part-{part_no:05d}"), output_format)
+    return len(chunk), peak_rss_mb()
+
+def _is_score_output(output_dir):
+    """True when output_dir only holds month=*/part-* files, i.e. the output of an earlier run."""
+    for entry in os.scandir(output_dir):
+        if not (entry.is_dir(follow_symlinks=False) and entry.name.startswith('month=')):
+            return False
+        for part in os.scandir(entry.path):
+            if not (part.is_file(follow_symlinks=False) and part.name.startswith('part-')
+                    and part.name.endswith(('.parquet', '.npz'))):
+                return False
+    return True
+
+def batch_score(input_path, output_dir, chunk_size=200_000, n_workers=None, model_path=MODEL_PATH,
+                transformer_path=TRANSFORMER_PATH, lookup_table_path=None, overwrite=False, output_format='parquet'):
+    """
+    Streams input_path in chunk_size rows and writes p_lapse_3_m partitioned by month.
+
+    Each worker process loads the model once; chunk_pool.map_chunks keeps at most 2 chunks per
+    worker in flight, so peak memory depends on chunk_size and n_workers, not on the file size.
+    Part files are named by chunk number, so a non-empty output_dir is refused unless overwrite
+    is set and it only holds the month=*/part-* files of an earlier run (they are then replaced).
+    The run writes into a temp dir that is renamed to output_dir when it finishes, so output_dir
+    never mixes parts of different runs. Partitions are written as output_format ('parquet' or 'npz').
+    lookup_table_path scores through the precomputed table (train with --lookup-table).
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', expected one of {OUTPUT_FORMATS}")
+    if output_format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        raise ImportError("Parquet output needs pyarrow (pip install -r requirements.txt); "
+                          "use output_format='npz' (--format npz) without it")
+    output_dir = os.fspath(output_dir).rstrip(os.sep)
+    if os.path.isdir(output_dir) and os.listdir(output_dir):
+        if not overwrite:
+            raise FileExistsError(f"{output_dir} is not empty, pass overwrite=True (--overwrite) to replace it")
+        if not _is_score_output(output_dir):
+            raise FileExistsError(f"{output_dir} holds more than month=*/part-* scores, refusing to replace it")
+    n_workers = n_workers or os.cpu_count() or 1
+    transformer = joblib.load(transformer_path)
+    usecols = list(dict.fromkeys(KEY_COLS + transformer.features))
+    reader = pd.read_csv(input_path, chunksize=chunk_size, usecols=usecols)
+
+    tmp_dir = f"{output_dir}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        start = time.time()
+        rows, worker_rss = _score_file(reader, tmp_dir, n_workers, model_path, transformer_path, lookup_table_path,
+                                       output_format)
+        shutil.rmtree(output_dir, ignore_errors=True)
+        os.replace(tmp_dir, output_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    elapsed = time.time() - start
+    stats = {
+        'rows': rows,
+        'seconds': elapsed,
+        'rows_per_s': rows / elapsed if elapsed > 0 else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+        'worker_peak_rss_mb': worker_rss,
+    }
+    print(f"Scored {rows:,} rows in {elapsed:.1f}s ({stats['rows_per_s']:,.0f} rows/s), "
+          f"peak RSS {stats['peak_rss_mb']:.0f} MB (max worker {worker_rss:.0f} MB) -> {output_dir}")
+    return stats
+
+def _score_file(reader, output_dir, n_workers, model_path, transformer_path, lookup_table_path, output_format):
+    """Scores every chunk of reader into output_dir; returns (rows, max worker peak RSS MB)."""
+    initargs = (model_path, transformer_path, lookup_table_path)
+    if n_workers == 1:
+        _init_worker(*initargs)
+    rows, worker_rss = 0, 0.0
+    for n, rss in map_chunks(_score_chunk, reader, n_workers, _init_worker, initargs,
+                             args=(output_dir, output_format)):
+        rows, worker_rss = rows + n, max(worker_rss, rss)
+    return rows, worker_rss
+
+def read_scores(output_dir, month=None):
+    """Loads the partitioned output back (all months, or one month) into a DataFrame."""
+    pattern = os.path.join(output_dir, f"month={month or '*'}", 'part-*')
+    frames = []
+    for path in sorted(glob.glob(pattern)):
+        if path.endswith('.parquet'):
+            part = pd.read_parquet(path)
+        else:
+            with np.load(path) as npz:
+                part = pd.DataFrame({col: npz[col] for col in npz.files})
+        part['month'] = os.path.basename(os.path.dirname(path)).split('=', 1)[1]
+        frames.append(part)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a large policy file in chunks across worker processes.")
+    parser.add_argument('input', help="CSV with policy_id, month and the model features")
+    parser.add_argument('output_dir', help="Directory for month=YYYY-MM/ partitions")
+    parser.add_argument('--chunk-size', type=int, default=200_000)
+    parser.add_argument('--workers', type=int, default=None, help="Defaults to the CPU count")
+    parser.add_argument('--lookup-table', action='store_true',
+                        help=f"Score by table lookup from {LOOKUP_TABLE_PATH} instead of evaluating the trees")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='parquet',
+                        help="Partition file format (parquet needs pyarrow)")
+    parser.add_argument('--overwrite', action='store_true',
+                        help="Replace the partitions of an earlier run in a non-empty output_dir")
+    args = parser.parse_args()
+
+    batch_score(args.input, args.output_dir, chunk_size=args.chunk_size, n_workers=args.workers,
+                lookup_table_path=LOOKUP_TABLE_PATH if args.lookup_table else None, overwrite=args.overwrite,
+                output_format=args.format)
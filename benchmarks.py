@@ -0,0 +1,403 @@
+"""
+Micro-benchmarks for the scoring and retrieval hot paths.
+
+Run one with: python benchmarks.py <name> [--n N]
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+import train_model
+from feature_transformer import FeatureTransformer
+
+def _timed(fn, repeat=3):
+    """Best-of-N wall time in seconds and the last result."""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def _raw_rows(n_rows, seed=0):
+    """n_rows raw policy rows resampled from the test split."""
+    base = pd.read_csv('data/test_gpt.csv')
+    idx = np.random.default_rng(seed).integers(0, len(base), n_rows)
+    return base.iloc[idx].reset_index(drop=True)
+
+def _pandas_encode(df, encoder, features):
+    """The pd.cut + OrdinalEncoder path the transformer replaced, kept as the baseline."""
+    X = df[features].copy()
+    for col, spec in train_model.BIN_SPECS.items():
+        X[col] = pd.cut(X[col], bins=spec['bins'], labels=spec['labels'], right=True)
+    X[train_model.CAT_COLS] = encoder.transform(X[train_model.CAT_COLS])
+    return X
+
+def bench_cohorts(n_policies=100_000):
+    """Per-policy retrieval, prompts and mock generation vs cohort mode (generate_strategy.run_cohort_pipeline)."""
+    import json
+    from generate_strategy import (RETENTION_NAMESPACE, RETRIEVE_K, build_customer_context,
+                                   mock_strategy_response, run_cohort_pipeline)
+    from retrieval_system import MinimalRAG
+    from strategy_prompt import StrategyPromptBuilder
+    
+    df = _raw_rows(n_policies)
+    df['p_lapse_3_m'] = np.random.default_rng(0).random(n_policies)
+    rag = MinimalRAG(cache_size=0)
+    
+    def per_policy():
+        contexts = [build_customer_context(row) for row in df.to_dict('records')]
+        all_hits = rag.retrieve_many([c.to_retrieval_query() for c in contexts], k=RETRIEVE_K,
+                                     namespace=RETENTION_NAMESPACE)
+        messages = [StrategyPromptBuilder.build_messages(c, hits, StrategyPromptBuilder.SNIPPET_TOKEN_BUDGET)
+                    for c, hits in zip(contexts, all_hits)]
+        return [json.dumps(mock_strategy_response(c), indent=2) for c in contexts], messages
+    
+    t_policy, _ = _timed(per_policy, repeat=1)
+    t_cohort, (contexts, _) = _timed(lambda: run_cohort_pipeline(df, rag), repeat=1)
+    n_cohorts = len({c.cohort_key() for c in contexts})
+    print(f"Retention strategies for {n_policies:,} policies (mock generation):")
+    print(f"  per policy : {t_policy:7.2f}s  {n_policies:9,} retrievals / LLM calls")
+    print(f"  cohorts    : {t_cohort:7.2f}s  {n_cohorts:9,} retrievals / LLM calls "
+          f"({n_policies / n_cohorts:,.0f}x fewer)")
+
+def bench_context_batch(n_rows=1_000_000):
+    """CustomerContext per row vs CustomerContextBatch, from a scored frame to retrieval queries."""
+    import tracemalloc
+    from generate_strategy import build_context_batch, build_customer_context
+    
+    df = _raw_rows(n_rows)
+    df['p_lapse_3_m'] = np.random.default_rng(0).random(n_rows)
+    
+    t_rows, contexts = _timed(lambda: [build_customer_context(row) for row in df.to_dict('records')], repeat=1)
+    t_row_queries, expected = _timed(lambda: [c.to_retrieval_query() for c in contexts], repeat=1)
+    t_batch, batch = _timed(lambda: build_context_batch(df))
+    t_batch_queries, queries = _timed(lambda: batch.to_retrieval_queries())
+    assert queries == expected
+    
+    tracemalloc.start()
+    sample = list(batch.select(slice(0, 100_000)).contexts())
+    per_context = tracemalloc.get_traced_memory()[0] / len(sample)
+    tracemalloc.stop()
+    
+    print(f"Customer contexts and retrieval queries, {n_rows:,} scored rows ({len(set(queries)):,} distinct queries):")
+    print(f"  per row : contexts {t_rows:6.2f}s  queries {t_row_queries:6.2f}s  {n_rows / (t_rows + t_row_queries):10,.0f} rows/s")
+    print(f"  batch   : contexts {t_batch:6.2f}s  queries {t_batch_queries:6.2f}s  "
+          f"{n_rows / (t_batch + t_batch_queries):10,.0f} rows/s")
+    print(f"  CustomerContext objects (slots): {per_context:.0f} bytes each")
+
+def bench_feature_transform(n_rows=1_000_000):
+    from sklearn.preprocessing import OrdinalEncoder
+    
+    train = pd.read_csv('data/train_gpt.csv')
+    features = [c for c in train.columns if c not in train_model.DROP_COLS]
+    transformer = FeatureTransformer(train_model.BIN_SPECS, train_model.CAT_COLS).fit(train, features)
+    binned = train.copy()
+    for col, spec in train_model.BIN_SPECS.items():
+        binned[col] = pd.cut(binned[col], bins=spec['bins'], labels=spec['labels'], right=True)
+    encoder = OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1).fit(binned[train_model.CAT_COLS])
+    
+    df = _raw_rows(n_rows)
+    arrays = {c: df[c].to_numpy() for c in features}
+    
+    t_pandas, X_pandas = _timed(lambda: _pandas_encode(df, encoder, features))
+    t_frame, X_frame = _timed(lambda: transformer.transform(df))
+    t_arrays, X_arrays = _timed(lambda: transformer.transform_arrays(arrays))
+    assert np.array_equal(X_pandas.to_numpy(dtype=np.float64), X_arrays)
+    assert np.array_equal(X_frame.to_numpy(dtype=np.float64), X_arrays)
+    
+    one_df, one_arrays = df.head(1), {c: a[:1] for c, a in arrays.items()}
+    t_one_pandas, _ = _timed(lambda: _pandas_encode(one_df, encoder, features), repeat=200)
+    t_one_arrays, _ = _timed(lambda: transformer.transform_arrays(one_arrays), repeat=200)
+    
+    print(f"Feature transform, {n_rows:,} rows (outputs identical):")
+    print(f"  pandas cut + OrdinalEncoder : {t_pandas:7.3f}s  {n_rows / t_pandas:12,.0f} rows/s")
+    print(f"  transformer (DataFrame)     : {t_frame:7.3f}s  {n_rows / t_frame:12,.0f} rows/s")
+    print(f"  transformer (NumPy arrays)  : {t_arrays:7.3f}s  {n_rows / t_arrays:12,.0f} rows/s")
+    print(f"  single row: pandas {t_one_pandas * 1e6:,.0f}us, arrays {t_one_arrays * 1e6:,.0f}us")
+
+def bench_single_record(n_rows=2000):
+    """Per-row latency: pandas scoring path vs FastScorer.score_one / score_many."""
+    import joblib
+    from fast_scorer import FastScorer
+    
+    model = joblib.load(train_model.MODEL_PATH)
+    scorer = FastScorer(model, joblib.load(train_model.TRANSFORMER_PATH))
+    transformer = scorer.transformer
+    df = _raw_rows(n_rows)
+    records = df.to_dict('records')
+    columns = [{c: df[c].to_numpy()[i:i + 1] for c in transformer.features} for i in range(n_rows)]
+    categorical = 'c' in (model.get_booster().feature_types or [])
+    
+    def pandas_path(i):
+        X = transformer.transform(df.iloc[i:i + 1])
+        return model.predict_proba(transformer.as_categorical(X) if categorical else X)[:, 1]
+    
+    n_pandas = min(n_rows, 300)
+    t_pandas, _ = _timed(lambda: [pandas_path(i) for i in range(n_pandas)], repeat=1)
+    t_one, one = _timed(lambda: [scorer.score_one(r) for r in records])
+    t_many, _ = _timed(lambda: [scorer.score_many(c) for c in columns])
+    t_bulk, bulk = _timed(lambda: scorer.score_many(df))
+    assert np.allclose(one, bulk, atol=1e-6)
+    
+    print(f"Single-record scoring ({len(scorer.trees.roots)} trees):")
+    print(f"  DataFrame + predict_proba : {t_pandas / n_pandas * 1e6:8.1f}us/row")
+    print(f"  score_one(dict)           : {t_one / n_rows * 1e6:8.1f}us/row")
+    print(f"  score_many(1-row arrays)  : {t_many / n_rows * 1e6:8.1f}us/row")
+    print(f"  score_many({n_rows} rows)    : {t_bulk / n_rows * 1e6:8.1f}us/row")
+
+def bench_lookup_table(n_rows=1_000_000):
+    """Bulk scoring by tree evaluation vs the precomputed table (train with --lookup-table first)."""
+    from fast_scorer import LOOKUP_TABLE_PATH, FastScorer, LookupTable
+    
+    scorer = FastScorer.load()
+    table_scorer = FastScorer(scorer.booster, scorer.transformer, LookupTable.load(LOOKUP_TABLE_PATH))
+    df = _raw_rows(n_rows)
+    columns = {c: df[c].to_numpy() for c in scorer.features}
+    X = scorer.transformer.transform_arrays(columns)
+    
+    t_trees, expected = _timed(lambda: scorer.predict_encoded(X))
+    t_table, got = _timed(lambda: table_scorer.lookup_table.lookup(X, fallback=scorer.predict_encoded))
+    t_end_to_end, _ = _timed(lambda: table_scorer.score_many(columns))
+    
+    print(f"Bulk scoring, {n_rows:,} encoded rows, table of {table_scorer.lookup_table.table.size:,} cells:")
+    print(f"  inplace_predict : {t_trees:7.3f}s  {n_rows / t_trees:12,.0f} rows/s")
+    print(f"  table lookup    : {t_table:7.3f}s  {n_rows / t_table:12,.0f} rows/s")
+    print(f"  score_many with table (incl. encoding): {n_rows / t_end_to_end:,.0f} rows/s")
+    print(f"  max |table - model| = {np.abs(got - expected).max():.2e}")
+
+def bench_reason_codes(n_rows=100_000):
+    """Scoring alone vs scoring plus reason codes (exact TreeSHAP and per-path pred_contribs), and top-1 agreement."""
+    from fast_scorer import FastScorer
+    
+    scorer = FastScorer.load()
+    df = _raw_rows(n_rows)
+    columns = {c: df[c].to_numpy() for c in scorer.features}
+    
+    t_score, expected = _timed(lambda: scorer.score_many(columns))
+    t_exact, (p_exact, exact) = _timed(lambda: scorer.explain_many(columns), repeat=1)
+    t_approx, (_, approx) = _timed(lambda: scorer.explain_many(columns, approximate=True))
+    top_driver = lambda reason_codes: [r[0][0] if r else None for r in reason_codes]
+    top1 = np.mean(np.array(top_driver(approx), dtype=object) == np.array(top_driver(exact), dtype=object))
+    
+    print(f"Scoring {n_rows:,} policies:")
+    print(f"  score_many                 : {t_score:7.3f}s  {n_rows / t_score:12,.0f} rows/s")
+    print(f"  explain_many (TreeSHAP)    : {t_exact:7.3f}s  {n_rows / t_exact:12,.0f} rows/s")
+    print(f"  explain_many (approximate) : {t_approx:7.3f}s  {n_rows / t_approx:12,.0f} rows/s")
+    print(f"  max |explain p - score_many| = {np.abs(p_exact - expected).max():.2e}, "
+          f"approximate top driver agrees on {top1:.1%}")
+
+def _retrieval_queries(n_queries, seed=0):
+    """Strategy retrieval queries for n_queries resampled policies with random scores."""
+    from generate_strategy import build_customer_context
+    
+    df = _raw_rows(n_queries, seed)
+    df['p_lapse_3_m'] = np.random.default_rng(seed).random(n_queries)
+    return [build_customer_context(row).to_retrieval_query() for row in df.to_dict('records')]
+
+def bench_retrieve_many(n_queries=100_000, k=3):
+    """A loop over MinimalRAG.retrieve vs one retrieve_many call."""
+    from retrieval_system import MinimalRAG
+    
+    from strategy_contract import CustomerContext
+    
+    rag = MinimalRAG(cache_size=0)
+    queries = _retrieval_queries(n_queries)
+    t_loop, looped = _timed(lambda: [rag.retrieve(q, k) for q in queries], repeat=1)
+    t_batch, batched = _timed(lambda: rag.retrieve_many(queries, k))
+    assert all([h['chunk'] for h in a] == [h['chunk'] for h in b] for a, b in zip(looped, batched))
+    
+    cached = MinimalRAG()
+    t_warm, _ = _timed(lambda: cached.warm_cache(CustomerContext.query_space(), k), repeat=1)
+    t_cached_loop, _ = _timed(lambda: [cached.retrieve(q, k) for q in queries])
+    t_cached_batch, _ = _timed(lambda: cached.retrieve_many(queries, k))
+    
+    print(f"Retrieval, {n_queries:,} queries ({len(set(queries)):,} distinct) over {len(rag.chunks)} chunks, "
+          f"k={k} (same hits):")
+    print(f"  retrieve() loop         : {t_loop:7.2f}s  {n_queries / t_loop:10,.0f} queries/s")
+    print(f"  retrieve_many()         : {t_batch:7.2f}s  {n_queries / t_batch:10,.0f} queries/s")
+    print(f"  cached retrieve() loop  : {t_cached_loop:7.2f}s  {n_queries / t_cached_loop:10,.0f} queries/s")
+    print(f"  cached retrieve_many()  : {t_cached_batch:7.2f}s  {n_queries / t_cached_batch:10,.0f} queries/s")
+    print(f"  cache pre-warm: {t_warm:.2f}s, {cached.cache_info()}")
+
+def _synthetic_corpus(docs_dir, n_chunks, chunks_per_file=100, vocab_size=50_000, n_topics=0, seed=0):
+    """
+    Writes n_chunks paragraphs of Zipf-distributed terms as markdown files; returns the term sampler.
+    The chunker packs short paragraphs together, so the indexes hold fewer chunks than paragraphs.
+    With n_topics, every file draws from one of n_topics shifted term rankings (sample(n, topic)).
+    """
+    import os
+    
+    rng = np.random.default_rng(seed)
+    terms = np.array([f"term{i}" for i in range(vocab_size)])
+    shift = vocab_size // max(n_topics, 1)
+    sample = lambda n, topic=0: terms[(np.minimum(rng.zipf(1.15, n), vocab_size) - 1 + topic * shift) % vocab_size]
+    os.makedirs(docs_dir, exist_ok=True)
+    for file_no in range(0, n_chunks, chunks_per_file):
+        topic = rng.integers(n_topics) if n_topics else 0
+        paragraphs = [' '.join(sample(rng.integers(40, 120), topic))
+                      for _ in range(min(chunks_per_file, n_chunks - file_no))]
+        with open(os.path.join(docs_dir, f"Doc{file_no}_generated.md"), 'w', encoding='utf-8') as f:
+            f.write('\n\n'.join(paragraphs))
+    return sample
+
+def bench_bm25(n_chunks=100_000, n_queries=200, k=3):
+    """Query latency vs corpus size: TF-IDF full scan, BM25 exhaustive and BM25 with MaxScore pruning."""
+    import tempfile
+    from retrieval_system import MinimalRAG
+    
+    print(f"Retrieval scaling, {n_queries} queries of 2-5 Zipf terms, k={k}:")
+    for size in sorted({n_chunks // 10, n_chunks // 3, n_chunks}):
+        with tempfile.TemporaryDirectory() as docs_dir:
+            sample = _synthetic_corpus(docs_dir, size)
+            queries = [' '.join(sample(n)) for n in np.random.default_rng(1).integers(2, 6, n_queries)]
+            t_tfidf_build, tfidf = _timed(lambda: MinimalRAG(docs_dir, use_index=False, cache_size=0), repeat=1)
+            t_bm25_build, bm25 = _timed(lambda: MinimalRAG(docs_dir, use_index=False, cache_size=0,
+                                                            engine='bm25'), repeat=1)
+        
+        index = bm25.bm25
+        t_tfidf, _ = _timed(lambda: [tfidf.retrieve(q, k) for q in queries], repeat=1)
+        index.postings_scanned = 0
+        t_full, full = _timed(lambda: [index.search(q, k, prune=False) for q in queries], repeat=1)
+        scanned_full, index.postings_scanned = index.postings_scanned, 0
+        t_pruned, pruned = _timed(lambda: [index.search(q, k) for q in queries], repeat=1)
+        scanned_pruned = index.postings_scanned
+        assert all(np.allclose(a[1], b[1], rtol=1e-5) for a, b in zip(full, pruned))
+        
+        ms = lambda t: t / n_queries * 1000
+        print(f"  {len(tfidf.chunks):>7,} chunks (build tfidf {t_tfidf_build:5.1f}s, bm25 {t_bm25_build:5.1f}s): "
+              f"tfidf {ms(t_tfidf):6.2f}ms  bm25 exhaustive {ms(t_full):6.2f}ms  "
+              f"bm25 MaxScore {ms(t_pruned):6.2f}ms  "
+              f"postings/query {scanned_full / n_queries:,.0f} -> {scanned_pruned / n_queries:,.0f}")
+
+def bench_lsa(n_chunks=50_000, n_queries=500, k=10):
+    """LSA search over IVF lists: recall@k and latency vs exact dense search, by nprobe."""
+    import tempfile
+    from retrieval_system import MinimalRAG
+    
+    with tempfile.TemporaryDirectory() as docs_dir:
+        sample = _synthetic_corpus(docs_dir, n_chunks, n_topics=50)
+        rng = np.random.default_rng(1)
+        queries = [' '.join(sample(n, rng.integers(50))) for n in rng.integers(3, 8, n_queries)]
+        rag = MinimalRAG(docs_dir, use_index=False, cache_size=0, engine='lsa')
+        t_fit, lsa = _timed(rag.lsa_index, repeat=1)
+    embedded = lsa.embed(rag.vectorizer.transform(queries))
+    query_matrix = rag.vectorizer.transform(queries)
+    
+    t_tfidf, _ = _timed(lambda: [(rag.tfidf_matrix @ query_matrix[i].T) for i in range(n_queries)], repeat=1)
+    t_exact, exact = _timed(lambda: [lsa.search(q, k, nprobe=lsa.n_lists) for q in embedded], repeat=1)
+    ms = lambda t: t / n_queries * 1000
+    print(f"LSA over {len(rag.chunks):,} chunks: {lsa.embeddings.shape[1]} dims, {lsa.n_lists} lists, fit {t_fit:.1f}s, "
+          f"embeddings {lsa.embeddings.nbytes / 1e6:.1f} MB float32")
+    print(f"  tfidf sparse scan {ms(t_tfidf):6.3f}ms/query   exact LSA {ms(t_exact):6.3f}ms/query")
+    for nprobe in sorted({1, 2, 4, 8, 16, lsa.nprobe, 32, 64} - {0}):
+        if nprobe > lsa.n_lists:
+            continue
+        lsa.chunks_scored = 0
+        t_ivf, approx = _timed(lambda: [lsa.search(q, k, nprobe=nprobe) for q in embedded], repeat=1)
+        recall = np.mean([len(np.intersect1d(a[0], e[0])) / len(e[0]) for a, e in zip(approx, exact)])
+        default = " (default)" if nprobe == lsa.nprobe else ""
+        print(f"  nprobe {nprobe:>3}: {ms(t_ivf):6.3f}ms/query  recall@{k} {recall:.3f}  "
+              f"chunks scored/query {lsa.chunks_scored / n_queries:,.0f}{default}")
+    t_hybrid, _ = _timed(lambda: [rag._hybrid(lsa, query_matrix[i], q, k, None) for i, q in enumerate(embedded)],
+                         repeat=1)
+    print(f"  hybrid (nprobe {lsa.nprobe}) {ms(t_hybrid):6.3f}ms/query")
+
+def _percentiles_ms(latencies):
+    lat = np.asarray(latencies) * 1000
+    return np.percentile(lat, 50), np.percentile(lat, 99)
+
+def bench_service(n_requests=5000, concurrency=32):
+    """p50/p99 latency of POST /score against an in-process ScoringService under concurrent load."""
+    import asyncio
+    from async_http import encode_json_request, read_json_response
+    from scoring_service import ScoringService
+    
+    records = _raw_rows(n_requests).drop(columns=['split', 'lapse_next_3m']).to_dict('records')
+    
+    async def client(port, jobs, latencies):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for record in jobs:
+            start = time.perf_counter()
+            writer.write(encode_json_request('POST', '127.0.0.1', '/score', record))
+            status, _, _ = await read_json_response(reader)
+            latencies.append(time.perf_counter() - start)
+            assert status == 200
+        writer.close()
+    
+    async def run(max_batch):
+        service = ScoringService(max_batch=max_batch)
+        server = await service.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        latencies = []
+        start = time.perf_counter()
+        await asyncio.gather(*(client(port, records[i::concurrency], latencies) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        server.close()
+        await service.batcher.stop()
+        p50, p99 = _percentiles_ms(latencies)
+        mean_batch = service.batcher.records / max(service.batcher.batches, 1)
+        print(f"  max_batch={max_batch:3d}: p50 {p50:6.2f}ms  p99 {p99:6.2f}ms  "
+              f"{n_requests / elapsed:8,.0f} req/s  mean batch {mean_batch:.1f}")
+    
+    print(f"Scoring service, {n_requests:,} requests from {concurrency} concurrent keep-alive clients:")
+    for max_batch in (1, 64):
+        asyncio.run(run(max_batch))
+
+def bench_llm_client(n_requests=256):
+    """Throughput of LLMClient against an in-process stub endpoint (~200ms per completion) by concurrency."""
+    import asyncio
+    import tempfile
+    from llm_client import LLMClient
+    from llm_stub_server import StubChatServer
+    
+    prompts = [[{'role': 'user', 'content': f"Retention plan for policy P{i}"}] for i in range(n_requests)]
+    
+    async def run(concurrency, cache_dir):
+        stub = StubChatServer(latency_ms=200, jitter_ms=50, error_rate=0.02)
+        server = await stub.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        # Rate limits well above the load, so only the concurrency bound and the stub latency matter
+        llm = LLMClient(f"http://127.0.0.1:{port}", max_concurrency=concurrency, requests_per_min=600_000,
+                        tokens_per_min=10**9, backoff_s=0.05, cache_dir=cache_dir)
+        start = time.perf_counter()
+        await llm.complete_many(prompts)
+        elapsed = time.perf_counter() - start
+        await llm.aclose()
+        server.close()
+        await server.wait_closed()
+        print(f"  concurrency={concurrency:3d}: {n_requests / elapsed:8,.1f} req/s  max in flight {stub.max_in_flight:3d}  "
+              f"retries {llm.stats['retries']:3d}  cache hits {llm.stats['cache_hits']}")
+    
+    print(f"LLM client, {n_requests:,} chat completions against a stub endpoint (200ms latency, 2% errors):")
+    for concurrency in (1, 8, 64):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            asyncio.run(run(concurrency, cache_dir))
+    with tempfile.TemporaryDirectory() as cache_dir:
+        print("  Re-run with a warm cache:")
+        asyncio.run(run(64, cache_dir))
+        asyncio.run(run(64, cache_dir))
+
+BENCHMARKS = {
+    'bm25': bench_bm25,
+    'cohorts': bench_cohorts,
+    'context_batch': bench_context_batch,
+    'feature_transform': bench_feature_transform,
+    'llm_client': bench_llm_client,
+    'lookup_table': bench_lookup_table,
+    'lsa': bench_lsa,
+    'reason_codes': bench_reason_codes,
+    'retrieve_many': bench_retrieve_many,
+    'service': bench_service,
+    'single_record': bench_single_record,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a micro-benchmark.")
+    parser.add_argument('name', choices=sorted(BENCHMARKS))
+    parser.add_argument('--n', type=int, default=None, help="Problem size (rows, queries, ...)")
+    args = parser.parse_args()
+    
+    bench = BENCHMARKS[args.name]
+    bench() if args.n is None else bench(args.n)
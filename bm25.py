@@ -0,0 +1,103 @@
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer
+
+class BM25Index:
+    """
+    Inverted index over text chunks with BM25 scoring.
+
+    Every term has a postings list of (chunk id, BM25 impact) sorted by chunk id; the impact
+    already folds in idf, term frequency and length normalization, so a query score is a sum
+    of impacts. Queries are evaluated term-at-a-time with MaxScore pruning: terms are visited
+    from the highest upper bound down, and once the bounds of the remaining terms can no longer
+    lift an unseen chunk past the current k-th score, those terms are only looked up for the
+    surviving candidates instead of being merged in full. Long postings lists of common terms
+    are then never scanned, so query cost follows the matching postings, not the corpus size.
+
+    Built from a chunk x term count matrix, its term -> column vocabulary and the analyzer
+    that produced it (from_chunks() does all three from raw text).
+    """
+    def __init__(self, counts, vocabulary, analyzer, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary = vocabulary
+        self.analyzer = analyzer
+        counts = counts.astype(np.float32)  # astype copies, the caller's matrix is left alone
+        self.n_chunks = counts.shape[0]
+
+        doc_len = np.asarray(counts.sum(axis=1)).ravel()
+        avg_len = doc_len.mean() if self.n_chunks else 0.0
+        df = np.diff(counts.tocsc().indptr)
+        self.idf = np.log1p((self.n_chunks - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        # BM25 impact of each (chunk, term) pair, then one postings list per term
+        tf = counts.data
+        norm = np.repeat(k1 * (1 - b + b * doc_len / max(avg_len, 1e-9)), np.diff(counts.indptr))
+        counts.data = self.idf[counts.indices] * tf * (k1 + 1) / (tf + norm)
+        postings = counts.tocsc()
+        postings.sort_indices()
+        self.indptr = postings.indptr
+        self.doc_ids = postings.indices.astype(np.int32)
+        self.impacts = postings.data.astype(np.float32)
+        self.max_impact = np.maximum.reduceat(self.impacts, self.indptr[:-1]) if len(self.impacts) else \
+            np.zeros(len(self.idf), dtype=np.float32)
+        self.max_impact[df == 0] = 0.0
+        self.postings_scanned = 0
+
+    @classmethod
+    def from_chunks(cls, chunks, stop_words='english', **params):
+        counter = CountVectorizer(stop_words=stop_words)
+        counts = counter.fit_transform(chunks)
+        return cls(counts, counter.vocabulary_, counter.build_analyzer(), **params)
+
+    def _query_terms(self, query):
+        """(term id, query term count) pairs, highest score upper bound first."""
+        vocabulary = self.vocabulary
+        counts = {}
+        for token in self.analyzer(query):
+            term = vocabulary.get(token)
+            if term is not None:
+                counts[term] = counts.get(term, 0) + 1
+        return sorted(counts.items(), key=lambda tq: -self.max_impact[tq[0]] * tq[1])
+
+    def search(self, query, k=3, prune=True, rows_mask=None):
+        """Returns (chunk ids, scores) of the top k chunks, best first (only chunks in rows_mask if given)."""
+        terms = self._query_terms(query)
+        bounds = [float(self.max_impact[t]) * q for t, q in terms]
+        docs = np.empty(0, dtype=np.int32)
+        scores = np.empty(0, dtype=np.float32)
+
+        for i, (term, qtf) in enumerate(terms):
+            start, end = self.indptr[term], self.indptr[term + 1]
+            post_docs, post_impacts = self.doc_ids[start:end], self.impacts[start:end]
+            remaining = sum(bounds[i:])
+            threshold = np.partition(scores, len(scores) - k)[len(scores) - k] if len(scores) >= k else 0.0
+
+            if prune and len(scores) >= k and remaining < threshold:
+                # No unseen chunk can reach the top k: drop hopeless candidates, look up the rest
+                keep = scores + remaining >= threshold
+                docs, scores = docs[keep], scores[keep]
+                if not len(post_docs):
+                    continue
+                pos = np.minimum(np.searchsorted(post_docs, docs), len(post_docs) - 1)
+                hit = post_docs[pos] == docs
+                scores[hit] += qtf * post_impacts[pos[hit]]
+                self.postings_scanned += len(docs)
+            else:
+                if rows_mask is not None:
+                    # Candidates always come from a merge, so filtering here keeps every result in the mask;
+                    # the term bounds stay valid (if loose) upper bounds for the filtered lists
+                    keep = rows_mask[post_docs]
+                    post_docs, post_impacts = post_docs[keep], post_impacts[keep]
+                merged, inverse = np.unique(np.concatenate([docs, post_docs]), return_inverse=True)
+                scores = np.bincount(inverse, weights=np.concatenate([scores, qtf * post_impacts]),
+                                     minlength=len(merged)).astype(np.float32)
+                docs = merged.astype(np.int32)
+                self.postings_scanned += len(post_docs)
+
+        if len(docs) > k:
+            # Everything tied with the k-th score stays in so the tie-break below is deterministic
+            kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+            docs, scores = docs[scores >= kth], scores[scores >= kth]
+        # Best first, ties to the lower chunk id
+        order = np.lexsort((docs, -scores))[:k]
+        return docs[order], scores[order]
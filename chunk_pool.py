@@ -0,0 +1,36 @@
+"""
+Runs a function over the chunks of a stream (e.g. pd.read_csv(..., chunksize=...)) in this process
+or across worker processes, keeping a bounded number of chunks in flight. Shared by batch_score.py
+and the prompt exporters.
+"""
+import resource
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def map_chunks(fn, chunks, n_workers=1, initializer=None, initargs=(), args=()):
+    """
+    Calls fn(chunk, part_no, *args) for every chunk and yields the results, in completion order.
+
+    With n_workers > 1 the calls run in a ProcessPoolExecutor whose processes run
+    initializer(*initargs) once; at most 2 chunks per worker are in flight, so peak memory
+    depends on the chunk size and n_workers, not on the length of the stream. With one worker
+    the calls run in this process, which the caller sets up itself (initializer is not called).
+    """
+    if n_workers == 1:
+        for part_no, chunk in enumerate(chunks):
+            yield fn(chunk, part_no, *args)
+        return
+    max_in_flight = 2 * n_workers
+    with ProcessPoolExecutor(n_workers, initializer=initializer, initargs=initargs) as pool:
+        pending = set()
+        for part_no, chunk in enumerate(chunks):
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for f in done:
+                    yield f.result()
+            pending.add(pool.submit(fn, chunk, part_no, *args))
+        for f in pending:
+            yield f.result()
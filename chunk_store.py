@@ -0,0 +1,178 @@
+import os
+from collections.abc import Mapping
+import numpy as np
+
+from chunker import count_tokens
+
+# Arrays persisted by rag_index (see ChunkStore.arrays / from_arrays)
+STORE_ARRAYS = ['text', 'offsets', 'n_tokens', 'doc_ids', 'doc_paths', 'doc_labels', 'doc_namespaces']
+# Decoded chunk texts kept per store; retrieval keeps returning the same hot chunks
+TEXT_CACHE_SIZE = 4096
+
+class ChunkStore:
+    """
+    Chunk texts of the RAG index, packed for memory.
+
+    Chunk bodies are concatenated into one UTF-8 byte buffer; chunk i is
+    text[offsets[i]:offsets[i + 1]]. Document-level strings (path, citation label, namespace)
+    are stored once per document and chunks point at them through doc_ids, so the
+    "Source: [DocN] (filename)" header is rebuilt on access instead of stored per chunk.
+    A loaded index memory-maps the buffer; a chunk is only decoded when it is read.
+    n_tokens holds the token count of every chunk body (chunker.count_tokens).
+
+    Stores are never modified in place: with_documents / without_rows return a new
+    store, so RetrievalHit views into an older store stay valid after the index changes.
+    """
+    def __init__(self, text=None, offsets=None, n_tokens=None, doc_ids=None, doc_paths=(), doc_labels=(),
+                 doc_namespaces=()):
+        # np.asarray drops the np.memmap subclass (same memory), whose per-item indexing is slow
+        self.text = np.empty(0, dtype=np.uint8) if text is None else np.asarray(text)
+        self.offsets = np.zeros(1, dtype=np.int64) if offsets is None else np.asarray(offsets)
+        self.n_tokens = np.empty(0, dtype=np.int32) if n_tokens is None else np.asarray(n_tokens)
+        self.doc_ids = np.empty(0, dtype=np.int32) if doc_ids is None else np.asarray(doc_ids)
+        self.doc_paths = [str(p) for p in doc_paths]
+        self.doc_labels = [str(s) for s in doc_labels]
+        self.doc_namespaces = [str(n) for n in doc_namespaces]
+        self._headers = [f"Source: {label} ({os.path.basename(path)})\n"
+                         for path, label in zip(self.doc_paths, self.doc_labels)]
+        self._header_tokens = [count_tokens(header) for header in self._headers]
+        self._texts = {}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def body(self, i):
+        return self.text[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+    def __getitem__(self, i):
+        """Full chunk text, header included."""
+        text = self._texts.get(i)
+        if text is None:
+            if len(self._texts) >= TEXT_CACHE_SIZE:
+                self._texts.clear()
+            text = self._texts[i] = self._headers[self.doc_ids[i]] + self.body(i)
+        return text
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def tokens(self, i):
+        """Token count of the full chunk text, header included."""
+        return int(self.n_tokens[i]) + self._header_tokens[self.doc_ids[i]]
+
+    def source(self, i):
+        return self.doc_labels[self.doc_ids[i]]
+
+    def _per_chunk(self, table):
+        return np.asarray(table, dtype=str)[self.doc_ids] if table else np.empty(0, dtype=str)
+
+    @property
+    def sources(self):
+        return self._per_chunk(self.doc_labels)
+
+    @property
+    def paths(self):
+        return self._per_chunk(self.doc_paths)
+
+    @property
+    def namespaces(self):
+        return self._per_chunk(self.doc_namespaces)
+
+    @property
+    def nbytes(self):
+        return self.text.nbytes + self.offsets.nbytes + self.n_tokens.nbytes + self.doc_ids.nbytes
+
+    def with_documents(self, documents):
+        """
+        New store with the chunks of documents appended; documents is a list of
+        (path, citation label, namespace, chunk bodies, chunk token counts).
+        Returns (store, full chunk texts added).
+        """
+        paths, labels, namespaces = list(self.doc_paths), list(self.doc_labels), list(self.doc_namespaces)
+        encoded, n_tokens, doc_ids, texts = [], [], [], []
+        for path, label, namespace, bodies, counts in documents:
+            doc_id = len(paths)
+            paths.append(path)
+            labels.append(label)
+            namespaces.append(namespace)
+            header = f"Source: {label} ({os.path.basename(path)})\n"
+            encoded += [body.encode('utf-8') for body in bodies]
+            n_tokens += counts
+            doc_ids += [doc_id] * len(bodies)
+            texts += [header + body for body in bodies]
+
+        lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+        text = np.concatenate([self.text, np.frombuffer(b''.join(encoded), dtype=np.uint8)])
+        offsets = np.concatenate([self.offsets, self.offsets[-1] + np.cumsum(lengths)])
+        n_tokens = np.concatenate([self.n_tokens, np.asarray(n_tokens, dtype=np.int32)])
+        doc_ids = np.concatenate([self.doc_ids, np.asarray(doc_ids, dtype=np.int32)])
+        return ChunkStore(text, offsets, n_tokens, doc_ids, paths, labels, namespaces), texts
+
+    def rows_of(self, paths):
+        """Chunk rows belonging to any of paths."""
+        paths = set(paths)
+        doc_ids = [i for i, p in enumerate(self.doc_paths) if p in paths]
+        return np.flatnonzero(np.isin(self.doc_ids, doc_ids))
+
+    def without_rows(self, rows):
+        """New store without the given chunk rows; documents left without chunks are dropped."""
+        keep = np.ones(len(self), dtype=bool)
+        keep[rows] = False
+        starts, lengths = self.offsets[:-1][keep], np.diff(self.offsets)[keep]
+        new_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        # Byte positions of the kept chunks, gathered in one pass
+        gather = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+        text = self.text[gather]
+
+        used = np.unique(self.doc_ids[keep])
+        remap = np.full(len(self.doc_paths), -1, dtype=np.int32)
+        remap[used] = np.arange(len(used), dtype=np.int32)
+        pick = lambda table: [table[i] for i in used]
+        return ChunkStore(text, new_offsets, self.n_tokens[keep], remap[self.doc_ids[keep]],
+                          pick(self.doc_paths), pick(self.doc_labels), pick(self.doc_namespaces))
+
+    def arrays(self):
+        return {'text': self.text, 'offsets': self.offsets, 'n_tokens': self.n_tokens, 'doc_ids': self.doc_ids,
+                'doc_paths': np.asarray(self.doc_paths, dtype=str),
+                'doc_labels': np.asarray(self.doc_labels, dtype=str),
+                'doc_namespaces': np.asarray(self.doc_namespaces, dtype=str)}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays['text'], arrays['offsets'], arrays['n_tokens'], arrays['doc_ids'],
+                   arrays['doc_paths'].tolist(), arrays['doc_labels'].tolist(), arrays['doc_namespaces'].tolist())
+
+class RetrievalHit(Mapping):
+    """
+    One retrieval result: a read-only {'chunk', 'source', 'score'} mapping that points into
+    a ChunkStore. The chunk text is only decoded when 'chunk' is read (e.g. by a prompt builder).
+    """
+    __slots__ = ('store', 'index', 'score')
+    KEYS = ('chunk', 'source', 'score')
+
+    def __init__(self, store, index, score):
+        self.store = store
+        self.index = index
+        self.score = score
+
+    @property
+    def n_tokens(self):
+        return self.store.tokens(self.index)
+
+    def __getitem__(self, key):
+        if key == 'chunk':
+            return self.store[self.index]
+        if key == 'source':
+            return self.store.source(self.index)
+        if key == 'score':
+            return self.score
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def __repr__(self):
+        return f"RetrievalHit(source={self['source']!r}, index={self.index}, score={self.score:.4f})"
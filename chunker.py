@@ -0,0 +1,151 @@
+import hashlib
+import re
+from functools import lru_cache
+import numpy as np
+
+# Words and single punctuation marks: a tokenizer-free approximation of LLM token counts
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(text):
+    return len(TOKEN_RE.findall(text))
+
+def iter_paragraphs(path):
+    """Yields the blank-line separated paragraphs of a text file, reading it line by line."""
+    lines = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                lines.append(line.rstrip('\n'))
+            elif lines:
+                yield '\n'.join(lines).strip()
+                lines = []
+    if lines:
+        yield '\n'.join(lines).strip()
+
+@lru_cache(maxsize=1 << 16)
+def _word_hash(word):
+    return int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), 'little')
+
+# Odd 64-bit multipliers that mix word hashes into shingle hashes (arithmetic wraps mod 2**64)
+_SHINGLE_MIX = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9], dtype=np.uint64)
+
+def simhash(text, shingle=3):
+    """64-bit SimHash over word shingles; near-duplicate texts differ in only a few bits."""
+    words = np.array([_word_hash(w) for w in TOKEN_RE.findall(text.lower())] or [0], dtype=np.uint64)
+    n = max(1, len(words) - shingle + 1)
+    hashes = np.zeros(n, dtype=np.uint64)
+    for j in range(min(shingle, len(words))):
+        hashes ^= words[j:j + n] * _SHINGLE_MIX[j]
+    hashes ^= hashes >> np.uint64(29)
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1)
+    # A bit is set when most shingles set it
+    majority = bits.sum(axis=0) * 2 > len(bits)
+    return int.from_bytes(np.packbits(majority).tobytes(), 'big')
+
+class Chunker:
+    """
+    Streaming chunker: packs the paragraphs of a document into chunks of min_tokens..max_tokens.
+
+    Paragraphs stay whole where possible and are packed into a chunk until the next one would
+    overflow max_tokens; a chunk is only closed once it holds min_tokens, so fragments (headings,
+    one-liners) are merged into the following paragraph. A paragraph that does not fit is cut
+    into token windows. Only the last chunk of a document can be shorter than min_tokens.
+    With overlap, every chunk after the first starts with the last overlap tokens of the one
+    before (still within max_tokens).
+    Chunks whose SimHash is within dedupe_distance bits of an earlier chunk of the same document
+    are dropped (dedupe_distance=None keeps them). Dedup is per document on purpose: documents
+    are re-indexed one at a time, and a chunk must not depend on which other files were indexed
+    before it.
+    """
+    def __init__(self, min_tokens=20, max_tokens=256, overlap=0, dedupe_distance=3):
+        if not 0 <= overlap < max_tokens // 2 or min_tokens > max_tokens:
+            raise ValueError("Need min_tokens <= max_tokens and 0 <= overlap < max_tokens / 2")
+        if dedupe_distance is not None and not 0 <= dedupe_distance < 16:
+            raise ValueError("dedupe_distance must be within 0..15 bits")
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.dedupe_distance = dedupe_distance
+        self.duplicates_dropped = 0
+
+    def config(self):
+        return {'min_tokens': self.min_tokens, 'max_tokens': self.max_tokens, 'overlap': self.overlap,
+                'dedupe_distance': self.dedupe_distance}
+
+    def _pack(self, paragraphs):
+        # Room is left for the overlap prefix so overlapped chunks stay within max_tokens
+        capacity = self.max_tokens - self.overlap
+        parts, size = [], 0
+        for paragraph in paragraphs:
+            n = count_tokens(paragraph)
+            if not n:
+                continue
+            if parts and size + n > capacity and size >= self.min_tokens:
+                yield '\n\n'.join(parts), size
+                parts, size = [], 0
+            if size + n <= capacity:
+                parts.append(paragraph)
+                size += n
+                continue
+            # Longer than the room left: cut into token windows, the first one filling the current chunk
+            spans = [m.span() for m in TOKEN_RE.finditer(paragraph)]
+            start = 0
+            while start < len(spans):
+                take = min(capacity - size, len(spans) - start)
+                parts.append(paragraph[spans[start][0]:spans[start + take - 1][1]])
+                size += take
+                start += take
+                if size == capacity:
+                    yield '\n\n'.join(parts), size
+                    parts, size = [], 0
+        if parts:
+            yield '\n\n'.join(parts), size
+
+    def _is_duplicate(self, fingerprint, seen):
+        """
+        Checks fingerprint against the earlier ones and records it. seen maps (band, 64 / bands bits)
+        to fingerprints: with dedupe_distance + 1 bands, fingerprints that close agree on a whole
+        band, so only fingerprints sharing a band value are compared.
+        """
+        bands = self.dedupe_distance + 1
+        width = 64 // bands
+        keys = [(band, fingerprint >> (band * width) & ((1 << width) - 1)) for band in range(bands)]
+        for key in keys:
+            if any((fingerprint ^ other).bit_count() <= self.dedupe_distance for other in seen.get(key, ())):
+                return True
+        for key in keys:
+            seen.setdefault(key, []).append(fingerprint)
+        return False
+
+    def chunks(self, paragraphs):
+        """Yields (chunk text, token count) for an iterable of paragraphs (one document)."""
+        seen = {}
+        previous = None
+        for text, n in self._pack(paragraphs):
+            if self.dedupe_distance is not None and self._is_duplicate(simhash(text), seen):
+                self.duplicates_dropped += 1
+                continue
+            chunk = (text, n)
+            if self.overlap and previous is not None:
+                spans = [m.start() for m in TOKEN_RE.finditer(previous)][-self.overlap:]
+                chunk = (previous[spans[0]:] + '\n' + text, n + len(spans))
+            previous = text
+            yield chunk
+
+    def chunk_file(self, path):
+        return self.chunks(iter_paragraphs(path))
+
+def fit_snippets(snippets, token_budget):
+    """
+    The snippets, best first, that fit in token_budget tokens together; one too long for
+    the budget left is skipped. Uses RetrievalHit.n_tokens when present.
+    """
+    kept, used = [], 0
+    for snippet in snippets:
+        n = getattr(snippet, 'n_tokens', None)
+        if n is None:
+            n = count_tokens(snippet['chunk'])
+        if used + n <= token_budget:
+            kept.append(snippet)
+            used += n
+    return kept
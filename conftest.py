@@ -0,0 +1,48 @@
+import functools
+
+import joblib
+import pandas as pd
+import pytest
+import xgboost as xgb
+
+import train_model
+from feature_transformer import FeatureTransformer
+
+@functools.lru_cache(maxsize=None)
+def _fit_models(bin_coverage=False):
+    """
+    (transformer, [model on encoded features, native-categorical booster as a classifier]),
+    both fitted on data/train_gpt.csv; cached, so every test module shares one fit.
+    """
+    train = pd.read_csv('data/train_gpt.csv')
+    val = pd.read_csv('data/val_gpt.csv')
+    features = [c for c in train.columns if c not in train_model.DROP_COLS]
+    transformer = FeatureTransformer(*train_model.feature_spec(bin_coverage)).fit(train, features)
+    X_train, X_val = transformer.transform(train), transformer.transform(val)
+
+    numeric = xgb.XGBClassifier(n_estimators=200, max_depth=4, early_stopping_rounds=10, eval_metric='logloss')
+    numeric.fit(X_train, train[train_model.TARGET], eval_set=[(X_val, val[train_model.TARGET])], verbose=False)
+
+    dtrain = xgb.DMatrix(transformer.as_categorical(X_train), train[train_model.TARGET], enable_categorical=True)
+    booster = xgb.train({'objective': 'binary:logistic', 'max_depth': 4}, dtrain, num_boost_round=30)
+    categorical = train_model.booster_to_classifier(booster)
+    return transformer, [numeric, categorical]
+
+@pytest.fixture(scope='session')
+def fitted_models():
+    """_fit_models: call with bin_coverage=True for a transformer that bins coverage too."""
+    return _fit_models
+
+@pytest.fixture(scope='session')
+def model_and_transformer():
+    transformer, models = _fit_models()
+    return models[0], transformer
+
+@pytest.fixture(scope='session')
+def model_paths(model_and_transformer, tmp_path_factory):
+    """model_path / transformer_path keyword arguments for the saved model_and_transformer."""
+    model, transformer = model_and_transformer
+    artifacts = tmp_path_factory.mktemp('model')
+    joblib.dump(model, artifacts / 'model.joblib')
+    joblib.dump(transformer, artifacts / 'transformer.joblib')
+    return {'model_path': artifacts / 'model.joblib', 'transformer_path': artifacts / 'transformer.joblib'}
@@ -1,7 +1,10 @@
-from dataclasses import dataclass
+import itertools
+from dataclasses import dataclass, fields
 from typing import List, Optional
+import numpy as np
+import pandas as pd
 
-@dataclass
+@dataclass(slots=True)
 class ConversionContext:
     """
     Context for generating a conversion/retention plan.
@@ -34,3 +37,55 @@ class ConversionContext:
             parts.append(f"{self.channel} communication tips")
             
         return ", ".join(parts)
+
+    @classmethod
+    def query_space(cls, channels, needs, objections) -> List[str]:
+        """Every distinct to_retrieval_query() output for the given field values (cache pre-warming)."""
+        return sorted({
+            cls(policy_id='', age=0, region='', channel=channel, needs=need, objections=objection,
+                premium=0.0).to_retrieval_query()
+            for channel, need, objection in itertools.product(channels, needs, objections)
+        })
+
+@dataclass
+class ConversionContextBatch:
+    """
+    Columnar ConversionContext: one array per field, a row per lead. The query only depends on
+    (objections, needs, channel), so it is formatted once per distinct combination.
+    """
+    policy_id: np.ndarray
+    age: np.ndarray
+    region: np.ndarray
+    channel: np.ndarray
+    needs: np.ndarray
+    objections: np.ndarray
+    premium: np.ndarray
+
+    def __len__(self):
+        return len(self.policy_id)
+
+    def columns(self) -> List[np.ndarray]:
+        return [getattr(self, f.name) for f in fields(self)]
+
+    def __getitem__(self, i) -> ConversionContext:
+        return ConversionContext(*(column[i:i + 1].tolist()[0] for column in self.columns()))
+
+    def contexts(self):
+        """Yields a ConversionContext per row."""
+        for values in zip(*(column.tolist() for column in self.columns())):
+            yield ConversionContext(*values)
+
+    def distinct_queries(self):
+        """(queries, inverse): the distinct to_retrieval_query() outputs and each row's query index."""
+        if not len(self):
+            return [], np.zeros(0, dtype=np.int64)
+        code = np.zeros(len(self), dtype=np.int64)
+        for column in (self.objections, self.needs, self.channel):
+            codes, uniques = pd.factorize(column, use_na_sentinel=False)
+            code = code * len(uniques) + codes
+        _, first, inverse = np.unique(code, return_index=True, return_inverse=True)
+        return [self[i].to_retrieval_query() for i in first], inverse
+
+    def to_retrieval_queries(self) -> List[str]:
+        queries, inverse = self.distinct_queries()
+        return [queries[j] for j in inverse.tolist()]
@@ -1,6 +1,10 @@
-from conversion_contract import ConversionContext
+from chunker import fit_snippets
+from conversion_contract import ConversionContext, ConversionContextBatch
 
 class ConversionPromptBuilder:
+    # Default snippet budget (approximate tokens) for callers that retrieve more than they can fit
+    SNIPPET_TOKEN_BUDGET = 250
+
     SYSTEM_PROMPT = """You are a Sales Conversion Expert for an insurance company.
 Your goal is to create a personalized 3-step conversion plan to close a lead who is at risk of not buying or lapsing.
 
@@ -50,13 +54,15 @@ Generate a JSON object with this structure:
 """
 
     @staticmethod
-    def build_messages(context: ConversionContext, rag_snippets: list[dict]) -> list[dict]:
-        # Format snippets
-        formatted_snippets = []
-        for i, snippet in enumerate(rag_snippets, 1):
-            formatted_snippets.append(f"Snippet {i} (Source: {snippet['source']}):\n{snippet['chunk']}")
-        
-        rag_text = "\n\n".join(formatted_snippets)
+    def _format_snippets(rag_snippets):
+        return "\n\n".join(f"Snippet {i} (Source: {snippet['source']}):\n{snippet['chunk']}"
+                           for i, snippet in enumerate(rag_snippets, 1))
+
+    @staticmethod
+    def build_messages(context: ConversionContext, rag_snippets: list[dict], token_budget: int = None) -> list[dict]:
+        if token_budget is not None:
+            rag_snippets = fit_snippets(rag_snippets, token_budget)
+        rag_text = ConversionPromptBuilder._format_snippets(rag_snippets)
         
         user_content = ConversionPromptBuilder.USER_TEMPLATE.format(
             policy_id=context.policy_id,
@@ -73,3 +79,32 @@ Generate a JSON object with this structure:
             {"role": "system", "content": ConversionPromptBuilder.SYSTEM_PROMPT},
             {"role": "user", "content": user_content}
         ]
+
+    @staticmethod
+    def build_messages_many(batch: ConversionContextBatch, all_rag_snippets: list[list], token_budget: int = None):
+        """
+        build_messages() for every row of a ConversionContextBatch, yielding one messages list per row.
+        Snippet lists shared between rows (as retrieve_many fan-out produces) are fitted and formatted once.
+        """
+        formatted = {}
+        for values, rag_snippets in zip(zip(*(column.tolist() for column in batch.columns())), all_rag_snippets):
+            cached = formatted.get(id(rag_snippets))
+            if cached is None:
+                fitted = rag_snippets if token_budget is None else fit_snippets(rag_snippets, token_budget)
+                # The snippet list is kept alongside so its id() is not reused while cached
+                cached = formatted[id(rag_snippets)] = (rag_snippets, ConversionPromptBuilder._format_snippets(fitted))
+            policy_id, age, region, channel, needs, objections, premium = values
+            user_content = ConversionPromptBuilder.USER_TEMPLATE.format(
+                policy_id=policy_id,
+                age=age,
+                region=region,
+                channel=channel,
+                needs=needs,
+                objections=objections,
+                premium=premium,
+                rag_snippets=cached[1]
+            )
+            yield [
+                {"role": "system", "content": ConversionPromptBuilder.SYSTEM_PROMPT},
+                {"role": "user", "content": user_content}
+            ]
@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import time
+import pandas as pd
+
+from chunk_pool import map_chunks, peak_rss_mb
+from chunker import fit_snippets
+from conversion_prompt import ConversionPromptBuilder
+from export_prompts import DEFAULT_LLM_MODEL, SHARD_SIZE
+from generate_conversion_plan import INFERENCE_SEED, LEADS_NAMESPACE, RETRIEVE_K, build_conversion_batch
+from retrieval_system import MinimalRAG
+
+# Per-process RAG index, loaded once by _init_worker
+_rag = None
+
+def _init_worker(docs_dir, rag=None):
+    global _rag
+    # Workers only load the index export_conversion_prompts built, so they never race to save it
+    _rag = rag or MinimalRAG(docs_dir, read_only=True)
+
+def request_id(policy_id):
+    """custom_id of a lead's conversion prompt."""
+    return f"conversion-{policy_id}"
+
+def _export_chunk(chunk, part_no, output_dir, seed, llm_model):
+    """Infers, retrieves for and writes the prompts of one chunk of leads. Returns (leads, peak RSS MB)."""
+    # One generator per chunk, so the objections do not depend on which worker ran it
+    batch = build_conversion_batch(chunk, rng=[seed, part_no])
+    queries, inverse = batch.distinct_queries()
+    distinct_results = [fit_snippets(results, ConversionPromptBuilder.SNIPPET_TOKEN_BUDGET)
+                        for results in _rag.retrieve_many(queries, k=RETRIEVE_K, namespace=LEADS_NAMESPACE)]
+    all_messages = ConversionPromptBuilder.build_messages_many(batch, [distinct_results[j] for j in inverse.tolist()])
+
+    path = os.path.join(output_dir, f"prompts-{part_no:05d}.jsonl")
+    with open(path, 'w', encoding='utf-8') as f:
+        for policy_id, messages in zip(batch.policy_id.tolist(), all_messages):
+            f.write(json.dumps({
+                'custom_id': request_id(policy_id),
+                'method': 'POST',
+                'url': '/v1/chat/completions',
+                'body': {'model': llm_model, 'messages': messages},
+            }, ensure_ascii=False) + '\n')
+    return len(batch), peak_rss_mb()
+
+def export_conversion_prompts(input_path, output_dir, chunk_size=SHARD_SIZE, n_workers=None, seed=INFERENCE_SEED,
+                              llm_model=DEFAULT_LLM_MODEL, docs_dir='rag_docs'):
+    """
+    Writes a conversion plan prompt for every lead in input_path as OpenAI batch API requests,
+    one prompts-NNNNN.jsonl file per chunk_size leads (at most 50,000 per batch input file).
+
+    The RAG index is built or refreshed once up front. Chunks are then spread over n_workers
+    processes (chunk_pool.map_chunks), each loading the index read-only; at most 2 chunks per
+    worker are in flight, so memory does not grow with the file. Lead contexts are inferred
+    with infer_contexts seeded by (seed, chunk number): the same file, chunk_size and seed give
+    the same prompts whatever the worker count. Use a fresh output_dir per run.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+    reader = pd.read_csv(input_path, chunksize=chunk_size)
+
+    start = time.time()
+    rag = MinimalRAG(docs_dir)
+    if n_workers == 1:
+        _init_worker(docs_dir, rag)
+    leads, worker_rss = 0, 0.0
+    for n, rss in map_chunks(_export_chunk, reader, n_workers, _init_worker, (docs_dir,),
+                             args=(output_dir, seed, llm_model)):
+        leads, worker_rss = leads + n, max(worker_rss, rss)
+
+    elapsed = time.time() - start
+    stats = {
+        'leads': leads,
+        'seconds': elapsed,
+        'leads_per_s': leads / elapsed if elapsed > 0 else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+        'worker_peak_rss_mb': worker_rss,
+    }
+    print(f"Exported conversion prompts for {leads:,} leads in {elapsed:.1f}s ({stats['leads_per_s']:,.0f} leads/s), "
+          f"peak RSS {stats['peak_rss_mb']:.0f} MB (max worker {worker_rss:.0f} MB) -> {output_dir}")
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export conversion plan prompts for a lead file as batch LLM requests.")
+    parser.add_argument('input', help="CSV with policy_id and the lead attributes (age, region, premium, has_agent)")
+    parser.add_argument('output_dir', help="Directory for the prompts-NNNNN.jsonl files")
+    parser.add_argument('--chunk-size', type=int, default=SHARD_SIZE, help="Leads per chunk and per output file")
+    parser.add_argument('--workers', type=int, default=None, help="Defaults to the CPU count")
+    parser.add_argument('--seed', type=int, default=INFERENCE_SEED, help="Seed of the objection sampling")
+    parser.add_argument('--model', default=DEFAULT_LLM_MODEL, help="LLM model named in each request")
+    args = parser.parse_args()
+
+    export_conversion_prompts(args.input, args.output_dir, chunk_size=args.chunk_size, n_workers=args.workers,
+                              seed=args.seed, llm_model=args.model)
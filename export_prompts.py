@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+
+from chunk_pool import peak_rss_mb
+from fast_scorer import LOOKUP_TABLE_PATH, MODEL_PATH, REASON_CODES, TRANSFORMER_PATH, FastScorer
+from generate_strategy import RETENTION_NAMESPACE, RETRIEVE_K, build_context_batch
+from retrieval_system import MinimalRAG
+from strategy_prompt import StrategyPromptBuilder
+
+DEFAULT_LLM_MODEL = 'gpt-4o-mini'
+# Requests per file; the OpenAI batch API accepts up to 50,000 per input file
+SHARD_SIZE = 50_000
+EXPORT_TIERS = ('Critical', 'Watchlist')
+
+def request_id(policy_id, month):
+    """custom_id of a policy's prompt: stable across runs, so batch results join back to the policy."""
+    return f"retention-{policy_id}-{month}"
+
+class ShardedJsonlWriter:
+    """Appends JSON lines to prefix-00000.jsonl, prefix-00001.jsonl, ... with at most shard_size lines each."""
+    def __init__(self, output_dir, prefix='prompts', shard_size=SHARD_SIZE):
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.paths = []
+        self.lines = 0
+        self._file = None
+
+    def write(self, record):
+        if self.lines % self.shard_size == 0:
+            self.close()
+            path = os.path.join(self.output_dir, f"{self.prefix}-{len(self.paths):05d}.jsonl")
+            self._file = open(path, 'w', encoding='utf-8')
+            self.paths.append(path)
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.lines += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def export_prompts(input_path, output_dir, scorer=None, rag=None, tiers=EXPORT_TIERS, chunk_size=100_000,
+                   shard_size=SHARD_SIZE, llm_model=DEFAULT_LLM_MODEL, lookup_table_path=None, reason_codes=0,
+                   approximate_reasons=False):
+    """
+    Writes a retention prompt for every policy in input_path whose risk tier is in tiers,
+    as OpenAI batch API requests (one chat completion per line) in sharded JSONL files.
+
+    The CSV is streamed in chunk_size rows: each chunk is scored, filtered by risk tier, turned
+    into a CustomerContextBatch, retrieved for with one retrieve_many call over its distinct
+    queries and written out before the next is read, so memory stays flat however large the file is.
+    Shards are numbered from 00000 on every run, so use a fresh output_dir per run.
+
+    With reason_codes=N, each prompt lists the policy's top N risk drivers (FastScorer.explain_many,
+    approximate_reasons for per-path attributions); contributions are only computed for the rows
+    that pass the tier filter.
+    """
+    scorer = scorer or FastScorer.load(MODEL_PATH, TRANSFORMER_PATH, lookup_table_path)
+    rag = rag or MinimalRAG()
+    budget = StrategyPromptBuilder.SNIPPET_TOKEN_BUDGET
+
+    start = time.time()
+    policies = 0
+    with ShardedJsonlWriter(output_dir, shard_size=shard_size) as writer:
+        for chunk in pd.read_csv(input_path, chunksize=chunk_size):
+            policies += len(chunk)
+            chunk['p_lapse_3_m'] = scorer.score_many(chunk)
+            chunk = chunk[np.isin(StrategyPromptBuilder.determine_risk_tiers(chunk['p_lapse_3_m'].to_numpy()), tiers)]
+            if reason_codes:
+                _, chunk['reason_codes'] = scorer.explain_many(chunk, reason_codes, approximate_reasons)
+            batch = build_context_batch(chunk)
+            queries, inverse = batch.distinct_queries()
+            distinct_hits = rag.retrieve_many(queries, k=RETRIEVE_K, namespace=RETENTION_NAMESPACE)
+            all_messages = StrategyPromptBuilder.build_messages_many(batch, [distinct_hits[j] for j in inverse.tolist()],
+                                                                     token_budget=budget)
+            for policy_id, month, messages in zip(batch.policy_id.tolist(), batch.month.tolist(), all_messages):
+                writer.write({
+                    'custom_id': request_id(policy_id, month),
+                    'method': 'POST',
+                    'url': '/v1/chat/completions',
+                    'body': {'model': llm_model, 'messages': messages},
+                })
+
+    elapsed = time.time() - start
+    stats = {
+        'policies': policies,
+        'prompts': writer.lines,
+        'shards': writer.paths,
+        'seconds': elapsed,
+        'prompts_per_s': writer.lines / elapsed if elapsed > 0 else 0.0,
+        # ru_maxrss is in KiB on Linux
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    print(f"Exported {writer.lines:,} prompts for {policies:,} policies ({', '.join(tiers)}) in {elapsed:.1f}s "
+          f"({stats['prompts_per_s']:,.0f} prompts/s, peak RSS {stats['peak_rss_mb']:.0f} MB) "
+          f"-> {len(writer.paths)} shard(s) in {output_dir}")
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export retention prompts as batch LLM requests (JSONL).")
+    parser.add_argument('input', help="CSV with policy_id, month and the model features")
+    parser.add_argument('output_dir', help="Directory for the prompts-NNNNN.jsonl shards")
+    parser.add_argument('--tiers', nargs='+', default=list(EXPORT_TIERS), choices=['Critical', 'Watchlist', 'Stable'])
+    parser.add_argument('--chunk-size', type=int, default=100_000)
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE)
+    parser.add_argument('--model', default=DEFAULT_LLM_MODEL, help="LLM model named in each request")
+    parser.add_argument('--lookup-table', action='store_true',
+                        help=f"Score by table lookup from {LOOKUP_TABLE_PATH} instead of evaluating the trees")
+    parser.add_argument('--reason-codes', type=int, nargs='?', const=REASON_CODES, default=0, metavar='N',
+                        help=f"Add each policy's top N risk drivers to its prompt (default N {REASON_CODES})")
+    parser.add_argument('--approximate-reasons', action='store_true',
+                        help="Per-path (Saabas) contributions for the reason codes, ~5x faster than TreeSHAP")
+    args = parser.parse_args()
+
+    export_prompts(args.input, args.output_dir, tiers=tuple(args.tiers), chunk_size=args.chunk_size,
+                   shard_size=args.shard_size, llm_model=args.model,
+                   lookup_table_path=LOOKUP_TABLE_PATH if args.lookup_table else None,
+                   reason_codes=args.reason_codes, approximate_reasons=args.approximate_reasons)
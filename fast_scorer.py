@@ -0,0 +1,255 @@
+import hashlib
+import json
+import math
+import joblib
+import numpy as np
+import xgboost as xgb
+
+from feature_transformer import SMALL_BATCH
+
+# Artifacts written by train_model.py and loaded by every scoring entry point
+MODEL_PATH = 'churn_model_xgb.joblib'
+TRANSFORMER_PATH = 'feature_transformer.joblib'
+LOOKUP_TABLE_PATH = 'churn_model_lut.npz'
+# Reason codes per policy: its features that push the risk up the most
+REASON_CODES = 3
+
+def booster_fingerprint(booster):
+    return hashlib.sha256(booster.save_raw('json')).hexdigest()[:16]
+
+def top_reasons(contribs, features, top_n=REASON_CODES):
+    """
+    Reason codes from a pred_contribs matrix (one column per feature, bias last): per row a tuple
+    of up to top_n (feature, log-odds contribution) pairs, largest first, positive contributions only.
+    """
+    values = np.asarray(contribs)[:, :len(features)]
+    top_n = min(top_n, len(features))
+    idx = np.argpartition(-values, top_n - 1, axis=1)[:, :top_n]
+    top = np.take_along_axis(values, idx, axis=1)
+    order = np.argsort(-top, axis=1, kind='stable')
+    names = np.asarray(features, dtype=object)[np.take_along_axis(idx, order, axis=1)]
+    top = np.round(np.take_along_axis(top, order, axis=1).astype(np.float64), 4)
+    return [tuple((name, v) for name, v in zip(row_names, row_top) if v > 0)
+            for row_names, row_top in zip(names.tolist(), top.tolist())]
+
+class CompiledTrees:
+    """
+    The boosted trees flattened into plain Python lists (one entry per node across all trees),
+    walked without any library call. For one row this is far cheaper than a predict call;
+    large batches go through Booster.inplace_predict instead.
+
+    Split semantics follow XGBoost: numeric nodes go left when value < threshold; categorical
+    nodes go right when the category is in the node's set; missing values take the default branch.
+    """
+    def __init__(self, booster):
+        model = json.loads(booster.save_raw('json'))
+        learner = model['learner']
+        objective = json.loads(booster.save_config())['learner']['objective']['name']
+        if objective != 'binary:logistic':
+            raise ValueError(f"Only binary:logistic boosters can be compiled, got {objective}")
+
+        base_score = float(learner['learner_model_param']['base_score'].strip('[]'))
+        self.base_margin = math.log(base_score / (1 - base_score))
+
+        self.roots, self.left, self.right, self.default = [], [], [], []
+        self.feature, self.threshold, self.value, self.cat_sets = [], [], [], []
+        for tree in learner['gradient_booster']['model']['trees']:
+            offset = len(self.left)
+            self.roots.append(offset)
+            cat_sets = {node: frozenset(tree['categories'][start:start + size])
+                        for node, start, size in zip(tree['categories_nodes'], tree['categories_segments'],
+                                                     tree['categories_sizes'])}
+            for node, (l, r) in enumerate(zip(tree['left_children'], tree['right_children'])):
+                is_leaf = l == -1
+                self.left.append(-1 if is_leaf else l + offset)
+                self.right.append(-1 if is_leaf else r + offset)
+                self.default.append(-1 if is_leaf else (l if tree['default_left'][node] else r) + offset)
+                self.feature.append(tree['split_indices'][node])
+                self.threshold.append(tree['split_conditions'][node])
+                # Leaves keep their weight in split_conditions
+                self.value.append(tree['split_conditions'][node] if is_leaf else 0.0)
+                self.cat_sets.append(cat_sets.get(node) if tree['split_type'][node] == 1 else None)
+
+    def margin(self, x):
+        """Raw margin for one row given as a sequence of floats in feature order."""
+        left, right, default = self.left, self.right, self.default
+        feature, threshold, cat_sets = self.feature, self.threshold, self.cat_sets
+        total = self.base_margin
+        for node in self.roots:
+            while left[node] != -1:
+                v = x[feature[node]]
+                if v != v:
+                    node = default[node]
+                elif cat_sets[node] is not None:
+                    node = right[node] if v in cat_sets[node] else left[node]
+                else:
+                    node = left[node] if v < threshold[node] else right[node]
+            total += self.value[node]
+        return total
+
+    def predict(self, x):
+        return 1.0 / (1.0 + math.exp(-self.margin(x)))
+
+class FastScorer:
+    """
+    Pandas-free scoring: score_one(dict) for a single policy and score_many(columns)
+    for NumPy columns. Output matches prepare_and_score_data within float32 rounding.
+
+    With a LookupTable attached, score_many becomes an index computation plus a gather.
+    explain_many(columns) also returns each policy's reason codes from the booster's pred_contribs.
+    """
+    def __init__(self, model, transformer, lookup_table=None):
+        booster = model.get_booster() if hasattr(model, 'get_booster') else model
+        best_iteration = booster.attributes().get('best_iteration')
+        if best_iteration is not None:
+            # Same trees predict_proba uses; trimming once keeps every call from skipping them
+            booster = booster[: int(best_iteration) + 1]
+        self.booster = booster
+        self.transformer = transformer
+        self.features = transformer.features
+        self.trees = CompiledTrees(booster)
+        # Native categorical boosters saw unknown categories as missing (see FeatureTransformer.as_categorical)
+        self._missing_unknown = [j for j, t in enumerate(booster.feature_types or []) if t == 'c']
+        if lookup_table is not None and lookup_table.fingerprint != booster_fingerprint(booster):
+            raise ValueError("Lookup table was built for a different model, rebuild it")
+        self.lookup_table = lookup_table
+
+    @classmethod
+    def load(cls, model_path=MODEL_PATH, transformer_path=TRANSFORMER_PATH, lookup_table_path=None):
+        lookup_table = LookupTable.load(lookup_table_path) if lookup_table_path else None
+        return cls(joblib.load(model_path), joblib.load(transformer_path), lookup_table)
+
+    def _row(self, record):
+        categories = self.transformer.categories_
+        row = [self.transformer.encode_value(col, record[col]) if col in categories else float(record[col])
+               for col in self.features]
+        for j in self._missing_unknown:
+            if row[j] == self.transformer.unknown_value:
+                row[j] = math.nan
+        return row
+
+    def _with_missing(self, X):
+        if self._missing_unknown:
+            X = X.copy()
+            cat = X[:, self._missing_unknown]
+            cat[cat == self.transformer.unknown_value] = np.nan
+            X[:, self._missing_unknown] = cat
+        return X
+
+    def predict_encoded(self, X):
+        """p_lapse for an already encoded float matrix (transformer codes)."""
+        X = self._with_missing(X)
+        if len(X) <= SMALL_BATCH:
+            return np.array([self.trees.predict(row) for row in X.tolist()])
+        return self.booster.inplace_predict(X, validate_features=False)
+
+    def score_one(self, record):
+        """p_lapse for one policy given as a dict of raw field values."""
+        return self.trees.predict(self._row(record))
+
+    def score_many(self, columns):
+        """
+        p_lapse for a batch given as a mapping of raw column -> 1-D array (dict of arrays or DataFrame).
+        Small batches walk the compiled trees; larger ones use Booster.inplace_predict,
+        or the lookup table when one is attached.
+        """
+        X = self.transformer.transform_arrays(columns)
+        if self.lookup_table is not None and len(X) > SMALL_BATCH:
+            return self.lookup_table.lookup(X, fallback=self.predict_encoded)
+        return self.predict_encoded(X)
+
+    def contributions_encoded(self, X, approximate=False):
+        """
+        Booster.predict(pred_contribs=True) for an encoded matrix: (n, n_features + 1) log-odds
+        contributions, bias last, summing to the margin. approximate uses per-path (Saabas)
+        attributions, roughly 20x faster than exact TreeSHAP.
+        """
+        dmatrix = xgb.DMatrix(self._with_missing(X), feature_types=self.booster.feature_types,
+                              enable_categorical=True)
+        contribs = self.booster.predict(dmatrix, pred_contribs=True, approx_contribs=approximate,
+                                        validate_features=False)
+        # An empty matrix comes back flat
+        return contribs.reshape(len(X), len(self.features) + 1)
+
+    def explain_many(self, columns, top_n=REASON_CODES, approximate=False):
+        """
+        (p_lapse, reason codes) for a batch from one pred_contribs call: p_lapse is the sigmoid of each
+        row's summed contributions (score_many within float32 rounding) and the reason codes are
+        top_reasons() of the same contributions.
+        """
+        contribs = self.contributions_encoded(self.transformer.transform_arrays(columns), approximate)
+        p_lapse = 1.0 / (1.0 + np.exp(-contribs.sum(axis=1, dtype=np.float64)))
+        return p_lapse, top_reasons(contribs, self.features, top_n)
+
+class LookupTable:
+    """
+    p_lapse precomputed for every cell of a fully discretized feature space, stored as a
+    dense float32 array with one axis per model feature.
+
+    Categorical axes cover the transformer codes including the unknown code; the remaining
+    features need an explicit finite domain (e.g. has_agent {0, 1}, dependents 0..5).
+    Rows outside the domain fall back to the model.
+    """
+    def __init__(self, features, domains, table, fingerprint):
+        self.features = list(features)
+        self.domains = [np.asarray(d, dtype=np.float64) for d in domains]
+        self.table = np.asarray(table, dtype=np.float32).ravel()
+        self.fingerprint = fingerprint
+        sizes = [len(d) for d in self.domains]
+        self.strides = np.array([int(np.prod(sizes[j + 1:])) for j in range(len(sizes))], dtype=np.int64)
+        self._contiguous = [np.array_equal(d, np.arange(d[0], d[0] + len(d))) for d in self.domains]
+
+    @classmethod
+    def build(cls, scorer, discrete_domains):
+        """Enumerates every cell and scores them all with one model call."""
+        transformer = scorer.transformer
+        domains = []
+        for col in transformer.features:
+            if col in transformer.categories_:
+                domains.append(np.arange(transformer.unknown_value, transformer.n_categories(col)))
+            elif col in discrete_domains:
+                domains.append(np.unique(np.asarray(discrete_domains[col], dtype=np.float64)))
+            else:
+                raise ValueError(f"Feature '{col}' is continuous; bin it or pass its values in discrete_domains")
+
+        grid = np.stack(np.meshgrid(*domains, indexing='ij'), axis=-1).reshape(-1, len(domains))
+        table = scorer.predict_encoded(grid)
+        return cls(transformer.features, domains, table, booster_fingerprint(scorer.booster))
+
+    def discrete_domains(self, transformer):
+        """The non-categorical domains, to rebuild the table for a refreshed model."""
+        return {col: d for col, d in zip(self.features, self.domains) if col not in transformer.categories_}
+
+    def lookup(self, X, fallback):
+        """X: encoded float matrix. fallback(X_rows) scores rows outside the table's domain."""
+        index = np.zeros(len(X), dtype=np.int64)
+        inside = np.ones(len(X), dtype=bool)
+        for j, domain in enumerate(self.domains):
+            if self._contiguous[j]:
+                # Codes and counts: the position is just an offset from the first value
+                offset = X[:, j] - domain[0]
+                valid = (offset >= 0) & (offset < len(domain))
+                pos = np.where(valid, offset, 0).astype(np.int64)
+                valid &= pos == offset
+            else:
+                pos = np.searchsorted(domain, X[:, j])
+                pos[pos == len(domain)] = 0
+                valid = domain[pos] == X[:, j]
+            inside &= valid
+            index += pos * self.strides[j]
+
+        probs = self.table[index].astype(np.float64)
+        if not inside.all():
+            probs[~inside] = fallback(X[~inside])
+        return probs
+
+    def save(self, path=LOOKUP_TABLE_PATH):
+        np.savez(path, table=self.table, features=np.array(self.features), fingerprint=self.fingerprint,
+                 **{f'domain_{j}': d for j, d in enumerate(self.domains)})
+
+    @classmethod
+    def load(cls, path=LOOKUP_TABLE_PATH):
+        with np.load(path) as npz:
+            features = [str(f) for f in npz['features']]
+            domains = [npz[f'domain_{j}'] for j in range(len(features))]
+            return cls(features, domains, npz['table'], str(npz['fingerprint']))
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+import joblib
+import numpy as np
+import pandas as pd
+
+DEFAULT_CACHE_DIR = '.feature_cache'
+
+def file_digest(path, block_size=1 << 20):
+    """Streams a file through SHA-256 without loading it into memory."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def cache_key(paths, config):
+    """
+    Content address of a feature build: the bytes of every input file plus the
+    binning/encoder configuration. Any change to either yields a new key.
+    """
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(os.path.basename(path).encode('utf-8'))
+        h.update(file_digest(path).encode('utf-8'))
+    h.update(json.dumps(config, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()[:24]
+
+def _column_to_array(series):
+    values = series.to_numpy()
+    if values.dtype == object or not np.issubdtype(values.dtype, np.number):
+        # Fixed-width unicode keeps string columns memory-mappable
+        values = np.asarray(series.astype(str).to_numpy(), dtype=str)
+    return values
+
+def save_entry(entry_dir, frames, objects):
+    """
+    Writes each frame column to its own .npy file (columnar layout) and pickles
+    the small fitted objects. The entry is built in a temp dir of its own and renamed into
+    place. Returns False when another process published the entry first (entries are
+    content-addressed, so theirs holds the same data).
+    """
+    tmp_dir = f"{entry_dir}.tmp{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(tmp_dir)
+
+    manifest = {'frames': {}}
+    for name, frame in frames.items():
+        files = []
+        for i, col in enumerate(frame.columns):
+            file_name = f"{name}.{i}.npy"
+            np.save(os.path.join(tmp_dir, file_name), _column_to_array(frame[col]))
+            files.append(file_name)
+        manifest['frames'][name] = {'columns': list(frame.columns), 'files': files}
+
+    joblib.dump(objects, os.path.join(tmp_dir, 'objects.joblib'))
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    try:
+        os.replace(tmp_dir, entry_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.exists(os.path.join(entry_dir, 'manifest.json')):
+            raise
+        return False
+    return True
+
+def load_entry(entry_dir):
+    """Memory-maps the cached columns back into DataFrames."""
+    with open(os.path.join(entry_dir, 'manifest.json'), 'r') as f:
+        manifest = json.load(f)
+
+    frames = {}
+    for name, meta in manifest['frames'].items():
+        columns = {col: np.load(os.path.join(entry_dir, file_name), mmap_mode='r')
+                   for col, file_name in zip(meta['columns'], meta['files'])}
+        frames[name] = pd.DataFrame(columns, copy=False)
+
+    objects = joblib.load(os.path.join(entry_dir, 'objects.joblib'))
+    return frames, objects
+
+def cached_build(paths, config, build, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Returns (frames, objects) for the given inputs, calling build() only on a cache miss.
+    build must return the same (frames, objects) pair that load_entry gives back.
+    """
+    key = cache_key(paths, config)
+    entry_dir = os.path.join(cache_dir, key)
+
+    if os.path.exists(os.path.join(entry_dir, 'manifest.json')):
+        print(f"Feature cache hit ({key}), skipping CSV parsing and binning")
+        return load_entry(entry_dir)
+
+    print(f"Feature cache miss ({key}), building features...")
+    frames, objects = build()
+    os.makedirs(cache_dir, exist_ok=True)
+    if not save_entry(entry_dir, frames, objects):
+        print(f"Feature cache entry {key} was saved by another process, using it")
+        return load_entry(entry_dir)
+    return frames, objects
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+# Below this many rows a dict lookup beats building the pandas hash engine call
+SMALL_BATCH = 32
+
+class FeatureTransformer:
+    """
+    Bins and encodes the raw model inputs with NumPy lookups.
+
+    Fitted once during training and saved as feature_transformer.joblib, so training
+    and scoring share the same binning and category codes. Codes follow the
+    OrdinalEncoder convention the model was built on: categories are the labels
+    seen in training, sorted, and anything else (out-of-range, missing, unseen
+    region) maps to unknown_value.
+    """
+    def __init__(self, bin_specs, cat_cols, unknown_value=-1):
+        self.bin_specs = bin_specs
+        self.cat_cols = list(cat_cols)
+        self.unknown_value = unknown_value
+        self.features = None
+        self.categories_ = {}   # col -> sorted labels seen in training
+        self._edges = {}        # binned col -> bin edges
+        self._bin_codes = {}    # binned col -> code of each bin (unknown_value if unseen)
+        self._lookup = {}       # plain categorical col -> pd.Index over its categories
+        self._code_of = {}      # same table as a dict, cheaper for a handful of rows
+
+    def config(self):
+        """Plain-data description of the transform (used in cache keys)."""
+        return {
+            'bin_specs': self.bin_specs,
+            'cat_cols': self.cat_cols,
+            'unknown_value': self.unknown_value,
+        }
+
+    def _bin_index(self, col, values):
+        # Right-closed intervals like pd.cut: (e[i], e[i+1]] -> i, everything else -> -1
+        edges = self._edges[col]
+        idx = np.searchsorted(edges, values, side='left') - 1
+        idx[(idx < 0) | (idx >= len(edges) - 1)] = -1
+        return idx
+
+    def fit(self, df, features):
+        self.features = list(features)
+        for col in self.cat_cols:
+            values = np.asarray(df[col])
+            if col in self.bin_specs:
+                spec = self.bin_specs[col]
+                self._edges[col] = np.asarray(spec['bins'], dtype=np.float64)
+                seen = np.unique(self._bin_index(col, values.astype(np.float64)))
+                labels = np.asarray(spec['labels'])
+                self.categories_[col] = np.sort(labels[seen[seen >= 0]])
+                code_of_label = {label: code for code, label in enumerate(self.categories_[col])}
+                self._bin_codes[col] = np.array(
+                    [code_of_label.get(label, self.unknown_value) for label in labels] + [self.unknown_value],
+                    dtype=np.float64)
+            else:
+                self.categories_[col] = np.unique(values.astype(str))
+                self._lookup[col] = pd.Index(self.categories_[col])
+                self._code_of[col] = {v: float(code) for code, v in enumerate(self.categories_[col])}
+        return self
+
+    def n_categories(self, col):
+        return len(self.categories_[col])
+
+    def encode_column(self, col, values):
+        """Category codes (float64) for one raw column."""
+        if col in self.bin_specs:
+            # Index -1 picks the trailing unknown_value slot of the lookup table
+            return self._bin_codes[col][self._bin_index(col, np.asarray(values, dtype=np.float64))]
+        # Hash lookup against the precomputed category table, -1 for unseen values
+        if len(values) <= SMALL_BATCH:
+            code_of = self._code_of[col]
+            return np.array([code_of.get(v, self.unknown_value) for v in values], dtype=np.float64)
+        codes = self._lookup[col].get_indexer(values).astype(np.float64)
+        codes[codes < 0] = self.unknown_value
+        return codes
+
+    def encode_value(self, col, value):
+        """Scalar variant of encode_column for single records."""
+        if col in self.bin_specs:
+            idx = int(np.searchsorted(self._edges[col], float(value), side='left')) - 1
+            if idx >= len(self._edges[col]) - 1:
+                idx = -1
+            return float(self._bin_codes[col][idx])
+        return self._code_of[col].get(value, float(self.unknown_value))
+
+    def transform_arrays(self, columns):
+        """
+        columns: mapping of raw column name -> 1-D array (dict of arrays or DataFrame).
+        Returns a float64 matrix with one column per model feature.
+        """
+        first = np.asarray(columns[self.features[0]])
+        X = np.empty((len(first), len(self.features)), dtype=np.float64)
+        for j, col in enumerate(self.features):
+            if col in self.categories_:
+                X[:, j] = self.encode_column(col, columns[col])
+            else:
+                X[:, j] = np.asarray(columns[col], dtype=np.float64)
+        return X
+
+    def transform(self, df):
+        """DataFrame variant: model feature columns with the categorical ones encoded, other dtypes kept."""
+        X = df[self.features].copy()
+        for col in self.cat_cols:
+            X[col] = self.encode_column(col, df[col].to_numpy())
+        return X
+
+    def as_categorical(self, X):
+        """
+        Casts the encoded columns to pandas categoricals whose codes are the transformer codes,
+        for models trained with XGBoost's native categorical support. Unknowns become missing.
+        """
+        X = X.copy()
+        for col in self.cat_cols:
+            X[col] = pd.Categorical(X[col].astype(int), categories=range(self.n_categories(col)))
+        return X
@@ -1,45 +1,105 @@
 import pandas as pd
+import numpy as np
 import json
 import os
-import random
 
 # Import our components
+from chunker import fit_snippets
+from llm_client import response_text
 from retrieval_system import MinimalRAG
-from conversion_contract import ConversionContext
+from conversion_contract import ConversionContext, ConversionContextBatch
 from conversion_prompt import ConversionPromptBuilder
 
-def infer_context(row):
+# Conversion guides live in rag_docs/leads
+LEADS_NAMESPACE = 'leads'
+# Candidates retrieved per lead; the prompt keeps as many as fit its snippet budget
+RETRIEVE_K = 6
+
+# Everything infer_contexts can produce, so the retrieval query space can be enumerated
+CHANNELS = ['Phone', 'Email']
+NEEDS = ['Budget Friendly Coverage', 'Family Protection', 'Retirement Security']
+OBJECTIONS = ['Competitor Offer', 'Not Interested', 'Trust Issues']
+PRICE_OBJECTIONS = ['Price too high', 'Value for money']
+# NEEDS by age: under 30, 30-49, 50 and over
+NEED_AGE_EDGES = [30, 50]
+# Objections are sampled, so fix the seed for reproducible contexts and prompts
+INFERENCE_SEED = 0
+
+def conversion_query_space():
+    """All retrieval queries the inferred conversion contexts can generate (for MinimalRAG.warm_cache)."""
+    return ConversionContext.query_space(CHANNELS, NEEDS, PRICE_OBJECTIONS + OBJECTIONS)
+
+def infer_contexts(leads_df, rng=INFERENCE_SEED):
     """
-    Simulates missing fields (Channel, Needs, Objections) based on available data.
+    Simulates missing fields (Channel, Needs, Objections) for every lead based on available data.
+    rng is a numpy Generator or a seed; the same seed gives the same objections.
     """
-    age = int(row.get('age', 35))
-    has_agent = int(row.get('has_agent', 0))
-    premium = float(row.get('premium', 0))
+    rng = np.random.default_rng(rng)
+    n = len(leads_df)
+    column = lambda name, default: (leads_df[name].to_numpy(np.float64) if name in leads_df
+                                    else np.full(n, default, dtype=np.float64))
+    age = column('age', 35).astype(np.int64)
+    has_agent = column('has_agent', 0).astype(np.int64)
+    premium = column('premium', 0)
+    
+    # 1. Infer Channel: agents call, direct business usually email
+    channel = np.where(has_agent != 0, 'Phone', 'Email').astype(object)
     
-    # 1. Infer Channel
-    if has_agent:
-        channel = 'Phone' # Agents call
-    else:
-        channel = 'Email' # Direct business usually email
-        
     # 2. Infer Needs based on Age
-    if age < 30:
-        needs = "Budget Friendly Coverage"
-    elif age < 50:
-        needs = "Family Protection"
-    else:
-        needs = "Retirement Security"
-        
-    # 3. Infer Objection based on Premium and Randomness
-    objection_pool = ['Competitor Offer', 'Not Interested', 'Trust Issues']
-    if premium > 150:
-        objection_pool = ['Price too high', 'Value for money'] + objection_pool
-        
-    objection = random.choice(objection_pool)
+    needs = np.array(NEEDS, dtype=object)[np.searchsorted(NEED_AGE_EDGES, age, side='right')]
+    
+    # 3. Infer Objection: uniform over the pool, which includes the price objections above $150
+    pool = np.array(PRICE_OBJECTIONS + OBJECTIONS, dtype=object)
+    pricey = premium > 150
+    draw = rng.integers(0, np.where(pricey, len(pool), len(OBJECTIONS)))
+    objections = pool[np.where(pricey, draw, draw + len(PRICE_OBJECTIONS))]
     
-    return channel, needs, objection
+    return channel, needs, objections
 
-def main():
+def build_conversion_batch(leads_df, rng=INFERENCE_SEED):
+    """A ConversionContextBatch for every lead row, with channel, needs and objection inferred."""
+    channel, needs, objections = infer_contexts(leads_df, rng)
+    n = len(leads_df)
+    return ConversionContextBatch(
+        policy_id=leads_df['policy_id'].to_numpy(object),
+        age=leads_df['age'].to_numpy(np.int64) if 'age' in leads_df else np.full(n, 30, dtype=np.int64),
+        region=leads_df['region'].to_numpy(object) if 'region' in leads_df else np.full(n, 'Unknown', dtype=object),
+        channel=channel,
+        needs=needs,
+        objections=objections,
+        premium=leads_df['premium'].to_numpy(np.float64) if 'premium' in leads_df else np.zeros(n),
+    )
+
+def mock_conversion_plan(context, results):
+    """Static stand-in for the LLM answer when no LLM client is configured."""
+    objection, needs = context.objections, context.needs
+    return {
+        "conversion_strategy_name": f"Overcoming {objection} for {needs}",
+        "steps": [
+            {
+                "step": 1,
+                "action": f"Acknowledge {objection}",
+                "script_or_content": f"I hear you on {objection}. Many of our clients in {context.region} felt the same initially.",
+                "rationale": "Empathy builds trust (Sales 101)."
+            },
+            {
+                "step": 2,
+                "action": f"Pivot to {needs}",
+                "script_or_content": f"However, considering your age ({context.age}), {needs} is critical...",
+                "rationale": f"Aligns with their life stage."
+            },
+            {
+                "step": 3,
+                "action": "Close with Value",
+                "script_or_content": "Let's review the benefits.",
+                "rationale": "Reinforce value proposition."
+            }
+        ],
+        "citations": [r['chunk'] for r in results]
+    }
+
+def main(rag=None, llm=None):
+    """With an llm_client.LLMClient, the prompts are sent concurrently; otherwise a mock plan is printed."""
     # Use the requested file
     leads_file = 'data/three_lead_profiles_small.csv'
     
@@ -47,8 +107,9 @@ def main():
         print(f"Error: {leads_file} not found.")
         return
 
-    print("Initializing RAG System (Leads Knowledge Base)...")
-    rag = MinimalRAG(docs_dir='rag_docs/leads')
+    if rag is None:
+        print("Initializing RAG System...")
+        rag = MinimalRAG()
     
     print(f"Loading leads from {leads_file}...")
     df = pd.read_csv(leads_file)
@@ -57,64 +118,33 @@ def main():
     print("GENERATING CONVERSION PLANS")
     print("="*80)
     
-    for _, row in df.iterrows():
-        policy_id = row['policy_id']
-        age = int(row.get('age', 30))
-        region = row.get('region', 'Unknown')
-        premium = float(row.get('premium', 0.0))
-        
-        # Infer the missing context
-        channel, needs, objection = infer_context(row)
-        
-        context = ConversionContext(
-            policy_id=policy_id,
-            age=age,
-            region=region,
-            channel=channel,
-            needs=needs,
-            objections=objection,
-            premium=premium
-        )
-        
-        print(f"\nProcessing {policy_id} ({age}yo, {region})")
-        print(f"  Context -> Channel: {channel} | Need: {needs} | Obj: {objection}")
-        
-        # Retrieve
-        query = context.to_retrieval_query()
-        print(f"  Query: \"{query}\"")
-        results = rag.retrieve(query, k=2)
-        
-        # Build Prompt
-        messages = ConversionPromptBuilder.build_messages(context, results)
-        
-        # Mock LLM Response (Static for demo, but dynamic fields)
-        mock_plan = {
-            "conversion_strategy_name": f"Overcoming {objection} for {needs}",
-            "steps": [
-                {
-                    "step": 1,
-                    "action": f"Acknowledge {objection}",
-                    "script_or_content": f"I hear you on {objection}. Many of our clients in {region} felt the same initially.",
-                    "rationale": "Empathy builds trust (Sales 101)."
-                },
-                {
-                    "step": 2,
-                    "action": f"Pivot to {needs}",
-                    "script_or_content": f"However, considering your age ({age}), {needs} is critical...",
-                    "rationale": f"Aligns with their life stage."
-                },
-                {
-                    "step": 3,
-                    "action": "Close with Value",
-                    "script_or_content": "Let's review the benefits.",
-                    "rationale": "Reinforce value proposition."
-                }
-            ],
-            "citations": [r['chunk'] for r in results]
-        }
-        
-        print("--- Generated 3-Step Plan ---")
-        print(json.dumps(mock_plan, indent=2))
+    # Infer the missing context for all leads
+    batch = build_conversion_batch(df)
+    
+    # Retrieve once per distinct query, then fan the snippets out to the leads
+    queries, inverse = batch.distinct_queries()
+    distinct_results = [fit_snippets(results, ConversionPromptBuilder.SNIPPET_TOKEN_BUDGET)
+                        for results in rag.retrieve_many(queries, k=RETRIEVE_K, namespace=LEADS_NAMESPACE)]
+    
+    # Build Prompts
+    all_messages = ConversionPromptBuilder.build_messages_many(batch, [distinct_results[j] for j in inverse.tolist()])
+    
+    prepared = []
+    for context, messages, query_id in zip(batch.contexts(), all_messages, inverse.tolist()):
+        print(f"\nProcessing {context.policy_id} ({context.age}yo, {context.region})")
+        print(f"  Context -> Channel: {context.channel} | Need: {context.needs} | Obj: {context.objections}")
+        print(f"  Query: \"{queries[query_id]}\"")
+        prepared.append((context, messages, distinct_results[query_id]))
+    
+    # Generate (one concurrent batch through the LLM client, or the mock)
+    if llm is None:
+        plans = [json.dumps(mock_conversion_plan(context, results), indent=2) for context, _, results in prepared]
+    else:
+        print(f"\nLLM Generation ({llm.model}, {len(prepared)} prompts)...")
+        plans = [response_text(r) for r in llm.complete_all([messages for _, messages, _ in prepared])]
+    for (context, _, _), plan in zip(prepared, plans):
+        print(f"\n--- Generated 3-Step Plan ({context.policy_id}) ---")
+        print(plan)
         print("-" * 40)
 
 if __name__ == "__main__":
@@ -1,28 +1,60 @@
+import argparse
 import pandas as pd
 import joblib
 import json
+import numpy as np
 import os
-import random
-from sklearn.preprocessing import OrdinalEncoder
+import time
 
 # Import our components
+from chunker import fit_snippets
+from fast_scorer import MODEL_PATH, TRANSFORMER_PATH, FastScorer
+from llm_client import response_text
+from outreach_queue import OutreachSelector
 from retrieval_system import MinimalRAG
-from strategy_contract import CustomerContext
+from strategy_cohorts import fill_placeholders, group_cohorts
+from strategy_contract import CustomerContext, CustomerContextBatch
 from strategy_prompt import StrategyPromptBuilder
 
-def load_system():
+# Retention playbooks live in rag_docs/lapse
+RETENTION_NAMESPACE = 'lapse'
+# Candidates retrieved per customer; the prompt keeps as many as fit its snippet budget
+RETRIEVE_K = 8
+# Policies run through the per-policy path to estimate its cost next to cohort mode
+TIMING_SAMPLE = 1000
+# One demo policy per tier band, highest risk first
+DEMO_TIERS = ('Critical', 'Watchlist', 'Stable')
+# primary_driver of the mock strategy for each model feature when it is a policy's top reason code
+DRIVER_LABELS = {
+    'age': 'Life Stage',
+    'tenure_m': 'Early Tenure',
+    'premium': 'Price Sensitivity',
+    'coverage': 'Coverage Fit',
+    'region': 'Regional Competition',
+    'has_agent': 'No Advisor Relationship',
+    'is_smoker': 'Rating Surcharge',
+    'dependents': 'Household Needs',
+}
+
+def load_system(rag=None):
     print("Loading XGBoost Model...")
-    model = joblib.load('churn_model_xgb.joblib')
+    model = joblib.load(MODEL_PATH)
     
-    print("Loading Feature Encoder...")
-    encoder = joblib.load('feature_encoder.joblib')
+    print("Loading Feature Transformer...")
+    transformer = joblib.load(TRANSFORMER_PATH)
     
-    print("Initializing RAG System...")
-    rag = MinimalRAG()
+    if rag is None:
+        print("Initializing RAG System...")
+        rag = MinimalRAG()
     
-    return model, encoder, rag
+    return model, transformer, rag
 
-def prepare_and_score_data(file_path, model, encoder):
+def prepare_and_score_data(file_path, model, transformer, reason_codes=False):
+    """
+    Scores file_path into p_lapse_3_m with model.predict_proba. With reason_codes, one batched
+    FastScorer.explain_many call scores it instead and also fills reason_codes with each policy's
+    top risk drivers.
+    """
     if not os.path.exists(file_path):
         print(f"Warning: {file_path} not found.")
         return pd.DataFrame()
@@ -30,40 +62,22 @@ def prepare_and_score_data(file_path, model, encoder):
     print(f"Loading and scoring data from {file_path}...")
     df = pd.read_csv(file_path)
     
-    # Features from train_model.py
-    feature_cols = ['age', 'tenure_m', 'premium', 'coverage', 'region', 'has_agent', 'is_smoker', 'dependents']
-    
     # Check if all required columns exist
-    missing = [c for c in feature_cols if c not in df.columns]
+    missing = [c for c in transformer.features if c not in df.columns]
     if missing:
         print(f"Error: Missing columns {missing} in {file_path}")
         return pd.DataFrame()
     
-    # Create feature matrix X
-    X = df[feature_cols].copy()
-    
-    # Bin features (same as training)
-    # Age binning
-    X['age'] = pd.cut(X['age'], 
-                     bins=[0, 30, 45, 60, 150], 
-                     labels=['18-30', '31-45', '46-60', '61+'],
-                     right=True)
-    
-    # Premium binning
-    X['premium'] = pd.cut(X['premium'], 
-                         bins=[0, 100, 150, 200, 300, 10000], 
-                         labels=['<100', '100-150', '150-200', '200-300', '300+'],
-                         right=True)
-    
-    # Tenure binning
-    X['tenure_m'] = pd.cut(X['tenure_m'], 
-                          bins=[-1, 6, 12, 24, 48, 10000], 
-                          labels=['0-6m', '6-12m', '12-24m', '24-48m', '48m+'],
-                          right=True)
-    
-    # Apply Encoding for all categorical features
-    X[['region', 'age', 'premium', 'tenure_m']] = encoder.transform(X[['region', 'age', 'premium', 'tenure_m']])
-
+    if reason_codes:
+        df['p_lapse_3_m'], df['reason_codes'] = FastScorer(model, transformer).explain_many(df)
+        return df
+    
+    # Bin + encode with the transformer fitted during training
+    X = transformer.transform(df)
+    
+    # Models trained with native categorical support expect the encoded columns as categoricals
+    if 'c' in (model.get_booster().feature_types or []):
+        X = transformer.as_categorical(X)
         
     # Predict
     probs = model.predict_proba(X)[:, 1]
@@ -72,12 +86,9 @@ def prepare_and_score_data(file_path, model, encoder):
     df['p_lapse_3_m'] = probs
     return df
 
-def run_strategy_pipeline(policy_row, rag):
+def build_customer_context(policy_row):
+    """Maps a scored policy row (Series or dict with p_lapse_3_m) to a CustomerContext."""
     policy_id = policy_row.get('policy_id', 'Unknown')
-    print(f"\n{'='*60}")
-    print(f"Processing Policy: {policy_id}")
-    print(f"{'='*60}")
-    
     p_lapse = policy_row['p_lapse_3_m']
     
     # Defaulting optional fields if they don't exist in the CSV (like leads file)
@@ -85,6 +96,7 @@ def run_strategy_pipeline(policy_row, rag):
     if 'payment_status' not in policy_row:
         # Simple heuristic for demo: if high risk, maybe late?
         payment_status = 'Late' if p_lapse > 0.6 else 'Paid'
+    reason_codes = policy_row.get('reason_codes', ())
         
     context = CustomerContext(
         policy_id=policy_id,
@@ -95,17 +107,61 @@ def run_strategy_pipeline(policy_row, rag):
         customer_calls=int(policy_row.get('call_count', 0)),
         claim_count=int(policy_row.get('claim_count', 0)),
         p_lapse=p_lapse,
-        risk_tier=StrategyPromptBuilder.determine_risk_tier(p_lapse)
+        risk_tier=StrategyPromptBuilder.determine_risk_tier(p_lapse),
+        reason_codes=tuple(reason_codes) if isinstance(reason_codes, (tuple, list)) else ()
+    )
+    return context
+
+def build_context_batch(scored_df):
+    """build_customer_context() for every row of a scored DataFrame, as one CustomerContextBatch."""
+    n = len(scored_df)
+    column = lambda name, default, dtype: (scored_df[name].to_numpy(dtype) if name in scored_df
+                                           else np.full(n, default, dtype=dtype))
+    p_lapse = scored_df['p_lapse_3_m'].to_numpy(np.float64)
+    if 'payment_status' in scored_df:
+        payment_status = scored_df['payment_status'].astype(str).to_numpy(object)
+    else:
+        payment_status = np.where(p_lapse > 0.6, 'Late', 'Paid').astype(object)
+    if 'reason_codes' in scored_df:
+        reason_codes = scored_df['reason_codes'].to_numpy(object)
+    else:
+        reason_codes = np.empty(n, dtype=object)
+        reason_codes.fill(())
+    return CustomerContextBatch(
+        policy_id=column('policy_id', 'Unknown', object),
+        month=scored_df['month'].astype(str).to_numpy(object) if 'month' in scored_df else np.full(n, '2023-12', object),
+        policy_age=column('age', 12, np.int64),
+        premium_amount=column('premium', 100.0, np.float64),
+        payment_status=payment_status,
+        customer_calls=column('call_count', 0, np.int64),
+        claim_count=column('claim_count', 0, np.int64),
+        p_lapse=p_lapse,
+        risk_tier=StrategyPromptBuilder.determine_risk_tiers(p_lapse).astype(object),
+        reason_codes=reason_codes,
     )
+
+def run_strategy_pipeline(policy_row, rag):
+    """Prints the context and retrieval for one policy; returns (context, prompt messages)."""
+    policy_id = policy_row.get('policy_id', 'Unknown')
+    print(f"\n{'='*60}")
+    print(f"Processing Policy: {policy_id}")
+    print(f"{'='*60}")
+    
+    p_lapse = policy_row['p_lapse_3_m']
+    context = build_customer_context(policy_row)
     
     print(f"Risk Profile: {context.risk_tier} (Prob: {p_lapse:.4f})")
+    if context.reason_codes:
+        print(f"Top Risk Drivers: {StrategyPromptBuilder.format_reason_codes(context.reason_codes)}")
     
     # 2. Generate Retrieval Query
     query = context.to_retrieval_query()
     print(f"Generated Query: \"{query}\"")
     
     # 3. Retrieve Config
-    results = rag.retrieve(query, k=3)
+    # Over-retrieve, then keep what fits the prompt's snippet budget
+    results = rag.retrieve(query, k=RETRIEVE_K, namespace=RETENTION_NAMESPACE)
+    results = fit_snippets(results, StrategyPromptBuilder.SNIPPET_TOKEN_BUDGET)
     print(f"Retrieved {len(results)} snippets.")
     for r in results:
         print(f"  - [{r['score']:.2f}] {r['source']}")
@@ -116,12 +172,21 @@ def run_strategy_pipeline(policy_row, rag):
     print("\n--- LLM Prompt (User Message Snippet) ---")
     print(messages[1]['content'][:500] + "...")
     print("-----------------------------------------")
-    
-    # 5. Mock LLM Response
-    print("\n[MOCK] LLM Generation:")
-    mock_response = {
+    return context, messages
+
+def mock_strategy_response(context, premium=None):
+    """
+    Static stand-in for the LLM answer when no LLM client is configured.
+    premium overrides the premium quoted in the message (e.g. a cohort's [[premium_amount]] placeholder).
+    The primary driver is the policy's top reason code, or a premium heuristic without reason codes.
+    """
+    if context.reason_codes:
+        primary_driver = DRIVER_LABELS.get(context.reason_codes[0][0], context.reason_codes[0][0])
+    else:
+        primary_driver = "Price Sensitivity" if context.premium_amount > 150 else "Engagement Drop"
+    return {
         "risk_tier": context.risk_tier,
-        "primary_driver": "Price Sensitivity" if context.premium_amount > 150 else "Engagement Drop",
+        "primary_driver": primary_driver,
         "actions": [
             {
                 "action_name": "Proactive Rate Review",
@@ -133,41 +198,109 @@ def run_strategy_pipeline(policy_row, rag):
         "message_templates": [
             {
                 "channel": "Email",
-                "content": f"Hi, we noticed your premium is ${context.premium_amount}. Let's discuss options..."
+                "content": f"Hi, we noticed your premium is ${premium or context.premium_amount}. Let's discuss options..."
             }
         ],
         "metrics_to_track": ["Renewal Conservation"]
     }
-    print(json.dumps(mock_response, indent=2))
 
-def main():
+def _per_policy_estimate(contexts, rag, llm_call_s=None):
+    """
+    Seconds the per-policy path would spend retrieving, building prompts and generating for contexts:
+    it is timed on TIMING_SAMPLE of them and scaled up. With llm_call_s (the measured seconds per LLM
+    call) every policy also pays for one call; otherwise the mock answer is timed.
+    """
+    sample = contexts[:TIMING_SAMPLE]
+    if not sample:
+        return 0.0
+    start = time.perf_counter()
+    all_hits = rag.retrieve_many([c.to_retrieval_query() for c in sample], k=RETRIEVE_K, namespace=RETENTION_NAMESPACE)
+    for context, hits in zip(sample, all_hits):
+        StrategyPromptBuilder.build_messages(context, hits, StrategyPromptBuilder.SNIPPET_TOKEN_BUDGET)
+        if llm_call_s is None:
+            json.dumps(mock_strategy_response(context), indent=2)
+    sample_s = time.perf_counter() - start
+    return sample_s * len(contexts) / len(sample) + (llm_call_s or 0.0) * len(contexts)
+
+def run_cohort_pipeline(scored_df, rag, llm=None):
+    """
+    Cohort mode: one retrieval and one generation per cohort (strategy_cohorts.py) instead of per policy.
+    Returns (contexts, responses) in scored_df order, each response with the policy's own values filled in.
+    Prints the cohort timing next to an estimate of the per-policy path, see _per_policy_estimate.
+    """
+    start = time.perf_counter()
+    contexts = list(build_context_batch(scored_df).contexts())
+    cohorts = group_cohorts(contexts)
+    representatives = [cohort.representative() for cohort in cohorts]
+    
+    generate_start = time.perf_counter()
+    all_hits = rag.retrieve_many([r.to_retrieval_query() for r in representatives], k=RETRIEVE_K,
+                                 namespace=RETENTION_NAMESPACE)
+    messages = [StrategyPromptBuilder.build_cohort_messages(cohort, hits, StrategyPromptBuilder.SNIPPET_TOKEN_BUDGET)
+                for cohort, hits in zip(cohorts, all_hits)]
+    if llm is None:
+        cohort_responses = [json.dumps(mock_strategy_response(r, premium='[[premium_amount]]'), indent=2)
+                            for r in representatives]
+    else:
+        cohort_responses = [response_text(r) for r in llm.complete_all(messages)]
+    generate_s = time.perf_counter() - generate_start
+    
+    by_key = {cohort.key: response for cohort, response in zip(cohorts, cohort_responses)}
+    responses = [fill_placeholders(by_key[context.cohort_key()], context) for context in contexts]
+    elapsed = time.perf_counter() - start
+    
+    llm_call_s = generate_s / max(len(cohorts), 1) if llm is not None else None
+    per_policy_s = (generate_start - start) + _per_policy_estimate(contexts, rag, llm_call_s)
+    print(f"Cohort mode: {len(contexts):,} policies in {len(cohorts):,} cohorts "
+          f"(dedup ratio {len(contexts) / max(len(cohorts), 1):,.1f}x), {elapsed:.2f}s total, "
+          f"{generate_s:.2f}s retrieving/generating")
+    print(f"  per-policy path (estimated): {per_policy_s:.2f}s for {len(contexts):,} retrievals/generations, "
+          f"~{max(per_policy_s - elapsed, 0.0):,.2f}s saved by cohorts")
+    return contexts, responses
+
+def main(rag=None, llm=None, cohorts=False):
+    """
+    With an llm_client.LLMClient, the prompts are sent concurrently; otherwise a mock answer is printed.
+    With cohorts, every policy in the file is processed through run_cohort_pipeline instead of three examples.
+    """
     try:
-        model, encoder, rag = load_system()
+        model, transformer, rag = load_system(rag)
 
         target_file = 'data/test_lapse_customers_3.csv'
 
         print(f"Targeting file: {target_file}")
         
-        scored_df = prepare_and_score_data(target_file, model, encoder)
+        scored_df = prepare_and_score_data(target_file, model, transformer, reason_codes=True)
         
         if scored_df.empty:
             print("No valid policies to process.")
             return
-
-        # Select a few interesting cases to display
-        # 1. Highest Risk
-        high_risk = scored_df.sort_values('p_lapse_3_m', ascending=False).head(1)
         
-        # 2. Some Moderate Risk (middle of the pack)
-        mid_risk = scored_df[(scored_df['p_lapse_3_m'] > 0.3) & (scored_df['p_lapse_3_m'] < 0.7)].head(1)
-        
-        # 3. Low Risk
-        low_risk = scored_df.sort_values('p_lapse_3_m', ascending=True).head(1)
+        if cohorts:
+            contexts, responses = run_cohort_pipeline(scored_df, rag, llm)
+            for context, response in list(zip(contexts, responses))[:3]:
+                print(f"\n--- {context.policy_id} ({context.risk_tier}) ---")
+                print(response)
+            return
+
+        # Select a few interesting cases to display: the highest-risk policy of each tier band
+        selector = OutreachSelector(quota=3, segment_cols=(), tiers=DEMO_TIERS,
+                                    tier_quotas={tier: 1 for tier in DEMO_TIERS})
+        selector.add(scored_df)
+        demo_set = selector.queue().drop(columns=['risk_tier', 'segment_rank'])
         
-        demo_set = pd.concat([high_risk, mid_risk, low_risk])
+        prepared = [run_strategy_pipeline(row, rag) for _, row in demo_set.iterrows()]
         
-        for _, row in demo_set.iterrows():
-            run_strategy_pipeline(row, rag)
+        # 5. Generate (one concurrent batch through the LLM client, or the mock)
+        if llm is None:
+            print("\n[MOCK] LLM Generation:")
+            responses = [json.dumps(mock_strategy_response(context), indent=2) for context, _ in prepared]
+        else:
+            print(f"\nLLM Generation ({llm.model}, {len(prepared)} prompts):")
+            responses = [response_text(r) for r in llm.complete_all([messages for _, messages in prepared])]
+        for (context, _), response in zip(prepared, responses):
+            print(f"\n--- {context.policy_id} ---")
+            print(response)
             
     except FileNotFoundError as e:
         print(f"Error: {e}")
@@ -177,4 +310,9 @@ def main():
         traceback.print_exc()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Generate retention strategies for scored policies.")
+    parser.add_argument('--cohorts', action='store_true',
+                        help="Process every policy, retrieving and generating once per cohort of equivalent contexts")
+    args = parser.parse_args()
+    
+    main(cohorts=args.cohorts)
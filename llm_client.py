@@ -0,0 +1,204 @@
+"""
+Asyncio client for OpenAI-style chat completion endpoints: bounded concurrency, token-bucket
+rate limits on requests and tokens, exponential-backoff retries and an on-disk response cache.
+Uses the async_http helpers over keep-alive connections, so there is no HTTP client dependency.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import ssl
+import time
+from urllib.parse import urlsplit
+
+from async_http import encode_json_request, read_json_response
+from chunker import count_tokens
+
+DEFAULT_BASE_URL = 'http://127.0.0.1:8000'
+DEFAULT_MODEL = 'gpt-4o-mini'
+CACHE_DIR = '.llm_cache'
+# Retried: rate limited, server errors and overload
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class LLMError(Exception):
+    """A request failed for good: a non-retryable status, or retries ran out."""
+
+class TokenBucket:
+    """Allows rate units per second on average, with bursts of up to capacity."""
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.waited_s = 0.0
+
+    async def acquire(self, n=1):
+        # More than the capacity can never accumulate; such a request waits for a full bucket instead
+        n = min(n, self.capacity)
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= n:
+                self.tokens -= n
+                return
+            wait = (n - self.tokens) / self.rate
+            self.waited_s += wait
+            await asyncio.sleep(wait)
+
+class ResponseCache:
+    """Completions on disk, one JSON file per request under cache_dir/<2 hex>/<sha256>.json."""
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def key(model, messages, params=None):
+        """Hash of the model, the messages list and any sampling parameters."""
+        blob = json.dumps({'model': model, 'messages': messages, 'params': params or {}},
+                          sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, key, response):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(response, f)
+        os.replace(tmp_path, path)
+
+class LLMClient:
+    """
+    Sends chat completions to base_url + /v1/chat/completions.
+
+    At most max_concurrency requests are in flight. Each request first takes one unit from
+    the requests-per-minute bucket and its estimated tokens (prompt + max_tokens) from the
+    tokens-per-minute bucket. 429 and 5xx responses and connection errors are retried up to
+    max_retries times with exponential backoff and jitter (Retry-After is honoured).
+    Successful responses are cached on disk (cache_dir=None disables the cache), so
+    re-running a pipeline only pays for prompts that changed.
+    """
+    def __init__(self, base_url=DEFAULT_BASE_URL, model=DEFAULT_MODEL, api_key=None, max_concurrency=16,
+                 requests_per_min=3000, tokens_per_min=1_000_000, max_tokens=1024, max_retries=5,
+                 backoff_s=0.5, timeout_s=60.0, cache_dir=CACHE_DIR):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == 'https' else 80)
+        self.tls = url.scheme == 'https'
+        self.path = url.path.rstrip('/') + '/v1/chat/completions'
+        self.model = model
+        self.api_key = api_key if api_key is not None else os.environ.get('OPENAI_API_KEY')
+        self.max_concurrency = max_concurrency
+        self.max_tokens = max_tokens
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.timeout_s = timeout_s
+        self.request_bucket = TokenBucket(requests_per_min / 60)
+        self.token_bucket = TokenBucket(tokens_per_min / 60)
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+        self.stats = {'requests': 0, 'cache_hits': 0, 'retries': 0, 'failures': 0}
+        self._loop = None
+
+    def _bind_loop(self):
+        # Connections and the semaphore belong to one event loop; complete_all() runs a new loop each call
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._idle = []
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+
+    async def _connection(self):
+        if self._idle:
+            return self._idle.pop()
+        return await asyncio.open_connection(self.host, self.port,
+                                             ssl=ssl.create_default_context() if self.tls else None)
+
+    async def _post(self, payload):
+        """One attempt: (status, response payload, headers). Healthy connections go back to the pool."""
+        reader, writer = await self._connection()
+        headers = {'Authorization': f"Bearer {self.api_key}"} if self.api_key else {}
+        try:
+            writer.write(encode_json_request('POST', self.host, self.path, payload, headers))
+            await writer.drain()
+            status, response, response_headers = await asyncio.wait_for(read_json_response(reader),
+                                                                        self.timeout_s)
+        except BaseException:
+            writer.close()
+            raise
+        self._idle.append((reader, writer))
+        return status, response, response_headers
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.backoff_s * 2 ** attempt * (0.5 + random.random() / 2)
+
+    async def complete(self, messages, **params):
+        """The chat completion response (the endpoint's JSON) for one messages list."""
+        self._bind_loop()
+        key = self.cache.key(self.model, messages, params) if self.cache else None
+        if key:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.stats['cache_hits'] += 1
+                return cached
+
+        payload = {'model': self.model, 'messages': messages, 'max_tokens': self.max_tokens, **params}
+        prompt_tokens = sum(count_tokens(m['content']) for m in messages)
+        for attempt in range(self.max_retries + 1):
+            await self.request_bucket.acquire()
+            await self.token_bucket.acquire(prompt_tokens + payload['max_tokens'])
+            async with self._slots:
+                self.stats['requests'] += 1
+                try:
+                    status, response, headers = await self._post(payload)
+                except (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                    status, response, headers = None, {'error': str(e)}, {}
+            if status == 200:
+                if key:
+                    self.cache.put(key, response)
+                return response
+            if status is not None and status not in RETRY_STATUSES:
+                break
+            if attempt < self.max_retries:
+                self.stats['retries'] += 1
+                await asyncio.sleep(self._backoff(attempt, headers.get('retry-after')))
+        self.stats['failures'] += 1
+        raise LLMError(f"Chat completion failed (status {status}): {response}")
+
+    async def complete_many(self, messages_list, **params):
+        """Responses in order; the concurrency and rate limits apply across the whole batch."""
+        return await asyncio.gather(*(self.complete(messages, **params) for messages in messages_list))
+
+    async def aclose(self):
+        """Closes the pooled keep-alive connections."""
+        idle, self._idle = getattr(self, '_idle', []), []
+        for _, writer in idle:
+            writer.close()
+        await asyncio.gather(*(writer.wait_closed() for _, writer in idle), return_exceptions=True)
+
+    def complete_all(self, messages_list, **params):
+        """complete_many() for synchronous callers."""
+        async def run():
+            try:
+                return await self.complete_many(messages_list, **params)
+            finally:
+                await self.aclose()
+        return asyncio.run(run())
+
+def response_text(response):
+    """The assistant message content of a chat completion response."""
+    return response['choices'][0]['message']['content']
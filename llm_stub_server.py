@@ -0,0 +1,80 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from async_http import json_handler
+from chunker import count_tokens
+
+class StubChatServer:
+    """
+    Local stand-in for a chat completions endpoint (POST /v1/chat/completions).
+
+    Every request waits latency_ms (+/- jitter) before answering, so client concurrency can
+    be measured offline; error_rate of the requests get a 429 or 503 to exercise retries.
+    The completion is a JSON object naming the model and echoing the start of the last message.
+    """
+    def __init__(self, latency_ms=200.0, jitter_ms=50.0, error_rate=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _completion(self, payload):
+        messages = payload['messages']
+        prompt_tokens = sum(count_tokens(m['content']) for m in messages)
+        content = json.dumps({'stub': True, 'model': payload.get('model'),
+                              'echo': messages[-1]['content'].strip()[:120]})
+        return {
+            'id': f"chatcmpl-stub-{self.requests}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': payload.get('model'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                         'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': count_tokens(content),
+                      'total_tokens': prompt_tokens + count_tokens(content)},
+        }
+
+    async def route(self, method, path, payload):
+        if path != '/v1/chat/completions':
+            return 404, {'error': f"Unknown path {path}"}
+        if method != 'POST' or not isinstance(payload, dict) or not payload.get('messages'):
+            return 400, {'error': "POST a JSON body with a messages list"}
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            delay = max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            await asyncio.sleep(delay)
+            if self.rng.random() < self.error_rate:
+                return self.rng.choice([429, 503]), {'error': {'message': "Stub overload, retry"}}
+            return 200, self._completion(payload)
+        finally:
+            self.in_flight -= 1
+
+    async def start(self, host='127.0.0.1', port=8000):
+        return await asyncio.start_server(json_handler(self.route), host, port)
+
+async def _serve_forever(stub, host, port):
+    server = await stub.start(host, port)
+    print(f"Stub chat completions endpoint on http://{host}:{port}/v1/chat/completions "
+          f"({stub.latency_ms:.0f}ms latency, {stub.error_rate:.0%} errors)")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stub of a chat completions API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency-ms', type=float, default=200.0)
+    parser.add_argument('--jitter-ms', type=float, default=50.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered 429/503")
+    args = parser.parse_args()
+
+    asyncio.run(_serve_forever(StubChatServer(args.latency_ms, args.jitter_ms, args.error_rate),
+                               args.host, args.port))
@@ -0,0 +1,127 @@
+import hashlib
+import os
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+
+LSA_FILE = 'lsa.npz'
+# Rows of the chunk x list similarity matrix computed at once during k-means
+ASSIGN_BLOCK = 16384
+# Below this many chunks a full scan is cheap enough, so fit() builds a single list (exact search)
+MIN_IVF_CHUNKS = 4096
+
+def matrix_fingerprint(matrix):
+    """Short hash of a CSR matrix, to tell whether a saved model was fitted on it."""
+    digest = hashlib.sha256(repr(matrix.shape).encode())
+    for array in (matrix.indptr, matrix.indices, matrix.data):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()[:16]
+
+def _normalize_rows(x):
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+def top_k(ids, scores, k):
+    """Best k (ids, scores), ties to the lower id."""
+    if len(ids) > k:
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        ids, scores = ids[scores >= kth], scores[scores >= kth]
+    order = np.lexsort((ids, -scores))[:k]
+    return ids[order], scores[order]
+
+class LSAIndex:
+    """
+    Latent semantic index: chunk TF-IDF rows projected onto the top singular vectors
+    (TruncatedSVD) of the chunk x term matrix, so chunks that share vocabulary with
+    related terms score against a query even without exact token overlap.
+
+    Chunk embeddings are L2-normalized float32, so a dot product is the cosine similarity.
+    For approximate search they are partitioned into n_lists inverted lists by spherical
+    k-means (IVF); a query only scores the chunks of its nprobe closest lists.
+    nprobe >= n_lists is exact search.
+    """
+    def __init__(self, components, embeddings, centroids, list_ids, list_indptr, fingerprint, nprobe):
+        self.components = np.ascontiguousarray(components, dtype=np.float32)  # term x dim
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)  # chunk x dim
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)    # list x dim
+        self.list_ids = np.asarray(list_ids, dtype=np.int32)        # chunk ids grouped by list
+        self.list_indptr = np.asarray(list_indptr, dtype=np.int64)  # list j is list_ids[indptr[j]:indptr[j + 1]]
+        self.fingerprint = fingerprint
+        self.nprobe = nprobe
+        self.chunks_scored = 0
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    @classmethod
+    def fit(cls, tfidf_matrix, n_components=128, n_lists=None, nprobe=None, iterations=10, seed=0):
+        """Fits the SVD projection and the IVF partition; n_lists defaults to sqrt(n_chunks)."""
+        n_chunks, n_terms = tfidf_matrix.shape
+        n_components = max(1, min(n_components, n_chunks - 1, n_terms - 1))
+        svd = TruncatedSVD(n_components=n_components, algorithm='randomized', random_state=seed)
+        embeddings = _normalize_rows(svd.fit_transform(tfidf_matrix).astype(np.float32))
+
+        if n_lists is None:
+            n_lists = int(np.sqrt(n_chunks)) if n_chunks >= MIN_IVF_CHUNKS else 1
+        n_lists = min(n_lists, n_chunks)
+        centroids, assign = cls._spherical_kmeans(embeddings, n_lists, iterations, seed)
+        list_ids = np.argsort(assign, kind='stable')
+        list_indptr = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))])
+        nprobe = nprobe or max(1, int(np.ceil(n_lists / 10)))
+        return cls(svd.components_.T, embeddings, centroids, list_ids, list_indptr,
+                   matrix_fingerprint(tfidf_matrix), nprobe)
+
+    @staticmethod
+    def _assign(embeddings, centroids):
+        return np.concatenate([np.argmax(embeddings[i:i + ASSIGN_BLOCK] @ centroids.T, axis=1)
+                               for i in range(0, len(embeddings), ASSIGN_BLOCK)])
+
+    @classmethod
+    def _spherical_kmeans(cls, embeddings, n_lists, iterations, seed):
+        rng = np.random.default_rng(seed)
+        centroids = embeddings[rng.choice(len(embeddings), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assign = cls._assign(embeddings, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, embeddings)
+            filled = np.bincount(assign, minlength=n_lists) > 0
+            # An emptied list keeps its old centroid
+            centroids[filled] = _normalize_rows(sums[filled])
+        return centroids, cls._assign(embeddings, centroids)
+
+    def embed(self, tfidf_rows):
+        """Normalized embeddings of TF-IDF rows (queries vectorized with the index vocabulary)."""
+        return _normalize_rows(np.asarray(tfidf_rows @ self.components, dtype=np.float32))
+
+    def candidates(self, query_embedding, nprobe=None):
+        """Chunk ids in the nprobe lists closest to the query."""
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        if nprobe >= self.n_lists:
+            return np.arange(len(self.embeddings), dtype=np.int32)
+        closest = np.argpartition(-(self.centroids @ query_embedding), nprobe - 1)[:nprobe]
+        return np.concatenate([self.list_ids[self.list_indptr[j]:self.list_indptr[j + 1]] for j in closest])
+
+    def scores(self, query_embedding, ids):
+        self.chunks_scored += len(ids)
+        return self.embeddings[ids] @ query_embedding
+
+    def search(self, query_embedding, k=3, nprobe=None, rows_mask=None):
+        """(chunk ids, cosine scores) of the top k chunks among the probed lists, best first."""
+        ids = self.candidates(query_embedding, nprobe)
+        if rows_mask is not None:
+            ids = ids[rows_mask[ids]]
+        return top_k(ids, self.scores(query_embedding, ids), k)
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, components=self.components, embeddings=self.embeddings, centroids=self.centroids,
+                     list_ids=self.list_ids, list_indptr=self.list_indptr,
+                     fingerprint=self.fingerprint, nprobe=self.nprobe)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            return cls(npz['components'], npz['embeddings'], npz['centroids'], npz['list_ids'],
+                       npz['list_indptr'], str(npz['fingerprint']), int(npz['nprobe']))
@@ -0,0 +1,143 @@
+import argparse
+import heapq
+import time
+import numpy as np
+import pandas as pd
+
+from chunk_pool import peak_rss_mb
+from fast_scorer import LOOKUP_TABLE_PATH, MODEL_PATH, TRANSFORMER_PATH, FastScorer
+from strategy_prompt import StrategyPromptBuilder
+
+SEGMENT_COLS = ('month', 'region', 'has_agent')
+OUTREACH_TIERS = ('Critical', 'Watchlist')
+
+class OutreachSelector:
+    """
+    Streaming top-N selection of the highest-risk policies per segment.
+
+    Feed scored chunks (with p_lapse_3_m) to add(); only policies whose risk tier
+    (StrategyPromptBuilder.determine_risk_tier) is in tiers are eligible. Each segment (the
+    values of segment_cols) keeps a bounded min-heap of its quota best policies, or with
+    tier_quotas one heap per (segment, tier) holding at most that many of the tier, so memory
+    is bounded by segments x quota whatever the number of rows. Each chunk is pre-cut to its
+    per-segment top rows with one lexsort before touching the heaps. Equal scores keep the
+    policy seen first.
+    """
+    def __init__(self, quota=100, segment_cols=SEGMENT_COLS, tiers=OUTREACH_TIERS, tier_quotas=None):
+        self.quota = quota
+        self.segment_cols = list(segment_cols)
+        self.tiers = tuple(tiers)
+        self.tier_quotas = dict(tier_quotas or {})
+        self.heaps = {}
+        self.rows_seen = 0
+        self.rows_eligible = 0
+
+    def _cap(self, tier):
+        return min(self.quota, self.tier_quotas.get(tier, self.quota))
+
+    def add(self, chunk):
+        """Offers a scored chunk (DataFrame with p_lapse_3_m and the segment columns)."""
+        p_lapse = chunk['p_lapse_3_m'].to_numpy(np.float64)
+        tiers = StrategyPromptBuilder.determine_risk_tiers(p_lapse)
+        rows = np.flatnonzero(np.isin(tiers, self.tiers))
+        self.rows_seen += len(chunk)
+        self.rows_eligible += len(rows)
+        if not len(rows):
+            return
+
+        # Group code per eligible row: segment, plus the tier when tiers have their own quotas
+        keys = [chunk[col].to_numpy()[rows] for col in self.segment_cols]
+        if self.tier_quotas:
+            keys.append(tiers[rows])
+        if keys:
+            code = pd.DataFrame(dict(enumerate(keys))).groupby(list(range(len(keys))), sort=False,
+                                                               dropna=False).ngroup().to_numpy()
+        else:
+            code = np.zeros(len(rows), dtype=np.int64)
+
+        # Best first within each group; a group never needs more rows than its cap from one chunk
+        order = np.lexsort((-p_lapse[rows], code))
+        sorted_code = code[order]
+        starts = np.flatnonzero(np.r_[True, sorted_code[1:] != sorted_code[:-1]])
+        rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        caps = self.quota
+        if self.tier_quotas:
+            sorted_tiers = tiers[rows][order]
+            caps = np.full(len(order), self.quota)
+            for tier in self.tier_quotas:
+                caps[sorted_tiers == tier] = self._cap(tier)
+        kept = rows[order[rank < caps]]
+
+        records = chunk.iloc[kept].to_dict('records')
+        for record, tier, seq in zip(records, tiers[kept].tolist(), (self.rows_seen - len(chunk) + kept).tolist()):
+            segment = tuple(record[col] for col in self.segment_cols)
+            heap_key = segment + (tier,) if self.tier_quotas else segment
+            heap = self.heaps.setdefault(heap_key, [])
+            # Min-heap on (score, -arrival): the root is the weakest entry, later arrivals lose ties
+            entry = (record['p_lapse_3_m'], -seq, tier, record)
+            if len(heap) < self._cap(tier):
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+
+    @property
+    def n_segments(self):
+        return len({heap_key[:len(self.segment_cols)] for heap_key in self.heaps})
+
+    def queue(self):
+        """
+        The outreach queue: per segment its quota highest-risk policies, as a DataFrame with
+        risk_tier and segment_rank (1 = highest risk in its segment), highest risk first.
+        """
+        segments = {}
+        for heap_key, heap in self.heaps.items():
+            segment = heap_key[:len(self.segment_cols)]
+            segments.setdefault(segment, []).extend(heap)
+        rows = []
+        for entries in segments.values():
+            entries.sort(key=lambda e: (-e[0], -e[1]))
+            for rank, (_, _, tier, record) in enumerate(entries[:self.quota], 1):
+                rows.append({**record, 'risk_tier': tier, 'segment_rank': rank})
+        if not rows:
+            return pd.DataFrame(columns=['p_lapse_3_m', 'risk_tier', 'segment_rank'])
+        return pd.DataFrame(rows).sort_values(['p_lapse_3_m', 'segment_rank'], ascending=[False, True],
+                                              kind='stable', ignore_index=True)
+
+def build_outreach_queue(input_path, output_path=None, scorer=None, quota=100, segment_cols=SEGMENT_COLS,
+                         tiers=OUTREACH_TIERS, tier_quotas=None, chunk_size=200_000, lookup_table_path=None):
+    """Streams and scores input_path in chunks through an OutreachSelector; returns (and optionally writes) the queue."""
+    scorer = scorer or FastScorer.load(MODEL_PATH, TRANSFORMER_PATH, lookup_table_path)
+    selector = OutreachSelector(quota, segment_cols, tiers, tier_quotas)
+
+    start = time.time()
+    for chunk in pd.read_csv(input_path, chunksize=chunk_size):
+        chunk['p_lapse_3_m'] = scorer.score_many(chunk)
+        selector.add(chunk)
+    queue = selector.queue()
+    elapsed = time.time() - start
+
+    if output_path:
+        queue.to_csv(output_path, index=False)
+    print(f"Outreach queue: {len(queue):,} policies in {selector.n_segments:,} segments from {selector.rows_seen:,} scored ({selector.rows_eligible:,} in {', '.join(tiers)}) "
+          f"in {elapsed:.1f}s, peak RSS {peak_rss_mb():.0f} MB"
+          + (f" -> {output_path}" if output_path else ""))
+    return queue
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Select the highest-risk policies per segment for outreach.")
+    parser.add_argument('input', help="CSV with policy_id, month and the model features")
+    parser.add_argument('output', help="CSV for the outreach queue")
+    parser.add_argument('--quota', type=int, default=100, help="Policies per segment")
+    parser.add_argument('--segments', nargs='*', default=list(SEGMENT_COLS), help="Segment columns")
+    parser.add_argument('--tiers', nargs='+', default=list(OUTREACH_TIERS), choices=['Critical', 'Watchlist', 'Stable'])
+    parser.add_argument('--tier-quota', action='append', default=[], metavar='TIER=N',
+                        help="Per-segment cap for one tier, e.g. Watchlist=20 (repeatable)")
+    parser.add_argument('--chunk-size', type=int, default=200_000)
+    parser.add_argument('--lookup-table', action='store_true',
+                        help=f"Score by table lookup from {LOOKUP_TABLE_PATH} instead of evaluating the trees")
+    args = parser.parse_args()
+
+    tier_quotas = {tier: int(n) for tier, n in (spec.split('=', 1) for spec in args.tier_quota)}
+    build_outreach_queue(args.input, args.output, quota=args.quota, segment_cols=args.segments, tiers=args.tiers,
+                         tier_quotas=tier_quotas, chunk_size=args.chunk_size,
+                         lookup_table_path=LOOKUP_TABLE_PATH if args.lookup_table else None)
@@ -0,0 +1,128 @@
+import fcntl
+import glob
+import json
+import os
+import shutil
+from contextlib import contextmanager
+import numpy as np
+
+from chunk_store import STORE_ARRAYS
+from feature_cache import file_digest
+
+INDEX_DIR_NAME = '.rag_index'
+# Bump when chunking or the on-disk layout changes so old indexes are rebuilt
+FORMAT_VERSION = 5
+# 'data' holds the TF-IDF weights and 'counts' the raw term counts, both over indices/indptr;
+# the chunk texts are a chunk_store.ChunkStore
+ARRAYS = ['terms', 'idf', 'data', 'counts', 'indices', 'indptr'] + STORE_ARRAYS
+
+def list_doc_files(docs_dir):
+    # Support both new structure (md) and legacy (txt)
+    return glob.glob(os.path.join(docs_dir, "**", "*.md"), recursive=True) + \
+           glob.glob(os.path.join(docs_dir, "*.txt"))
+
+def build_manifest(paths):
+    """path -> size, mtime and content hash of every indexed document."""
+    manifest = {}
+    for path in paths:
+        st = os.stat(path)
+        manifest[path] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': file_digest(path)}
+    return manifest
+
+def _read_meta(index_dir):
+    try:
+        with open(os.path.join(index_dir, 'meta.json'), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def changed_files(manifest, paths):
+    """
+    Returns (paths whose content differs from the manifest, whether any mtime was restamped).
+
+    Files whose size and mtime match are trusted without being opened; only files whose
+    stat changed are re-hashed. A touched but unchanged file just gets its new mtime recorded
+    in manifest (updated in place).
+    """
+    changed, restamped = [], False
+    for path in paths:
+        entry, st = manifest[path], os.stat(path)
+        if st.st_size == entry['size'] and st.st_mtime_ns == entry['mtime_ns']:
+            continue
+        if st.st_size != entry['size'] or file_digest(path) != entry['sha256']:
+            changed.append(path)
+            continue
+        entry['mtime_ns'] = st.st_mtime_ns
+        restamped = True
+    return changed, restamped
+
+def is_current(index_dir, paths, config):
+    """True when the saved index was built from exactly these documents with this config."""
+    meta = _read_meta(index_dir)
+    if meta is None or meta['version'] != FORMAT_VERSION or meta['config'] != config:
+        return False
+    manifest = meta['manifest']
+    if sorted(manifest) != sorted(paths):
+        return False
+
+    changed, restamped = changed_files(manifest, paths)
+    if changed:
+        return False
+    if restamped:
+        # Record the new mtimes so the next start is stat-only again
+        _write_meta(index_dir, meta)
+    return True
+
+def _write_meta(directory, meta):
+    tmp_path = os.path.join(directory, f"meta.json.tmp{os.getpid()}")
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, os.path.join(directory, 'meta.json'))
+
+@contextmanager
+def index_lock(index_dir, exclusive=False):
+    """
+    Advisory lock on index_dir (through index_dir + '.lock'), so processes sharing an index never see
+    it half written: save_index holds it exclusively, readers hold it shared while they check and map it.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(index_dir)), exist_ok=True)
+    with open(f"{index_dir}.lock", 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def save_index(index_dir, manifest, config, arrays):
+    """
+    Writes one .npy per array plus meta.json into a temp dir, then renames it into place, under the
+    exclusive index_lock. Returns False without writing when another process already saved an index
+    of the same documents and config (the caller can load that one instead).
+    """
+    with index_lock(index_dir, exclusive=True):
+        if is_current(index_dir, list(manifest), config):
+            return False
+        tmp_dir = f"{index_dir}.tmp{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name in ARRAYS:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), arrays[name])
+        _write_meta(tmp_dir, {'version': FORMAT_VERSION, 'config': config, 'manifest': manifest,
+                              'shape': list(arrays['shape'])})
+
+        shutil.rmtree(index_dir, ignore_errors=True)
+        os.replace(tmp_dir, index_dir)
+    return True
+
+def load_current_index(index_dir, paths, config):
+    """load_index(index_dir) if is_current for these documents and config, else None (under a shared index_lock)."""
+    with index_lock(index_dir):
+        return load_index(index_dir) if is_current(index_dir, paths, config) else None
+
+def load_index(index_dir):
+    """Memory-maps the saved arrays; returns them with 'shape' and 'manifest' added."""
+    arrays = {name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode='r') for name in ARRAYS}
+    meta = _read_meta(index_dir)
+    arrays['shape'] = tuple(meta['shape'])
+    arrays['manifest'] = meta['manifest']
+    return arrays
@@ -1,64 +1,419 @@
 import os
-import glob
-from sklearn.feature_extraction.text import TfidfVectorizer
+import threading
+from collections import OrderedDict
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 import numpy as np
 
+import rag_index
+from chunker import Chunker
+from chunk_store import ChunkStore, RetrievalHit
+from bm25 import BM25Index
+from lsa import LSA_FILE, LSAIndex, matrix_fingerprint, top_k
+
 class MinimalRAG:
-    def __init__(self, docs_dir='rag_docs'):
+    """
+    TF-IDF retrieval over the markdown playbooks in docs_dir.
+
+    With use_index the fitted index is saved under index_dir (default docs_dir/.rag_index)
+    and memory-mapped back on later starts, as long as the documents are unchanged.
+    read_only never writes index_dir (e.g. worker processes loading an index their parent built).
+
+    Results are memoized in an LRU cache of cache_size entries keyed on the normalized query
+    and k. Templated customer queries repeat heavily, so most lookups are cache hits;
+    warm_cache() fills it up front. The cache is cleared whenever the index changes.
+
+    engine='bm25' answers queries from an inverted index with BM25 scoring and MaxScore
+    pruning (bm25.BM25Index) instead of TF-IDF cosine similarity against every chunk;
+    its scores are unnormalized, so MIN_SCORE does not apply to it.
+
+    engine='lsa' scores chunks by cosine similarity of their LSA embeddings (lsa.LSAIndex,
+    a TruncatedSVD projection of the TF-IDF matrix) and only visits the closest IVF lists,
+    so paraphrases without exact token overlap can still match. engine='hybrid' blends the
+    LSA and TF-IDF cosine scores (HYBRID_WEIGHT on the LSA side) over the probed chunks only,
+    so its cost per query follows the probed lists rather than the corpus size. The LSA model
+    is fitted on the first query after an index change and saved to index_dir/lsa.npz (under
+    the exclusive index lock), so later starts just load it.
+
+    The index keeps raw term counts per chunk, so documents can be added, removed or
+    re-read (add_document, remove_document, refresh) without re-chunking the others.
+    IDF weights are recomputed from the counts on the next query after a change, with the
+    same formula TfidfVectorizer uses, so results match a full rebuild. Methods are
+    serialized by a lock, so a background refresh is safe next to serving threads.
+
+    Every chunk is tagged with a namespace, the first subdirectory of docs_dir it came from
+    ('lapse', 'leads'; '' for files directly in docs_dir). retrieve(..., namespace=...) only
+    scores that namespace's rows, through a cached CSR slice per namespace, so one index
+    serves both pipelines. IDF stays global over all namespaces.
+
+    Documents are split by chunker (default chunker.Chunker(): paragraphs packed into
+    20..256-token chunks, near-duplicates within a document dropped); its settings are part of
+    the index config.
+
+    Chunk texts live in a chunk_store.ChunkStore (one UTF-8 buffer, memory-mapped from a saved
+    index), and results are RetrievalHit views into it: the chunk text is only decoded when a
+    prompt reads hit['chunk'].
+    """
+    # Anything here that changes the fitted index invalidates saved ones
+    INDEX_CONFIG = {'stop_words': 'english', 'chunking': 'packed-tokens'}
+    MIN_SCORE = 0.05 # Minimal threshold
+    # Query rows scored per dense block in retrieve_many (bounds memory to block x n_chunks)
+    QUERY_BLOCK = 4096
+    ENGINES = ('tfidf', 'bm25', 'lsa', 'hybrid')
+    LSA_CONFIG = {'n_components': 128}
+    HYBRID_WEIGHT = 0.5
+
+    def __init__(self, docs_dir='rag_docs', index_dir=None, use_index=True, cache_size=8192, engine='tfidf',
+                 chunker=None, read_only=False):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown retrieval engine '{engine}', expected one of {self.ENGINES}")
         self.docs_dir = docs_dir
-        self.chunks = []
-        self.chunk_sources = []
-        self.vectorizer = TfidfVectorizer(stop_words='english')
+        self.engine = engine
+        self.bm25 = None
+        self.lsa = None
+        self.index_dir = index_dir or os.path.join(docs_dir, rag_index.INDEX_DIR_NAME)
+        self.use_index = use_index
+        self.read_only = read_only
+        self.chunker = chunker or Chunker()
+        self.index_config = {**self.INDEX_CONFIG, **self.chunker.config()}
+        self.chunks = ChunkStore()
+        self.vectorizer = TfidfVectorizer(stop_words=self.INDEX_CONFIG['stop_words'])
+        self.vocabulary = {}    # term -> column of counts / tfidf_matrix
+        self.counts = None      # chunk x term raw counts
         self.tfidf_matrix = None
+        self.manifest = {}      # path -> size, mtime, sha256 of every indexed document
+        self._stale = False     # counts changed since the weights were computed
+        self._lock = threading.RLock()
+        self._namespace_rows = {}     # namespace -> chunk rows, rebuilt lazily after index changes
+        self._namespace_matrix = {}   # namespace -> tfidf_matrix[rows]
+        self._namespace_mask = {}     # namespace -> boolean row mask (bm25)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.cache_hits = self.cache_misses = self.cache_evictions = 0
+        self.index_generation = 0
         
-        self._load_and_index()
+        file_paths = rag_index.list_doc_files(docs_dir)
+        saved = None
+        if use_index and file_paths:
+            saved = rag_index.load_current_index(self.index_dir, file_paths, self.index_config)
+        if saved is not None:
+            self._load_saved_index(saved)
+            self._index_changed()
+        else:
+            self._load_and_index(file_paths)
+            self.manifest = rag_index.build_manifest(file_paths)
+            if use_index and self.chunks and not read_only and not self._save_index():
+                # Another process saved the same index first: share its memory-mapped copy
+                saved = rag_index.load_current_index(self.index_dir, file_paths, self.index_config)
+                if saved is not None:
+                    self._load_saved_index(saved)
+                    self._index_changed()
+    
+    @property
+    def chunk_sources(self):
+        return self.chunks.sources
+
+    @property
+    def chunk_paths(self):
+        return self.chunks.paths
+
+    @property
+    def chunk_namespaces(self):
+        return self.chunks.namespaces
+
+    def _index_changed(self):
+        """Call after any change to the indexed chunks: cached results are no longer valid."""
+        self.index_generation += 1
+        self._cache.clear()
+        self._namespace_rows.clear()
+        self._namespace_matrix.clear()
+        self._namespace_mask.clear()
+        self.lsa = None
+        if self.engine == 'bm25':
+            self.bm25 = BM25Index(self.counts, self.vocabulary, self.vectorizer.build_analyzer()) \
+                if len(self.chunks) else None
+    
+    @staticmethod
+    def _cache_key(query, k, namespace=None):
+        # The vectorizer lowercases and tokenizes on word boundaries, so case and spacing never change results
+        return ' '.join(query.lower().split()), k, namespace
+    
+    def _cache_get(self, key):
+        hits = self._cache.get(key)
+        if hits is None:
+            self.cache_misses += 1
+            return None
+        self._cache.move_to_end(key)
+        self.cache_hits += 1
+        return hits
+    
+    def _cache_put(self, key, hits):
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = hits
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+            self.cache_evictions += 1
+    
+    def cache_info(self):
+        return {'hits': self.cache_hits, 'misses': self.cache_misses, 'evictions': self.cache_evictions,
+                'size': len(self._cache), 'max_size': self.cache_size, 'generation': self.index_generation}
+    
+    def warm_cache(self, queries, k=3, namespace=None):
+        """Pre-computes results for an enumerated query space (e.g. CustomerContext.query_space())."""
+        self.retrieve_many(queries, k, namespace=namespace)
+        return len(self._cache)
         
-    def _load_and_index(self):
-        """Loads text files, chunks them, and builds the TF-IDF index."""
-        # Support both new structure (md) and legacy (txt)
-        file_paths = glob.glob(os.path.join(self.docs_dir, "**", "*.md"), recursive=True) + \
-                     glob.glob(os.path.join(self.docs_dir, "*.txt"))
+    def _load_saved_index(self, arrays):
+        self.chunks = ChunkStore.from_arrays(arrays)
+        self.vocabulary = {term: i for i, term in enumerate(arrays['terms'].tolist())}
+        self.vectorizer.vocabulary_ = self.vocabulary
+        self.vectorizer.idf_ = arrays['idf']
+        self.counts = csr_matrix((arrays['counts'], arrays['indices'], arrays['indptr']),
+                                 shape=arrays['shape'], copy=False)
+        self.tfidf_matrix = csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                       shape=arrays['shape'], copy=False)
+        self.manifest = arrays['manifest']
+        print(f"Loaded index of {len(self.chunks)} chunks from {self.index_dir} (documents unchanged)")
+
+    def _save_index(self):
+        """Saves the index to index_dir; False when an identical one was already there (rag_index.save_index)."""
+        terms = np.asarray(self.vectorizer.get_feature_names_out(), dtype=str)
+        matrix = self.tfidf_matrix
+        return rag_index.save_index(self.index_dir, self.manifest, self.index_config, {
+            'terms': terms, 'idf': self.vectorizer.idf_,
+            'data': matrix.data, 'counts': self.counts.data,
+            'indices': matrix.indices, 'indptr': matrix.indptr, 'shape': matrix.shape,
+            **self.chunks.arrays(),
+        })
+
+    def lsa_index(self):
+        """The LSA model of the current chunks: loaded from index_dir if it matches, fitted (and saved) otherwise."""
+        with self._lock:
+            self._ensure_fresh()
+            if self.lsa is not None or not len(self.chunks):
+                return self.lsa
+            fingerprint = matrix_fingerprint(self.tfidf_matrix)
+            path = os.path.join(self.index_dir, LSA_FILE)
+            if self.use_index:
+                with rag_index.index_lock(self.index_dir):
+                    saved = LSAIndex.load(path) if os.path.exists(path) else None
+                if saved is not None and saved.fingerprint == fingerprint:
+                    self.lsa = saved
+                    return self.lsa
+            self.lsa = LSAIndex.fit(self.tfidf_matrix, **self.LSA_CONFIG)
+            if self.use_index and not self.read_only:
+                with rag_index.index_lock(self.index_dir, exclusive=True):
+                    if os.path.isdir(self.index_dir):
+                        self.lsa.save(path)
+            return self.lsa
+
+    def _namespace_of(self, path):
+        parts = os.path.relpath(path, self.docs_dir).split(os.sep)
+        return parts[0] if len(parts) > 1 else ''
+
+    def namespaces(self):
+        with self._lock:
+            return sorted(set(self.chunk_namespaces.tolist()))
+
+    def _rows(self, namespace):
+        """Chunk rows of a namespace (None for all chunks)."""
+        if namespace is None:
+            return None
+        rows = self._namespace_rows.get(namespace)
+        if rows is None:
+            rows = np.flatnonzero(self.chunk_namespaces == namespace)
+            if not len(rows):
+                raise ValueError(f"Unknown namespace '{namespace}', indexed: {self.namespaces()}")
+            self._namespace_rows[namespace] = rows
+        return rows
+
+    def _matrix(self, namespace):
+        """(rows, TF-IDF rows of the namespace); rows is None when searching everything."""
+        rows = self._rows(namespace)
+        if rows is None:
+            return None, self.tfidf_matrix
+        matrix = self._namespace_matrix.get(namespace)
+        if matrix is None:
+            matrix = self._namespace_matrix[namespace] = self.tfidf_matrix[rows]
+        return rows, matrix
+
+    def _mask(self, namespace):
+        rows = self._rows(namespace)
+        if rows is None:
+            return None
+        mask = self._namespace_mask.get(namespace)
+        if mask is None:
+            mask = self._namespace_mask[namespace] = np.zeros(len(self.chunks), dtype=bool)
+            mask[rows] = True
+        return mask
+
+    def _read_chunks(self, path):
+        """Chunk bodies, their token counts and the citation label for one document."""
+        filename = os.path.basename(path)
+        
+        # Extract citation ID if present (e.g. Doc1_...)
+        citation_id = filename.split('_')[0] if filename.startswith("Doc") else filename
+        source_label = f"[{citation_id}]" if filename.startswith("Doc") else filename
         
+        # The file is streamed paragraph by paragraph into token-bounded chunks;
+        # the store adds source info to the chunk text for context: Source: [Doc1] (filename)\ncontent...
+        chunks = list(self.chunker.chunk_file(path))
+        return [text for text, _ in chunks], [n for _, n in chunks], source_label
+
+    def _load_and_index(self, file_paths):
+        """Loads text files, chunks them, and builds the TF-IDF index."""
         print(f"Loading documents from {self.docs_dir}...")
-        for path in file_paths:
-            filename = os.path.basename(path)
-            
-            # Extract citation ID if present (e.g. Doc1_...)
-            citation_id = filename.split('_')[0] if filename.startswith("Doc") else filename
-            source_label = f"[{citation_id}]" if filename.startswith("Doc") else filename
-            
-            with open(path, 'r', encoding='utf-8') as f:
-                text = f.read()
-                
-            # Simple chunking: Split by double newlines (paragraphs) 
-            raw_chunks = text.split('\n\n')
-            
-            clean_chunks = [c.strip() for c in raw_chunks if c.strip()]
-            
-            for chunk in clean_chunks:
-                # Add source info to the chunk text for context: [Doc1] content...
-                full_chunk_text = f"Source: {source_label} ({filename})\n{chunk}"
-                self.chunks.append(full_chunk_text)
-                self.chunk_sources.append(source_label)
-                
+        self._add_documents([self._document(path) for path in file_paths])
         print(f"Indexed {len(self.chunks)} chunks from {len(file_paths)} files.")
         
         # Vectorize
         if self.chunks:
-            self.tfidf_matrix = self.vectorizer.fit_transform(self.chunks)
+            self._reweight()
         else:
             print("Warning: No documents found to index.")
 
-    def retrieve(self, query, k=3):
-        """Retrieves top k relevant chunks for the query."""
-        if not self.chunks or self.tfidf_matrix is None:
+    def _document(self, path):
+        bodies, n_tokens, source_label = self._read_chunks(path)
+        return path, source_label, self._namespace_of(path), bodies, n_tokens
+
+    def _add_documents(self, documents):
+        """Counts the terms of new chunks, growing the vocabulary; weights are recomputed lazily."""
+        store, texts = self.chunks.with_documents(documents)
+        if not texts:
+            return
+        counter = CountVectorizer(stop_words=self.INDEX_CONFIG['stop_words'])
+        try:
+            local = counter.fit_transform(texts)
+            terms = counter.get_feature_names_out()
+        except ValueError:
+            # Only stop words in these chunks
+            local, terms = csr_matrix((len(texts), 0)), []
+        columns = np.array([self.vocabulary.setdefault(t, len(self.vocabulary)) for t in terms], dtype=np.int32)
+        width = len(self.vocabulary)
+        new = csr_matrix((local.data.astype(np.float64), columns[local.indices], local.indptr),
+                         shape=(len(texts), width))
+        if self.counts is None or self.counts.shape[0] == 0:
+            self.counts = new
+        else:
+            old = csr_matrix((self.counts.data, self.counts.indices, self.counts.indptr),
+                             shape=(self.counts.shape[0], width))
+            self.counts = vstack([old, new], format='csr')
+        self.counts.sort_indices()
+        self.chunks = store
+        self._stale = True
+
+    def _reweight(self):
+        """IDF and L2-normalized TF-IDF rows from the raw counts (TfidfVectorizer's smooth_idf formula)."""
+        n_terms = len(self.vocabulary)
+        df = np.bincount(self.counts.indices, minlength=n_terms)
+        if (df == 0).any():
+            # Drop terms only found in removed chunks, as a fresh fit would never have seen them
+            keep = np.flatnonzero(df)
+            remap = np.full(n_terms, -1, dtype=np.int32)
+            remap[keep] = np.arange(len(keep), dtype=np.int32)
+            terms_by_column = np.empty(n_terms, dtype=object)
+            terms_by_column[list(self.vocabulary.values())] = list(self.vocabulary)
+            self.vocabulary = dict(zip(terms_by_column[keep].tolist(), range(len(keep))))
+            self.counts = csr_matrix((self.counts.data, remap[self.counts.indices], self.counts.indptr),
+                                     shape=(self.counts.shape[0], len(keep)))
+            df = df[keep]
+        
+        n_chunks = self.counts.shape[0]
+        idf = np.log((1 + n_chunks) / (1 + df)) + 1
+        tfidf = self.counts.copy()
+        tfidf.data = tfidf.data * idf[tfidf.indices]
+        self.tfidf_matrix = normalize(tfidf, copy=False)
+        self.vectorizer.vocabulary_ = self.vocabulary
+        self.vectorizer.idf_ = idf
+        self._stale = False
+        self._index_changed()
+
+    def _ensure_fresh(self):
+        if self._stale:
+            if len(self.chunks):
+                self._reweight()
+            else:
+                self.tfidf_matrix = None
+                self._stale = False
+                self._index_changed()
+
+    def _remove_chunks(self, path):
+        rows = self.chunks.rows_of([path])
+        if not len(rows):
+            return
+        self.counts = self.counts[np.setdiff1d(np.arange(len(self.chunks)), rows)]
+        self.chunks = self.chunks.without_rows(rows)
+        self._stale = True
+
+    def add_document(self, path):
+        """Indexes one file (re-indexes it if it was already in the index)."""
+        with self._lock:
+            self._remove_chunks(path)
+            self._add_documents([self._document(path)])
+            self.manifest[path] = rag_index.build_manifest([path])[path]
+            self._stale = True
+
+    def remove_document(self, path):
+        with self._lock:
+            self._remove_chunks(path)
+            self.manifest.pop(path, None)
+
+    def refresh(self):
+        """
+        Re-scans docs_dir against the manifest and re-indexes only added, removed or edited files
+        (unchanged files are only stat'ed). Saves the updated index when use_index is set.
+        Returns {'added': [...], 'removed': [...], 'updated': [...]}.
+        """
+        with self._lock:
+            paths = rag_index.list_doc_files(self.docs_dir)
+            known = [p for p in paths if p in self.manifest]
+            changes = {
+                'added': [p for p in paths if p not in self.manifest],
+                'removed': [p for p in self.manifest if p not in set(paths)],
+                'updated': rag_index.changed_files(self.manifest, known)[0],
+            }
+            for path in changes['removed']:
+                self.remove_document(path)
+            for path in changes['added'] + changes['updated']:
+                self.add_document(path)
+            
+            if any(changes.values()):
+                self._ensure_fresh()
+                if self.use_index and not self.read_only and len(self.chunks):
+                    self._save_index()
+            return changes
+
+    def retrieve(self, query, k=3, namespace=None):
+        """Retrieves top k relevant chunks for the query, optionally only from one namespace."""
+        with self._lock:
+            self._ensure_fresh()
+            key = self._cache_key(query, k, namespace)
+            hits = self._cache_get(key)
+            if hits is None:
+                hits = self._search(query, k, namespace)
+                self._cache_put(key, hits)
+            # Hits are read-only views, so cached lists can be handed out as they are
+            return list(hits)
+    
+    def _hits(self, indices, scores):
+        return [RetrievalHit(self.chunks, int(i), float(s)) for i, s in zip(indices, scores)]
+    
+    def _search(self, query, k, namespace=None):
+        if len(self.chunks) == 0 or (self.tfidf_matrix is None and self.bm25 is None):
             return []
+        if self.engine == 'bm25':
+            return self._hits(*self.bm25.search(query, k, rows_mask=self._mask(namespace)))
+        if self.engine in ('lsa', 'hybrid'):
+            return self._search_dense(self.vectorizer.transform([query]), k, namespace)[0]
+        rows, matrix = self._matrix(namespace)
             
         query_vec = self.vectorizer.transform([query])
         
         # Calculate cosine similarity
-        similarities = cosine_similarity(query_vec, self.tfidf_matrix).flatten()
+        similarities = cosine_similarity(query_vec, matrix).flatten()
         
         # Get top k indices
         if k >= len(similarities):
@@ -66,18 +421,92 @@ class MinimalRAG:
         else:
             top_indices = np.argsort(similarities)[-k:][::-1]
             
+        top_indices = top_indices[similarities[top_indices] > self.MIN_SCORE]
+        return self._hits(top_indices if rows is None else rows[top_indices], similarities[top_indices])
+
+    def retrieve_many(self, queries, k=3, namespace=None):
+        """
+        retrieve() for a list of queries: returns one result list per query.
+
+        All queries are vectorized in one call and scored with one sparse product against the
+        chunk matrix (TF-IDF rows are L2-normalized, so the dot product is the cosine similarity);
+        top-k per row comes from argpartition instead of a full sort. Only queries missing
+        from the cache are scored, each distinct one once.
+        """
+        with self._lock:
+            self._ensure_fresh()
+            keys = [self._cache_key(q, k, namespace) for q in queries]
+            found = {}
+            todo = {}
+            for key, query in zip(keys, queries):
+                if key in found or key in todo:
+                    # Repeats within the batch are served from the first occurrence
+                    self.cache_hits += 1
+                    continue
+                hits = self._cache_get(key)
+                if hits is None:
+                    todo[key] = query
+                else:
+                    found[key] = hits
+            if todo:
+                for key, hits in zip(todo, self._search_many(list(todo.values()), k, namespace)):
+                    found[key] = hits
+                    self._cache_put(key, hits)
+            return [list(found[key]) for key in keys]
+    
+    def _search_many(self, queries, k, namespace=None):
+        if self.engine == 'bm25':
+            # Pruning works per query, so there is no shared matrix product to batch
+            return [self._search(q, k, namespace) for q in queries]
+        if len(self.chunks) == 0 or self.tfidf_matrix is None:
+            return [[] for _ in queries]
+        if self.engine in ('lsa', 'hybrid'):
+            return self._search_dense(self.vectorizer.transform(queries), k, namespace)
+        
+        rows, matrix = self._matrix(namespace)
+        query_matrix = self.vectorizer.transform(queries)
+        store = self.chunks
+        n_chunks = matrix.shape[0]
+        k = min(k, n_chunks)
+        results = []
+        for start in range(0, query_matrix.shape[0], self.QUERY_BLOCK):
+            scores = (query_matrix[start:start + self.QUERY_BLOCK] @ matrix.T).toarray()
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k] if k < n_chunks else \
+                np.tile(np.arange(n_chunks), (len(scores), 1))
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            # Highest score first, ties to the higher index as in retrieve()
+            order = np.lexsort((-top, -top_scores), axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            
+            if rows is not None:
+                top = rows[top]
+            for row_idx, row_scores in zip(top.tolist(), top_scores.tolist()):
+                results.append([RetrievalHit(store, i, s) for i, s in zip(row_idx, row_scores) if s > self.MIN_SCORE])
+        return results
+
+    def _search_dense(self, query_matrix, k, namespace=None):
+        """lsa / hybrid results for each row of a TF-IDF query matrix."""
+        lsa = self.lsa_index()
+        mask = self._mask(namespace)
         results = []
-        for idx in top_indices:
-            score = similarities[idx]
-            if score > 0.05: # Minimal threshold
-                results.append({
-                    'chunk': self.chunks[idx],
-                    'source': self.chunk_sources[idx],
-                    'score': float(score)
-                })
-                
+        for i, embedding in enumerate(lsa.embed(query_matrix)):
+            if self.engine == 'lsa':
+                ids, scores = lsa.search(embedding, k, rows_mask=mask)
+            else:
+                ids, scores = self._hybrid(lsa, query_matrix[i], embedding, k, mask)
+            results.append([h for h in self._hits(ids, scores) if h['score'] > self.MIN_SCORE])
         return results
 
+    def _hybrid(self, lsa, query_vec, embedding, k, mask):
+        # Both sides are scored on the probed IVF lists only, so a query never touches the whole corpus
+        ids = lsa.candidates(embedding)
+        if mask is not None:
+            ids = ids[mask[ids]]
+        sparse_scores = (self.tfidf_matrix[ids] @ query_vec.T).toarray().ravel()
+        scores = self.HYBRID_WEIGHT * lsa.scores(embedding, ids) + (1 - self.HYBRID_WEIGHT) * sparse_scores
+        return top_k(ids, scores, k)
+
 if __name__ == "__main__":
     # Test
     rag = MinimalRAG()
@@ -1,9 +1,12 @@
+import argparse
 import train_model
 import generate_strategy
 import generate_conversion_plan
 import time
+from llm_client import DEFAULT_MODEL, LLMClient
+from retrieval_system import MinimalRAG
 
-def main():
+def main(llm=None, cohorts=False):
     print("="*80)
     print("STARTING FULL WORKFLOW")
     print("="*80)
@@ -14,17 +17,20 @@ def main():
     train_model.train_xgboost_optuna()
     print(f"Training completed in {time.time() - start_train:.2f}s")
     
+    # One index over rag_docs, shared by both pipelines (each filters to its namespace)
+    rag = MinimalRAG()
+    
     # 2. Generate Retention Strategy (Lapse/Turn-around)
     print("\n[STEP 2] Generating Retention Strategies (using new model)...")
     try:
-        generate_strategy.main()
+        generate_strategy.main(rag, llm, cohorts)
     except Exception as e:
         print(f"Error in Strategy Generation: {e}")
         
     # 3. Generate Conversion Plans (New Leads)
     print("\n[STEP 3] Generating Conversion Plans...")
     try:
-        generate_conversion_plan.main()
+        generate_conversion_plan.main(rag, llm)
     except Exception as e:
         print(f"Error in Conversion Planning: {e}")
         
@@ -33,4 +39,15 @@ def main():
     print("="*80)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Train the model and generate retention and conversion plans.")
+    parser.add_argument('--llm-url', default=None,
+                        help="Chat completions base URL (e.g. https://api.openai.com or a local llm_stub_server.py); "
+                             "without it the plans are mocked")
+    parser.add_argument('--llm-model', default=DEFAULT_MODEL)
+    parser.add_argument('--llm-concurrency', type=int, default=16)
+    parser.add_argument('--cohorts', action='store_true',
+                        help="Generate a retention strategy for every policy, once per cohort of equivalent contexts")
+    args = parser.parse_args()
+    
+    llm = LLMClient(args.llm_url, args.llm_model, max_concurrency=args.llm_concurrency) if args.llm_url else None
+    main(llm, args.cohorts)
@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+import contextlib
+import math
+import time
+import numpy as np
+
+from async_http import json_handler
+from fast_scorer import MODEL_PATH, TRANSFORMER_PATH, FastScorer
+from generate_strategy import RETENTION_NAMESPACE, build_customer_context
+from retrieval_system import MinimalRAG
+from strategy_contract import CustomerContext
+from strategy_prompt import StrategyPromptBuilder
+
+class MicroBatcher:
+    """
+    Collects concurrent single-record requests into one batched call of
+    process_batch(records) -> list of results (one per record).
+
+    A batch is flushed when it reaches max_batch records or when the first record
+    in it has waited max_wait_ms, whichever comes first. If the batched call raises,
+    its records are retried one by one, so a bad record only fails its own request.
+    """
+    def __init__(self, process_batch, max_batch=64, max_wait_ms=2.0):
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.batches = 0
+        self.records = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def submit(self, record):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((record, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._process(batch)
+            self.batches += 1
+            self.records += len(batch)
+
+    async def _process(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            # Keep the event loop free to accept requests while the batch is processed
+            results = await loop.run_in_executor(None, self.process_batch, [record for record, _ in batch])
+        except Exception as e:
+            if len(batch) > 1:
+                for item in batch:
+                    await self._process([item])
+                return
+            results, error = None, e
+        for i, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if results is None:
+                future.set_exception(error)
+            else:
+                future.set_result(results[i])
+
+class ScoringService:
+    """
+    Keeps the model, feature transformer and RAG index resident and answers
+    per-policy requests with risk tier, retrieval hits and the built prompt.
+    """
+    def __init__(self, model_path=MODEL_PATH, transformer_path=TRANSFORMER_PATH, docs_dir='rag_docs', k=3,
+                 max_batch=64, max_wait_ms=2.0, prewarm=False, refresh_interval_s=None):
+        self.scorer = FastScorer.load(model_path, transformer_path)
+        self.transformer = self.scorer.transformer
+        # Raw string columns; every other model feature must be a number
+        self.string_features = [c for c in self.transformer.cat_cols if c not in self.transformer.bin_specs]
+        self.rag = MinimalRAG(docs_dir=docs_dir)
+        self.k = k
+        self.prewarm = prewarm
+        self.refresh_interval_s = refresh_interval_s
+        self._refresh_task = None
+        if prewarm:
+            self.warm()
+        self.batcher = MicroBatcher(self.process_batch, max_batch=max_batch, max_wait_ms=max_wait_ms)
+
+    def warm(self):
+        start = time.time()
+        n = self.rag.warm_cache(CustomerContext.query_space(), k=self.k, namespace=RETENTION_NAMESPACE)
+        print(f"Pre-warmed retrieval cache with {n} queries in {time.time() - start:.2f}s")
+
+    def score_records(self, records):
+        columns = {col: np.array([r[col] for r in records]) for col in self.transformer.features}
+        return self.scorer.score_many(columns)
+
+    def process_batch(self, records):
+        """One scoring call and one retrieval call for the whole micro-batch, then a prompt per record."""
+        contexts = [build_customer_context({**record, 'p_lapse_3_m': float(p_lapse)})
+                    for record, p_lapse in zip(records, self.score_records(records))]
+        all_hits = self.rag.retrieve_many([c.to_retrieval_query() for c in contexts], k=self.k,
+                                          namespace=RETENTION_NAMESPACE)
+        results = []
+        for context, hits in zip(contexts, all_hits):
+            results.append({
+                'policy_id': context.policy_id,
+                'p_lapse': context.p_lapse,
+                'risk_tier': context.risk_tier,
+                'retrieval': [{'source': h['source'], 'score': h['score']} for h in hits],
+                'messages': StrategyPromptBuilder.build_messages(context, hits),
+            })
+        return results
+
+    def validate_record(self, record):
+        """
+        The record with the model features (and call/claim counts, when given) coerced to the
+        types scoring expects; raises ValueError naming the missing or malformed fields.
+        """
+        missing = [c for c in self.transformer.features if c not in record]
+        if missing:
+            raise ValueError(f"Missing fields {missing}")
+        clean, invalid = dict(record), []
+        for col in self.transformer.features:
+            if col in self.string_features:
+                clean[col] = str(record[col])
+                continue
+            try:
+                value = float(record[col])
+            except (TypeError, ValueError):
+                value = math.nan
+            if math.isfinite(value):
+                clean[col] = value
+            else:
+                invalid.append(col)
+        for col in ('call_count', 'claim_count'):
+            if col in record:
+                try:
+                    clean[col] = int(float(record[col]))
+                except (TypeError, ValueError, OverflowError):
+                    invalid.append(col)
+        if invalid:
+            raise ValueError(f"Fields {invalid} must be finite numbers")
+        return clean
+
+    async def handle_score(self, record):
+        try:
+            record = self.validate_record(record)
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        return 200, await self.batcher.submit(record)
+
+    async def route(self, method, path, payload):
+        if path == '/health':
+            return 200, {'status': 'ok', 'batches': self.batcher.batches, 'records': self.batcher.records,
+                         'retrieval_cache': self.rag.cache_info()}
+        if path == '/score':
+            if method != 'POST':
+                return 405, {'error': "Use POST"}
+            if not isinstance(payload, dict):
+                return 400, {'error': "Body must be a JSON object with the policy fields"}
+            return await self.handle_score(payload)
+        return 404, {'error': f"Unknown path {path}"}
+
+    async def _refresh_loop(self):
+        """Picks up added, edited or removed playbooks without a restart."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.refresh_interval_s)
+            try:
+                changes = await loop.run_in_executor(None, self.rag.refresh)
+            except Exception as e:
+                print(f"RAG refresh failed: {e}")
+                continue
+            if any(changes.values()):
+                print(f"RAG index refreshed: {changes}")
+                if self.prewarm:
+                    # The refresh cleared the cache
+                    await loop.run_in_executor(None, self.warm)
+
+    async def start(self, host='127.0.0.1', port=8080, unix_path=None):
+        """Starts the batcher and the listening server; returns the asyncio server."""
+        self.batcher.start()
+        if self.refresh_interval_s:
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_loop())
+        handler = json_handler(self.route)
+        if unix_path:
+            return await asyncio.start_unix_server(handler, path=unix_path)
+        return await asyncio.start_server(handler, host, port)
+
+async def _serve_forever(service, host, port, unix_path):
+    server = await service.start(host, port, unix_path)
+    where = unix_path or f"http://{host}:{port}"
+    print(f"Scoring service listening on {where} (POST /score, GET /health)")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-lived lapse scoring service.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix', default=None, help="Listen on a Unix socket path instead of TCP")
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    parser.add_argument('--prewarm', action='store_true', help="Fill the retrieval cache with every templated query")
+    parser.add_argument('--refresh-interval', type=float, default=60.0,
+                        help="Seconds between checks of rag_docs for changed playbooks (0 disables)")
+    args = parser.parse_args()
+
+    start = time.time()
+    service = ScoringService(max_batch=args.max_batch, max_wait_ms=args.max_wait_ms, prewarm=args.prewarm,
+                             refresh_interval_s=args.refresh_interval)
+    print(f"Loaded model, transformer and RAG index in {time.time() - start:.2f}s")
+    asyncio.run(_serve_forever(service, args.host, args.port, args.unix))
@@ -0,0 +1,55 @@
+"""
+Cohort mode for the retention pipeline. Policies whose CustomerContext.cohort_key() is equal get
+the same retrieval query, snippets and strategy, so each cohort is retrieved for and generated
+once and the answer is fanned out to its members by filling in the [[field]] placeholders.
+"""
+from dataclasses import dataclass, field, replace
+from typing import List
+
+from strategy_contract import CustomerContext
+from strategy_prompt import StrategyPromptBuilder
+
+# Per-policy values a cohort strategy refers to as [[name]], and how each is rendered
+PLACEHOLDERS = {
+    'policy_id': lambda c: str(c.policy_id),
+    'p_lapse': lambda c: f"{c.p_lapse:.2f}",
+    'policy_age': lambda c: str(c.policy_age),
+    'premium_amount': lambda c: str(c.premium_amount),
+    'customer_calls': lambda c: str(c.customer_calls),
+    'claim_count': lambda c: str(c.claim_count),
+    'reason_codes': lambda c: StrategyPromptBuilder.format_reason_codes(c.reason_codes),
+}
+
+@dataclass
+class Cohort:
+    key: tuple
+    members: List[CustomerContext] = field(default_factory=list)
+
+    def representative(self) -> CustomerContext:
+        """
+        A member standing in for the cohort, with the mean p_lapse and premium. Its retrieval query
+        only differs from the members' in the printed probability (the mean stays within the tier).
+        """
+        n = len(self.members)
+        return replace(self.members[0], policy_id='[[policy_id]]',
+                       p_lapse=sum(c.p_lapse for c in self.members) / n,
+                       premium_amount=round(sum(c.premium_amount for c in self.members) / n, 2))
+
+def group_cohorts(contexts) -> List[Cohort]:
+    """Cohorts in order of first appearance."""
+    cohorts = {}
+    for context in contexts:
+        key = context.cohort_key()
+        cohort = cohorts.get(key)
+        if cohort is None:
+            cohort = cohorts[key] = Cohort(key)
+        cohort.members.append(context)
+    return list(cohorts.values())
+
+def fill_placeholders(text, context):
+    """A cohort strategy with the [[field]] placeholders replaced by one member's values."""
+    for name, render in PLACEHOLDERS.items():
+        placeholder = f"[[{name}]]"
+        if placeholder in text:
+            text = text.replace(placeholder, render(context))
+    return text
@@ -1,7 +1,9 @@
-from dataclasses import dataclass
-from typing import List, Optional, Dict
+import itertools
+from dataclasses import dataclass, fields
+from typing import List, Optional, Dict, Tuple
+import numpy as np
 
-@dataclass
+@dataclass(slots=True)
 class CustomerContext:
     """
     Compact feature snapshot for the customer at risk.
@@ -20,6 +22,26 @@ class CustomerContext:
     # Derived segments could go here
     risk_tier: str # 'Low', 'Medium', 'High'
 
+    # Top risk drivers: (feature, log-odds contribution) pairs, largest first (fast_scorer.top_reasons)
+    reason_codes: Tuple[tuple, ...] = ()
+
+    def months_to_renewal(self) -> int:
+        # Heuristic based on policy age, assuming annual policies renewing at 12, 24, 36 months
+        return 12 - (self.policy_age % 12)
+
+    def cohort_key(self) -> tuple:
+        """
+        The fields that decide the retrieval query and the shape of the strategy: risk tier,
+        payment status, renewal window (1 or 2 months out, else None), call (0, 1, 2+) and
+        claim (0, 1+) buckets and the top risk driver (None without reason codes). Policies with
+        equal keys only differ in values that are substituted into a shared strategy (see
+        strategy_cohorts.py).
+        """
+        months_to_renewal = self.months_to_renewal()
+        return (self.risk_tier, self.payment_status, months_to_renewal if months_to_renewal <= 2 else None,
+                min(self.customer_calls, 2), min(self.claim_count, 1),
+                self.reason_codes[0][0] if self.reason_codes else None)
+
     def to_retrieval_query(self) -> str:
         """
         Builds a short textual query from the customer snapshot for retrieval.
@@ -36,9 +58,8 @@ class CustomerContext:
         else:
             parts.append("payments up to date")
 
-        # Renewal context (heuristic based on policy age)
-        # Assuming annual policies, renewal at 12, 24, 36 months
-        months_to_renewal = 12 - (self.policy_age % 12)
+        # Renewal context
+        months_to_renewal = self.months_to_renewal()
         if months_to_renewal <= 2:
             parts.append(f"renewal in {months_to_renewal} months")
             parts.append("upcoming renewal intervention")
@@ -67,7 +88,96 @@ class CustomerContext:
         
         return ", ".join(parts)
 
+    @classmethod
+    def query_space(cls) -> List[str]:
+        """
+        Every distinct to_retrieval_query() output, for pre-warming the retrieval cache.
+        One representative per branch of the template, and every 2-decimal probability
+        (plus the values just below the tier cut-offs, which print as the cut-off).
+        """
+        probabilities = [p / 100 for p in range(101)] + [0.40 - 1e-9, 0.75 - 1e-9]
+        queries = set()
+        # policy_age 10 / 11 / 0 -> renewal in 2 / 1 / 12 months
+        for payment_status, policy_age, calls, claims, p_lapse in itertools.product(
+                ['Paid', 'Late', 'Missed'], [10, 11, 0], [0, 1, 2], [0, 1], probabilities):
+            context = cls(policy_id='', month='', policy_age=policy_age, premium_amount=0.0,
+                          payment_status=payment_status, customer_calls=calls, claim_count=claims,
+                          p_lapse=p_lapse, risk_tier='')
+            queries.add(context.to_retrieval_query())
+        return sorted(queries)
+
+def _cents(p):
+    """round(p * 100) as f"{p:.2f}" prints it; values within float error of a half cent are formatted."""
+    scaled = p * 100
+    cents = np.rint(scaled)
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    cents[near_half] = [round(float(f"{x:.2f}") * 100) for x in p[near_half]]
+    return cents.astype(np.int64)
+
 @dataclass
+class CustomerContextBatch:
+    """
+    Columnar CustomerContext: one array per field, a row per policy.
+
+    to_retrieval_queries() codes the branches of the query template as integer columns and
+    formats only one query per distinct code row (typically a few thousand for any number of
+    policies), and contexts() / batch[i] give CustomerContext objects where one is needed.
+    """
+    policy_id: np.ndarray
+    month: np.ndarray
+    policy_age: np.ndarray
+    premium_amount: np.ndarray
+    payment_status: np.ndarray
+    customer_calls: np.ndarray
+    claim_count: np.ndarray
+    p_lapse: np.ndarray
+    risk_tier: np.ndarray
+    reason_codes: np.ndarray  # object array of reason code tuples
+
+    def __len__(self):
+        return len(self.p_lapse)
+
+    def columns(self) -> List[np.ndarray]:
+        return [getattr(self, f.name) for f in fields(self)]
+
+    def __getitem__(self, i) -> CustomerContext:
+        return CustomerContext(*(column[i:i + 1].tolist()[0] for column in self.columns()))
+
+    def contexts(self):
+        """Yields a CustomerContext per row."""
+        for values in zip(*(column.tolist() for column in self.columns())):
+            yield CustomerContext(*values)
+
+    def select(self, mask) -> 'CustomerContextBatch':
+        """The rows where mask is True (or the given row indices)."""
+        return CustomerContextBatch(*(column[mask] for column in self.columns()))
+
+    def distinct_queries(self):
+        """
+        (queries, inverse): the distinct to_retrieval_query() outputs, and for every row the
+        index of its query. Retrieve for the distinct queries and fan out with inverse.
+        """
+        if not len(self):
+            return [], np.zeros(0, dtype=np.int64)
+        months_to_renewal = 12 - self.policy_age % 12
+        # Mixed-radix code of the template branches: payment (3), renewal (3), calls (3), claims (2), tier (3)
+        code = np.select([self.payment_status == 'Late', self.payment_status == 'Missed'], [1, 2], 0)
+        code = code * 3 + np.where(months_to_renewal <= 2, months_to_renewal, 0)
+        code = code * 3 + np.select([self.customer_calls > 1, self.customer_calls == 0], [2, 0], 1)
+        code = code * 2 + (self.claim_count > 0)
+        # Tier phrases use the raw probability, the printed one is rounded
+        code = code * 3 + np.searchsorted([0.40, 0.75], self.p_lapse, side='right')
+        cents = _cents(self.p_lapse)
+        cents -= cents.min()
+        code = code.astype(np.int64) * (cents.max() + 1) + cents
+        _, first, inverse = np.unique(code, return_index=True, return_inverse=True)
+        return [self[i].to_retrieval_query() for i in first], inverse
+
+    def to_retrieval_queries(self) -> List[str]:
+        queries, inverse = self.distinct_queries()
+        return [queries[j] for j in inverse.tolist()]
+
+@dataclass(slots=True)
 class RecommendedAction:
     """
     A single recommended action.
@@ -78,7 +188,7 @@ class RecommendedAction:
     cost_effort: str # e.g. "Low", "Medium"
     messaging_draft: Optional[str] = None
 
-@dataclass
+@dataclass(slots=True)
 class StrategyOutput:
     """
     Structured strategy object returned by the generator.
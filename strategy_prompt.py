@@ -1,7 +1,12 @@
-from strategy_contract import CustomerContext
+from chunker import fit_snippets
+from strategy_contract import CustomerContext, CustomerContextBatch
 import json
+import numpy as np
 
 class StrategyPromptBuilder:
+    # Default snippet budget (approximate tokens) for callers that retrieve more than they can fit
+    SNIPPET_TOKEN_BUDGET = 400
+
     SYSTEM_PROMPT = """You are a Retention Strategist for an insurance company. 
 Your goal is to generate a personalized retention strategy for a customer at risk of lapsing.
 
@@ -15,7 +20,7 @@ Rules:
     - p_lapse < 0.40 (Stable): Light-touch retention, value reminders, avoid aggressive discounts.
 """
 
-    USER_TEMPLATE = """
+    CONTEXT_TEMPLATE = """
 ### Customer Context
 - **Policy ID**: {policy_id}
 - **p_lapse**: {p_lapse:.2f} (Risk Tier: {risk_tier})
@@ -24,7 +29,27 @@ Rules:
 - **Payment Status**: {payment_status}
 - **Calls to Support**: {customer_calls}
 - **Recent Claims**: {claim_count}
+{risk_drivers}"""
+
+    # One prompt for a whole cohort: [[field]] placeholders are filled in per policy (strategy_cohorts.fill_placeholders)
+    COHORT_CONTEXT_TEMPLATE = """
+### Customer Cohort ({size} policies)
+Write one strategy that applies to every policy in this cohort. Values shown as [[field]] differ per policy
+and are filled in afterwards: copy them verbatim into message templates instead of inventing values.
+- **Policy ID**: [[policy_id]]
+- **p_lapse**: [[p_lapse]] (cohort range {p_min:.2f}-{p_max:.2f}, Risk Tier: {risk_tier})
+- **Policy Age**: [[policy_age]] months ({renewal})
+- **Premium**: $[[premium_amount]] (cohort range ${premium_min:.2f}-${premium_max:.2f})
+- **Payment Status**: {payment_status}
+- **Calls to Support**: [[customer_calls]] ({calls})
+- **Recent Claims**: [[claim_count]] ({claims})
+{risk_drivers}"""
+
+    # Printed only when the policy has reason codes, so prompts without them are unchanged
+    RISK_DRIVERS_LINE = "- **Top Risk Drivers** (model contributions, log-odds): {reason_codes}\n"
+    COHORT_RISK_DRIVERS_LINE = "- **Top Risk Drivers** (model contributions, log-odds): [[reason_codes]] (primary: {driver})\n"
 
+    INSTRUCTIONS_TEMPLATE = """
 ### Retrieved Playbook Snippets
 {rag_snippets}
 
@@ -53,6 +78,8 @@ Return a JSON object with the following structure:
 }}
 """
 
+    USER_TEMPLATE = CONTEXT_TEMPLATE + INSTRUCTIONS_TEMPLATE
+
     @staticmethod
     def determine_risk_tier(p_lapse):
         if p_lapse >= 0.75:
@@ -63,18 +90,38 @@ Return a JSON object with the following structure:
             return "Stable"
 
     @staticmethod
-    def build_messages(context: CustomerContext, rag_snippets: list[dict]) -> list[dict]:
+    def determine_risk_tiers(p_lapse):
+        """determine_risk_tier() for an array of probabilities."""
+        return np.array(["Stable", "Watchlist", "Critical"])[np.searchsorted([0.40, 0.75], p_lapse, side='right')]
+
+    @staticmethod
+    def format_reason_codes(reason_codes):
+        """'premium (+0.34), dependents (+0.20)' for a policy's reason codes."""
+        return ", ".join(f"{feature} ({value:+.2f})" for feature, value in reason_codes)
+
+    @staticmethod
+    def _risk_drivers(reason_codes):
+        if not reason_codes:
+            return ""
+        return StrategyPromptBuilder.RISK_DRIVERS_LINE.format(
+            reason_codes=StrategyPromptBuilder.format_reason_codes(reason_codes))
+
+    @staticmethod
+    def _format_snippets(rag_snippets):
+        return "\n\n".join(f"Snippet {i} (Source: {snippet['source']}):\n{snippet['chunk']}"
+                           for i, snippet in enumerate(rag_snippets, 1))
+
+    @staticmethod
+    def build_messages(context: CustomerContext, rag_snippets: list[dict], token_budget: int = None) -> list[dict]:
         """
         Constructs the messages for the LLM chat completion API.
+        With token_budget, only the best snippets that fit in that many tokens are included.
         """
+        if token_budget is not None:
+            rag_snippets = fit_snippets(rag_snippets, token_budget)
         risk_tier = StrategyPromptBuilder.determine_risk_tier(context.p_lapse)
         
-        # Format snippets
-        formatted_snippets = []
-        for i, snippet in enumerate(rag_snippets, 1):
-            formatted_snippets.append(f"Snippet {i} (Source: {snippet['source']}):\n{snippet['chunk']}")
-        
-        rag_text = "\n\n".join(formatted_snippets)
+        rag_text = StrategyPromptBuilder._format_snippets(rag_snippets)
         
         user_content = StrategyPromptBuilder.USER_TEMPLATE.format(
             policy_id=context.policy_id,
@@ -85,6 +132,7 @@ Return a JSON object with the following structure:
             payment_status=context.payment_status,
             customer_calls=context.customer_calls,
             claim_count=context.claim_count,
+            risk_drivers=StrategyPromptBuilder._risk_drivers(context.reason_codes),
             rag_snippets=rag_text
         )
         
@@ -92,3 +140,69 @@ Return a JSON object with the following structure:
             {"role": "system", "content": StrategyPromptBuilder.SYSTEM_PROMPT},
             {"role": "user", "content": user_content}
         ]
+
+    @staticmethod
+    def build_messages_many(batch: CustomerContextBatch, all_rag_snippets: list[list], token_budget: int = None):
+        """
+        build_messages() for every row of a CustomerContextBatch, yielding one messages list per row.
+        Snippet lists shared between rows (as retrieve_many fan-out produces) are fitted and formatted once.
+        """
+        formatted = {}
+        risk_tiers = StrategyPromptBuilder.determine_risk_tiers(batch.p_lapse).tolist()
+        columns = zip(batch.policy_id.tolist(), batch.p_lapse.tolist(), risk_tiers, batch.policy_age.tolist(),
+                      batch.premium_amount.tolist(), batch.payment_status.tolist(), batch.customer_calls.tolist(),
+                      batch.claim_count.tolist(), batch.reason_codes.tolist())
+        for (policy_id, p_lapse, risk_tier, policy_age, premium_amount, payment_status, customer_calls,
+             claim_count, reason_codes), rag_snippets in zip(columns, all_rag_snippets):
+            cached = formatted.get(id(rag_snippets))
+            if cached is None:
+                fitted = rag_snippets if token_budget is None else fit_snippets(rag_snippets, token_budget)
+                # The snippet list is kept alongside so its id() is not reused while cached
+                cached = formatted[id(rag_snippets)] = (rag_snippets, StrategyPromptBuilder._format_snippets(fitted))
+            user_content = StrategyPromptBuilder.USER_TEMPLATE.format(
+                policy_id=policy_id,
+                p_lapse=p_lapse,
+                risk_tier=risk_tier,
+                policy_age=policy_age,
+                premium_amount=premium_amount,
+                payment_status=payment_status,
+                customer_calls=customer_calls,
+                claim_count=claim_count,
+                risk_drivers=StrategyPromptBuilder._risk_drivers(reason_codes),
+                rag_snippets=cached[1]
+            )
+            yield [
+                {"role": "system", "content": StrategyPromptBuilder.SYSTEM_PROMPT},
+                {"role": "user", "content": user_content}
+            ]
+
+    @staticmethod
+    def build_cohort_messages(cohort, rag_snippets: list[dict], token_budget: int = None) -> list[dict]:
+        """
+        Messages for one strategy_cohorts.Cohort: the cohort's shared fields and value ranges,
+        with [[field]] placeholders where the members differ.
+        """
+        if token_budget is not None:
+            rag_snippets = fit_snippets(rag_snippets, token_budget)
+        risk_tier, payment_status, renewal, calls, claims, driver = cohort.key
+        members = cohort.members
+        cohort_context = StrategyPromptBuilder.COHORT_CONTEXT_TEMPLATE.format(
+            size=len(members),
+            p_min=min(c.p_lapse for c in members),
+            p_max=max(c.p_lapse for c in members),
+            risk_tier=risk_tier,
+            renewal=f"renewal in {renewal} months" if renewal else "no renewal within 2 months",
+            premium_min=min(c.premium_amount for c in members),
+            premium_max=max(c.premium_amount for c in members),
+            payment_status=payment_status,
+            calls=["no calls", "1 call", "2+ calls"][calls],
+            claims=["no claims", "1+ claims"][claims],
+            risk_drivers=StrategyPromptBuilder.COHORT_RISK_DRIVERS_LINE.format(driver=driver) if driver else "",
+        )
+        rag_text = StrategyPromptBuilder._format_snippets(rag_snippets)
+        user_content = cohort_context + StrategyPromptBuilder.INSTRUCTIONS_TEMPLATE.format(rag_snippets=rag_text)
+        
+        return [
+            {"role": "system", "content": StrategyPromptBuilder.SYSTEM_PROMPT},
+            {"role": "user", "content": user_content}
+        ]
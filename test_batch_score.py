@@ -0,0 +1,23 @@
+import pandas as pd
+import pytest
+
+from batch_score import batch_score, read_scores
+
+def test_rerun_replaces_previous_parts(tmp_path, model_paths):
+    paths = {**model_paths, 'output_format': 'npz'}
+    out = tmp_path / 'scores'
+    n_rows = len(pd.read_csv('data/test_gpt.csv'))
+
+    batch_score('data/test_gpt.csv', out, chunk_size=500, n_workers=1, **paths)
+    with pytest.raises(FileExistsError):
+        batch_score('data/test_gpt.csv', out, chunk_size=3000, n_workers=1, **paths)
+    # Fewer, larger chunks: the 8 parts of the first run must not survive
+    batch_score('data/test_gpt.csv', out, chunk_size=3000, n_workers=1, overwrite=True, **paths)
+    assert len(read_scores(out)) == n_rows
+    assert [p.name for p in tmp_path.iterdir() if '.tmp' in p.name] == []
+
+    # Anything besides earlier partitions is never deleted
+    (out / 'notes.txt').write_text("keep me")
+    with pytest.raises(FileExistsError):
+        batch_score('data/test_gpt.csv', out, chunk_size=3000, n_workers=1, overwrite=True, **paths)
+    assert (out / 'notes.txt').exists() and len(read_scores(out)) == n_rows
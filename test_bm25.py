@@ -0,0 +1,26 @@
+import numpy as np
+
+from bm25 import BM25Index
+from retrieval_system import MinimalRAG
+
+def test_maxscore_pruning_matches_exhaustive_search():
+    rng = np.random.default_rng(0)
+    terms = np.array([f"term{i}" for i in range(2000)])
+    sample = lambda n: terms[np.minimum(rng.zipf(1.2, n), len(terms)) - 1]
+    chunks = [' '.join(sample(rng.integers(20, 80))) for _ in range(3000)]
+    index = BM25Index.from_chunks(chunks)
+
+    for _ in range(200):
+        query = ' '.join(sample(rng.integers(1, 6)))
+        full_ids, full_scores = index.search(query, k=5, prune=False)
+        ids, scores = index.search(query, k=5)
+        assert np.allclose(scores, full_scores, rtol=1e-5)
+        assert np.array_equal(ids, full_ids)
+
+def test_bm25_engine_keeps_retrieve_contract():
+    rag = MinimalRAG(engine='bm25', use_index=False)
+    hits = rag.retrieve("customer missed payment needs extension", k=2)
+    assert len(hits) == 2 and hits[0]['source'] == '[Doc1]'
+    assert set(hits[0]) == {'chunk', 'source', 'score'} and hits[0]['score'] >= hits[1]['score']
+    assert rag.retrieve_many(["customer missed payment needs extension"], k=2) == [hits]
+    assert rag.retrieve("qwertyuiop", k=2) == []
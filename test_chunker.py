@@ -0,0 +1,40 @@
+from chunker import Chunker, count_tokens, fit_snippets, simhash
+
+def test_chunks_stay_in_token_range(tmp_path):
+    paragraphs = ["# Heading", ' '.join(f"w{i}" for i in range(700)), "Short note.",
+                  ' '.join(["Another ordinary paragraph"] * 8), "Tail."]
+    doc = tmp_path / 'long.md'
+    doc.write_text('\n\n'.join(paragraphs), encoding='utf-8')
+
+    chunks = list(Chunker(min_tokens=20, max_tokens=256).chunk_file(doc))
+    assert all(20 <= n <= 256 and n == count_tokens(text) for text, n in chunks)
+    assert chunks[0][0].startswith("# Heading\n\nw0 w1") and chunks[-1][0].endswith("Tail.")
+    assert sum(n for _, n in chunks) == sum(count_tokens(p) for p in paragraphs)
+
+    overlapped = list(Chunker(min_tokens=20, max_tokens=256, overlap=16).chunk_file(doc))
+    assert all(n <= 256 and n == count_tokens(text) for text, n in overlapped)
+    assert overlapped[1][0].startswith(' '.join(overlapped[0][0].split()[-16:]))
+
+def test_short_paragraphs_packed_up_to_max_tokens():
+    paragraphs = [' '.join(f"p{i}w{j}" for j in range(30)) for i in range(10)]
+    chunks = list(Chunker(min_tokens=20, max_tokens=256).chunks(paragraphs))
+    assert [n for _, n in chunks] == [240, 60]
+    assert chunks[0][0] == '\n\n'.join(paragraphs[:8])
+
+    eight = [' '.join(f"p{i}w{j}" for j in range(8)) for i in range(40)]
+    assert [n for _, n in Chunker(min_tokens=20, max_tokens=256).chunks(eight)] == [256, 64]
+
+def test_near_duplicates_dropped():
+    base = ' '.join(["Agents can authorize a one-time 10-day extension beyond the grace period for hardship cases"] * 2)
+    near = base.replace("hardship", "Hardship") + "!"
+    other = ' '.join(["Smokers who complete the cessation program get a premium review after twelve months"] * 2)
+    assert bin(simhash(base) ^ simhash(near)).count('1') <= 3
+    # max_tokens keeps each paragraph in a chunk of its own
+    chunker = Chunker(min_tokens=5, max_tokens=40)
+    assert [text for text, _ in chunker.chunks([base, near, other])] == [base, other]
+    assert chunker.duplicates_dropped == 1
+
+def test_fit_snippets():
+    snippets = [{'chunk': "a " * 50}, {'chunk': "b " * 80}, {'chunk': "c " * 20}]
+    assert fit_snippets(snippets, 100) == [snippets[0], snippets[2]]
+    assert fit_snippets(snippets, 10) == []
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from conversion_contract import ConversionContextBatch
+from conversion_prompt import ConversionPromptBuilder
+from generate_strategy import build_context_batch, build_customer_context
+from strategy_prompt import StrategyPromptBuilder
+
+def test_strategy_batch_matches_single_contexts():
+    rng = np.random.default_rng(0)
+    n = 3000
+    df = pd.DataFrame({
+        'policy_id': [f"P{i}" for i in range(n)], 'month': '2023-12', 'age': rng.integers(18, 80, n),
+        'premium': rng.uniform(50, 400, n).round(2), 'payment_status': rng.choice(['Paid', 'Late', 'Missed'], n),
+        'call_count': rng.integers(0, 4, n), 'claim_count': rng.integers(0, 3, n),
+        # Cut-offs and values that round to them
+        'p_lapse_3_m': np.concatenate([[0.40, 0.75, 0.745, 0.3999999, 0.005, 0.995], rng.random(n - 6)]),
+    })
+    contexts = [build_customer_context(row) for row in df.to_dict('records')]
+    batch = build_context_batch(df)
+    assert list(batch.contexts()) == contexts and batch[7] == contexts[7]
+    assert batch.to_retrieval_queries() == [c.to_retrieval_query() for c in contexts]
+
+    hits = [[{'source': 'a.md', 'chunk': "Call them."}, {'source': 'b.md', 'chunk': "word " * 300}]] * n
+    assert list(StrategyPromptBuilder.build_messages_many(batch, hits, token_budget=100)) == \
+        [StrategyPromptBuilder.build_messages(c, h, token_budget=100) for c, h in zip(contexts, hits)]
+
+def test_conversion_batch_matches_single_contexts():
+    column = lambda values: np.array(values, dtype=object)
+    batch = ConversionContextBatch(policy_id=column(['L1', 'L2', 'L3', 'L4']), age=np.array([25, 40, 61, 33]),
+                                   region=column(['south'] * 4), channel=column(['Email', 'Phone', 'Email', 'Email']),
+                                   needs=column(['Budget', 'Family', 'Budget', 'Budget']),
+                                   objections=column(['Price', 'Trust', 'Price', '']), premium=np.array([90.0, 200.0, 120.0, 80.0]))
+    queries, inverse = batch.distinct_queries()
+    assert len(queries) == 3 and inverse[0] == inverse[2]
+    contexts = list(batch.contexts())
+    assert batch.to_retrieval_queries() == [c.to_retrieval_query() for c in contexts]
+    hits = [[{'source': 'a.md', 'chunk': "Acknowledge."}]] * 4
+    assert list(ConversionPromptBuilder.build_messages_many(batch, hits)) == \
+        [ConversionPromptBuilder.build_messages(c, h) for c, h in zip(contexts, hits)]
@@ -0,0 +1,48 @@
+import json
+import shutil
+
+import pandas as pd
+
+from export_conversion_prompts import export_conversion_prompts
+from export_prompts import export_prompts, request_id
+from fast_scorer import FastScorer
+from generate_conversion_plan import OBJECTIONS, infer_contexts
+from retrieval_system import MinimalRAG
+
+def test_export_writes_sharded_batch_requests(tmp_path, model_and_transformer):
+    scorer, rag = FastScorer(*model_and_transformer), MinimalRAG(use_index=False)
+    policies = pd.read_csv('data/test_gpt.csv')
+    p_lapse = scorer.score_many(policies)
+
+    stats = export_prompts('data/test_gpt.csv', tmp_path / 'run1', scorer=scorer, rag=rag,
+                           tiers=('Critical', 'Watchlist'), chunk_size=700, shard_size=400)
+    expected = policies[p_lapse >= 0.40]
+    assert stats['policies'] == len(policies) and stats['prompts'] == len(expected)
+    assert len(stats['shards']) == -(-len(expected) // 400)
+
+    lines = [json.loads(line) for path in stats['shards'] for line in open(path, encoding='utf-8')]
+    assert [r['custom_id'] for r in lines] == [request_id(p, m) for p, m in zip(expected.policy_id, expected.month)]
+    assert all(r['url'] == '/v1/chat/completions' and r['body']['messages'][0]['role'] == 'system' for r in lines)
+
+    # Same input, same request ids and prompts
+    again = export_prompts('data/test_gpt.csv', tmp_path / 'run2', scorer=scorer, rag=rag, shard_size=400)
+    assert [open(p, encoding='utf-8').read() for p in again['shards']] == \
+        [open(p, encoding='utf-8').read() for p in stats['shards']]
+
+def test_conversion_export_is_reproducible_across_workers(tmp_path):
+    leads = pd.read_csv('data/test_gpt.csv')
+    channel, needs, objections = infer_contexts(leads, rng=7)
+    assert list(objections) == list(infer_contexts(leads, rng=7)[2])
+    assert set(objections[leads.premium.to_numpy() <= 150]) <= set(OBJECTIONS)
+    assert list(channel) == ['Phone' if a else 'Email' for a in leads.has_agent]
+
+    # Start from no saved index: it is built once before the workers load it
+    docs_dir = str(tmp_path / 'docs')
+    shutil.copytree('rag_docs', docs_dir, ignore=shutil.ignore_patterns('.rag_index*'))
+    two = export_conversion_prompts('data/test_gpt.csv', tmp_path / 'two', chunk_size=1500, n_workers=2,
+                                    docs_dir=docs_dir)
+    one = export_conversion_prompts('data/test_gpt.csv', tmp_path / 'one', chunk_size=1500, n_workers=1,
+                                    docs_dir=docs_dir)
+    assert one['leads'] == two['leads'] == len(leads)
+    read = lambda d: [open(p, encoding='utf-8').read() for p in sorted(d.iterdir())]
+    assert len(read(tmp_path / 'one')) == 3 and read(tmp_path / 'one') == read(tmp_path / 'two')
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from fast_scorer import FastScorer, LookupTable
+from generate_strategy import prepare_and_score_data
+
+def test_fast_paths_match_scoring_pipeline(fitted_models):
+    transformer, models = fitted_models()
+    for model in models:
+        expected = prepare_and_score_data('data/test_gpt.csv', model, transformer)
+        scorer = FastScorer(model, transformer)
+        
+        many = scorer.score_many({c: expected[c].to_numpy() for c in transformer.features})
+        few = scorer.score_many(expected.head(5))
+        one = [scorer.score_one(r) for r in expected.head(500).to_dict('records')]
+        
+        assert np.allclose(many, expected['p_lapse_3_m'], atol=1e-6)
+        assert np.allclose(few, expected['p_lapse_3_m'].head(5), atol=1e-6)
+        assert np.allclose(one, expected['p_lapse_3_m'].head(500), atol=1e-6)
+
+def test_lookup_table_matches_model(tmp_path, fitted_models):
+    transformer, models = fitted_models(bin_coverage=True)
+    test = pd.read_csv('data/test_gpt.csv')
+    # Unseen region (unknown code) and out-of-domain dependents (model fallback)
+    test.loc[:9, 'region'] = 'unseen'
+    test.loc[10:19, 'dependents'] = 9
+    domains = {'has_agent': [0, 1], 'is_smoker': [0, 1], 'dependents': range(6)}
+    for model in models:
+        scorer = FastScorer(model, transformer)
+        LookupTable.build(scorer, domains).save(tmp_path / 'lut.npz')
+        table_scorer = FastScorer(model, transformer, LookupTable.load(tmp_path / 'lut.npz'))
+        
+        assert np.allclose(table_scorer.score_many(test), scorer.score_many(test), atol=1e-6)
+
+def test_reason_codes_come_from_the_scoring_call(fitted_models):
+    transformer, models = fitted_models()
+    test = pd.read_csv('data/test_gpt.csv')
+    for model in models:
+        expected = prepare_and_score_data('data/test_gpt.csv', model, transformer)
+        explained = prepare_and_score_data('data/test_gpt.csv', model, transformer, reason_codes=True)
+        scorer = FastScorer(model, transformer)
+        p_lapse, reason_codes = scorer.explain_many(test, top_n=3)
+        contribs = scorer.contributions_encoded(transformer.transform_arrays(test))
+        
+        # predict_proba is the reference for both the explain_many probabilities and the scoring option
+        assert np.allclose(p_lapse, expected['p_lapse_3_m'], atol=1e-6)
+        assert np.allclose(explained['p_lapse_3_m'], expected['p_lapse_3_m'], atol=1e-6)
+        assert list(explained['reason_codes']) == reason_codes
+        for row, reasons in zip(contribs[:200], reason_codes[:200]):
+            expected = sorted(((f, c) for f, c in zip(transformer.features, row[:-1]) if c > 0), key=lambda r: -r[1])[:3]
+            assert [f for f, _ in reasons] == [f for f, _ in expected]
+            assert np.allclose([c for _, c in reasons], [c for _, c in expected], atol=1e-4)
@@ -0,0 +1,31 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import train_model
+
+def test_cache_round_trip(tmp_path):
+    fresh = train_model.prepare_datasets(verbose=False, use_cache=False)
+    train_model.prepare_datasets(verbose=False, cache_dir=str(tmp_path))  # miss: builds the entry
+    cached = train_model.prepare_datasets(verbose=False, cache_dir=str(tmp_path))  # hit: memory-mapped
+    
+    assert cached['features'] == fresh['features']
+    for name in ['X_train', 'X_val', 'test']:
+        for col in fresh[name].columns:
+            assert cached[name][col].dtype == fresh[name][col].dtype
+            assert np.array_equal(np.asarray(cached[name][col]), np.asarray(fresh[name][col]))
+
+def _cached_features(cache_dir):
+    return train_model.prepare_datasets(verbose=False, cache_dir=cache_dir)['X_train'].to_numpy().sum()
+
+def test_concurrent_misses_publish_one_entry(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    with ProcessPoolExecutor(4) as pool:
+        sums = list(pool.map(_cached_features, [cache_dir] * 4))
+    assert len(set(sums)) == 1
+    assert len(os.listdir(cache_dir)) == 1 and '.tmp' not in os.listdir(cache_dir)[0]
+
+if __name__ == "__main__":
+    import tempfile
+    with tempfile.TemporaryDirectory() as d:
+        test_cache_round_trip(__import__('pathlib').Path(d))
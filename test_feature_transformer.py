@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import OrdinalEncoder
+
+import train_model
+from feature_transformer import FeatureTransformer
+
+def test_matches_pandas_binning_and_ordinal_encoder():
+    train = pd.read_csv('data/train_gpt.csv')
+    test = pd.read_csv('data/test_gpt.csv')
+    # Edge cases: bin boundaries, out-of-range values and an unseen region
+    test.loc[0, ['age', 'premium', 'tenure_m']] = [30, 0, -1]
+    test.loc[1, ['age', 'premium', 'tenure_m', 'region']] = [151, 10001, 48, 'mars']
+    features = [c for c in train.columns if c not in train_model.DROP_COLS]
+    
+    def binned(df):
+        df = df.copy()
+        for col, spec in train_model.BIN_SPECS.items():
+            df[col] = pd.cut(df[col], bins=spec['bins'], labels=spec['labels'], right=True)
+        return df
+    
+    cols = train_model.CAT_COLS
+    encoder = OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1)
+    encoder.fit(binned(train)[cols])
+    expected = binned(test)[features]
+    expected[cols] = encoder.transform(expected[cols])
+    
+    transformer = FeatureTransformer(train_model.BIN_SPECS, cols).fit(train, features)
+    arrays = {c: test[c].to_numpy() for c in features}
+    
+    assert np.array_equal(transformer.transform(test).to_numpy(dtype=np.float64), expected.to_numpy(dtype=np.float64))
+    assert np.array_equal(transformer.transform_arrays(arrays), expected.to_numpy(dtype=np.float64))
+
+if __name__ == "__main__":
+    test_matches_pandas_binning_and_ordinal_encoder()
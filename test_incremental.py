@@ -0,0 +1,32 @@
+import shutil
+
+import joblib
+import optuna
+import pandas as pd
+
+import train_model
+
+def test_degraded_refresh_runs_a_fresh_retune(tmp_path, monkeypatch):
+    shutil.copytree('data', tmp_path / 'data')
+    monkeypatch.chdir(tmp_path)
+    storage = f"sqlite:///{tmp_path / 'study.db'}"
+    tuning = dict(n_trials=2, storage=storage, study_name='lapse_xgb', use_cache=False, shap_sample=200)
+    train_model.train_xgboost_optuna(**tuning)
+    main_scored = (tmp_path / 'data' / 'test_scored.csv').read_bytes()
+
+    # An unreachable reference forces the degradation branch
+    model = joblib.load(train_model.MODEL_PATH)
+    model.get_booster().set_attr(val_auc_pr='1.0')
+    joblib.dump(model, train_model.MODEL_PATH)
+    test = pd.read_csv('data/test_gpt.csv')
+    new = pd.concat([test.assign(month='2024-01'), test.assign(month='2024-02')])
+    new.to_csv('new_months.csv', index=False)
+
+    retuned = train_model.incremental_update('new_months.csv', **tuning)
+
+    # The old study already holds n_trials trials; the re-tune must run its own
+    study = optuna.load_study(study_name='lapse_xgb-retune-2024-02', storage=storage)
+    assert len(study.get_trials(states=(optuna.trial.TrialState.COMPLETE,))) == 2
+    assert retuned.get_booster().attributes()['seen_through'] == '2024-02'
+    assert (tmp_path / 'data' / 'retune-2024-02' / 'test_scored.csv').exists()
+    assert (tmp_path / 'data' / 'test_scored.csv').read_bytes() == main_scored
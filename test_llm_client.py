@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+from async_http import _read_message
+from llm_client import LLMClient, response_text
+from llm_stub_server import StubChatServer
+
+def _run(stub, client_kwargs, messages_list):
+    async def run():
+        server = await stub.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        llm = LLMClient(f"http://127.0.0.1:{port}", requests_per_min=600_000, tokens_per_min=10**9,
+                        backoff_s=0.01, **client_kwargs)
+        try:
+            return llm, await llm.complete_many(messages_list)
+        finally:
+            await llm.aclose()
+            server.close()
+            await server.wait_closed()
+    return asyncio.run(run())
+
+def test_bounded_concurrency_and_retries(tmp_path):
+    stub = StubChatServer(latency_ms=20, jitter_ms=5, error_rate=0.2)
+    prompts = [[{'role': 'user', 'content': f"Plan for P{i}"}] for i in range(40)]
+    llm, responses = _run(stub, {'max_concurrency': 4, 'cache_dir': tmp_path}, prompts)
+    assert [f"Plan for P{i}" in response_text(r) for i, r in enumerate(responses)] == [True] * 40
+    assert stub.max_in_flight <= 4
+    assert llm.stats['retries'] > 0 and llm.stats['failures'] == 0
+    assert llm.stats['requests'] == stub.requests == 40 + llm.stats['retries']
+
+def test_cached_responses_skip_the_endpoint(tmp_path):
+    prompts = [[{'role': 'user', 'content': "Plan for P1"}], [{'role': 'user', 'content': "Plan for P2"}]]
+    _, first = _run(StubChatServer(latency_ms=1, jitter_ms=0), {'cache_dir': tmp_path}, prompts)
+    stub = StubChatServer(latency_ms=1, jitter_ms=0)
+    llm, second = _run(stub, {'cache_dir': tmp_path}, prompts)
+    assert second == first and stub.requests == 0 and llm.stats['cache_hits'] == 2
+
+def test_chunked_responses_are_decoded():
+    stub = StubChatServer(latency_ms=0, jitter_ms=0)
+
+    async def on_connection(reader, writer):
+        # Answer like a hosted API: the stub's completion with Transfer-Encoding: chunked
+        while (message := await _read_message(reader)) is not None:
+            _, completion = await stub.route('POST', '/v1/chat/completions', json.loads(message[2]))
+            body = json.dumps(completion).encode()
+            parts = [body[i:i + 7] for i in range(0, len(body), 7)]
+            chunks = b''.join(b'%x;ext=1\r\n%s\r\n' % (len(part), part) for part in parts)
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nTransfer-Encoding: chunked\r\n\r\n'
+                         + chunks + b'0\r\nX-Trailer: done\r\n\r\n')
+            await writer.drain()
+        writer.close()
+
+    async def run():
+        server = await asyncio.start_server(on_connection, '127.0.0.1', 0)
+        llm = LLMClient(f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}", max_concurrency=1, cache_dir=None)
+        try:
+            return await llm.complete_many([[{'role': 'user', 'content': f"Plan for P{i}"}] for i in range(3)])
+        finally:
+            await llm.aclose()
+            server.close()
+            await server.wait_closed()
+
+    responses = asyncio.run(run())
+    assert [f"Plan for P{i}" in response_text(r) for i, r in enumerate(responses)] == [True] * 3
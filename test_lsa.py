@@ -0,0 +1,49 @@
+import shutil
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from lsa import LSAIndex
+from retrieval_system import MinimalRAG
+
+def test_ivf_search_matches_exact_search(tmp_path):
+    rng = np.random.default_rng(0)
+    topics = [[f"t{topic}w{i}" for i in range(40)] for topic in range(20)]
+    chunks = [' '.join(rng.choice(topics[rng.integers(20)], 30)) for _ in range(5000)]
+    vectorizer = TfidfVectorizer()
+    lsa = LSAIndex.fit(vectorizer.fit_transform(chunks), n_components=32)
+    assert lsa.n_lists > 1 and lsa.embeddings.dtype == np.float32
+
+    queries = lsa.embed(vectorizer.transform([' '.join(rng.choice(t, 4)) for t in topics]))
+    recall = []
+    for q in queries:
+        exact_ids, exact_scores = lsa.search(q, k=10, nprobe=lsa.n_lists)
+        brute = np.argsort(-(lsa.embeddings @ q), kind='stable')[:10]
+        assert np.allclose(exact_scores, (lsa.embeddings @ q)[brute], atol=1e-6)
+        recall.append(len(np.intersect1d(lsa.search(q, k=10)[0], exact_ids)) / 10)
+    assert np.mean(recall) >= 0.9
+
+    lsa.save(tmp_path / 'lsa.npz')
+    loaded = LSAIndex.load(tmp_path / 'lsa.npz')
+    assert np.array_equal(loaded.search(queries[0])[0], lsa.search(queries[0])[0])
+
+def test_lsa_and_hybrid_engines_keep_retrieve_contract(tmp_path):
+    docs_dir = tmp_path / 'docs'
+    shutil.copytree('rag_docs', docs_dir, ignore=shutil.ignore_patterns('.rag_index'))
+    query = "customer missed payment needs extension"
+    for engine in ('lsa', 'hybrid'):
+        rag = MinimalRAG(docs_dir=str(docs_dir), engine=engine)
+        hits = rag.retrieve(query, k=2)
+        # One chunk per playbook: the latent space only ranks Doc1 among the top two
+        assert len(hits) == 2 and '[Doc1]' in {h['source'] for h in hits} and hits[0]['score'] >= hits[1]['score']
+        assert rag.retrieve_many([query], k=2) == [hits]
+        assert rag.retrieve("qwertyuiop", k=2) == []
+        leads = {c for c, n in zip(rag.chunks, rag.chunk_namespaces) if n == 'leads'}
+        assert all(h['chunk'] in leads for h in rag.retrieve("price objection", 3, namespace='leads'))
+
+    # The fitted model is saved with the index and reused while the chunks are unchanged
+    saved = docs_dir / '.rag_index' / 'lsa.npz'
+    saved_at = saved.stat().st_mtime_ns
+    reloaded = MinimalRAG(docs_dir=str(docs_dir), engine='lsa')
+    assert reloaded.lsa_index().fingerprint == rag.lsa_index().fingerprint
+    assert saved.stat().st_mtime_ns == saved_at
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from outreach_queue import OutreachSelector
+from strategy_prompt import StrategyPromptBuilder
+
+def test_streaming_selection_matches_full_sort():
+    rng = np.random.default_rng(0)
+    n = 20_000
+    df = pd.DataFrame({'policy_id': np.arange(n), 'month': rng.choice(['2023-11', '2023-12'], n),
+                       'region': rng.choice(['north', 'south', 'east'], n), 'has_agent': rng.integers(0, 2, n),
+                       # Rounded, so there are ties to break by arrival order
+                       'p_lapse_3_m': rng.random(n).round(3)})
+    segments = ['month', 'region', 'has_agent']
+    full = df.assign(risk_tier=StrategyPromptBuilder.determine_risk_tiers(df.p_lapse_3_m.to_numpy()))
+    full = full[full.risk_tier != 'Stable'].sort_values('p_lapse_3_m', ascending=False, kind='stable')
+
+    for tier_quotas in (None, {'Watchlist': 2}):
+        selector = OutreachSelector(quota=5, segment_cols=segments, tier_quotas=tier_quotas)
+        for start in range(0, n, 3000):
+            selector.add(df.iloc[start:start + 3000])
+        queue = selector.queue()
+
+        expected = full
+        if tier_quotas:
+            expected = full[full.groupby(segments + ['risk_tier']).cumcount() < full.risk_tier.map({'Critical': 5, 'Watchlist': 2})]
+        expected = expected.groupby(segments).head(5)
+        assert sorted(queue.policy_id) == sorted(expected.policy_id)
+        assert queue.p_lapse_3_m.is_monotonic_decreasing and queue.segment_rank.max() == 5
+        assert (queue.groupby(segments).size() <= 5).all() and selector.n_segments == 12
@@ -0,0 +1,141 @@
+import builtins
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from chunk_store import RetrievalHit
+from retrieval_system import MinimalRAG
+from strategy_contract import CustomerContext
+
+QUERY = "customer missed payment needs extension"
+
+def test_saved_index_reused_until_documents_change(tmp_path, monkeypatch):
+    docs_dir = tmp_path / 'docs'
+    shutil.copytree('rag_docs/lapse', docs_dir)
+    built = MinimalRAG(docs_dir=str(docs_dir))
+
+    # Unchanged documents: the index is loaded without opening any of them
+    real_open = builtins.open
+    def guarded_open(path, *args, **kwargs):
+        assert not str(path).endswith('.md'), f"opened {path}"
+        return real_open(path, *args, **kwargs)
+    monkeypatch.setattr(builtins, 'open', guarded_open)
+    loaded = MinimalRAG(docs_dir=str(docs_dir))
+    assert loaded.retrieve(QUERY, k=3) == built.retrieve(QUERY, k=3)
+    monkeypatch.setattr(builtins, 'open', real_open)
+
+    # Touched but identical content keeps the index
+    doc = docs_dir / 'Doc1_grace_period.md'
+    os.utime(doc, ns=(0, 0))
+    assert len(MinimalRAG(docs_dir=str(docs_dir)).chunks) == len(built.chunks)
+
+    # Edited content rebuilds it
+    doc.write_text(doc.read_text(encoding='utf-8') + "\n\nZebra hedging clause for llama owners: the herd counts as a dependent "
+                   "household for underwriting, and premiums are reviewed every spring.", encoding='utf-8')
+    rebuilt = MinimalRAG(docs_dir=str(docs_dir))
+    assert len(rebuilt.chunks) == len(built.chunks) and list(rebuilt.chunks) != list(built.chunks)
+    assert rebuilt.retrieve("zebra llama", k=1)[0]['source'] == '[Doc1]'
+
+def _cold_start(docs_dir):
+    return [h['chunk'] for h in MinimalRAG(docs_dir=docs_dir).retrieve(QUERY, k=3)]
+
+def test_concurrent_cold_starts_share_one_index(tmp_path):
+    docs_dir = tmp_path / 'docs'
+    shutil.copytree('rag_docs/lapse', docs_dir)
+    # Every process finds no index, builds one and races to save it
+    with ProcessPoolExecutor(8) as pool:
+        results = list(pool.map(_cold_start, [str(docs_dir)] * 16))
+    assert all(r == results[0] for r in results)
+    assert _cold_start(str(docs_dir)) == results[0]
+    assert not [p for p in os.listdir(tmp_path / 'docs') if '.tmp' in p]
+
+def test_retrieve_many_matches_retrieve():
+    rag = MinimalRAG(use_index=False, cache_size=0)
+    queries = [QUERY, "long tenure customer discount", "smoker coaching", "qwertyuiop"]
+    for k in (1, 3, len(rag.chunks) + 5):
+        for single, batched in zip((rag.retrieve(q, k) for q in queries), rag.retrieve_many(queries, k)):
+            assert [h['chunk'] for h in single] == [h['chunk'] for h in batched]
+            assert all(abs(a['score'] - b['score']) < 1e-9 for a, b in zip(single, batched))
+
+def test_result_cache():
+    rag = MinimalRAG(use_index=False, cache_size=2)
+    first = rag.retrieve(QUERY, k=2)
+    assert rag.retrieve("  Customer MISSED payment   needs extension ", k=2) == first
+    assert rag.cache_info()['hits'] == 1 and rag.cache_info()['misses'] == 1
+    
+    rag.retrieve(QUERY, k=1)
+    rag.retrieve("smoker coaching", k=2)
+    assert rag.cache_info()['evictions'] == 1 and rag.cache_info()['size'] == 2
+    
+    rag._index_changed()
+    assert rag.cache_info()['size'] == 0
+
+def test_warm_cache_covers_strategy_queries():
+    rag = MinimalRAG(use_index=False)
+    rag.warm_cache(CustomerContext.query_space(), k=3)
+    misses = rag.cache_info()['misses']
+    for p_lapse, status, age, calls in [(0.7549, 'Late', 35, 3), (0.3999, 'Paid', 11, 0), (0.91, 'Missed', 24, 1)]:
+        context = CustomerContext('P1', '2024-01', age, 100.0, status, calls, 1, p_lapse, 'High')
+        rag.retrieve(context.to_retrieval_query(), k=3)
+    assert rag.cache_info()['misses'] == misses
+
+def test_refresh_matches_full_rebuild(tmp_path):
+    docs_dir = tmp_path / 'docs'
+    shutil.copytree('rag_docs/lapse', docs_dir)
+    rag = MinimalRAG(docs_dir=str(docs_dir))
+    
+    (docs_dir / 'Doc6_new_playbook.md').write_text("Nicotine cessation coaching.\n\nGrace period escalation.")
+    (docs_dir / 'Doc3_payment_plans.md').unlink()
+    with open(docs_dir / 'Doc1_grace_period.md', 'a', encoding='utf-8') as f:
+        f.write("\n\nExtra paragraph about extending the grace period.")
+    changes = rag.refresh()
+    assert [len(changes[c]) for c in ('added', 'removed', 'updated')] == [1, 1, 1]
+    
+    fresh = MinimalRAG(docs_dir=str(docs_dir), use_index=False)
+    for query in CustomerContext.query_space()[::100] + ["nicotine coaching", "payment plan installments"]:
+        incremental, rebuilt = rag.retrieve(query, k=3), fresh.retrieve(query, k=3)
+        assert [h['chunk'] for h in incremental] == [h['chunk'] for h in rebuilt]
+        assert all(abs(a['score'] - b['score']) < 1e-9 for a, b in zip(incremental, rebuilt))
+    assert rag.refresh() == {'added': [], 'removed': [], 'updated': []}
+
+def test_namespace_filter():
+    rag = MinimalRAG(use_index=False, cache_size=0)
+    assert rag.namespaces() == ['lapse', 'leads']
+    query = "customer says price too high, discount"
+    everything = rag.retrieve(query, k=len(rag.chunks))
+    for namespace in ('lapse', 'leads'):
+        in_namespace = {c for c, n in zip(rag.chunks, rag.chunk_namespaces) if n == namespace}
+        expected = [h for h in everything if h['chunk'] in in_namespace][:3]
+        assert rag.retrieve(query, k=3, namespace=namespace) == expected
+        batched = rag.retrieve_many([query], k=3, namespace=namespace)[0]
+        assert [h['chunk'] for h in batched] == [h['chunk'] for h in expected]
+        assert all(abs(a['score'] - b['score']) < 1e-9 for a, b in zip(batched, expected))
+    
+    bm25 = MinimalRAG(use_index=False, engine='bm25')
+    hits = bm25.retrieve(query, k=5, namespace='leads')
+    assert hits and all(h['chunk'] in in_namespace for h in hits)
+    try:
+        rag.retrieve(query, namespace='claims')
+        assert False, "unknown namespace accepted"
+    except ValueError:
+        pass
+
+def test_chunk_store_views():
+    rag = MinimalRAG(use_index=False, cache_size=0)
+    store = rag.chunks
+    assert store.text.dtype == np.uint8 and len(store.doc_paths) == 10
+    assert store[0].startswith(f"Source: {store.source(0)} (")
+    
+    hit = rag.retrieve(QUERY, k=1)[0]
+    assert isinstance(hit, RetrievalHit) and hit.store is store
+    assert dict(hit) == {'chunk': store[hit.index], 'source': '[Doc1]', 'score': hit['score']}
+    
+    # Removing a document builds a new store; hits into the old one stay readable
+    path = store.paths[hit.index]
+    rag.remove_document(path)
+    assert rag.chunks is not store and path not in rag.chunks.doc_paths
+    assert len(rag.chunks) == len(store) - len(store.rows_of([path]))
+    assert list(rag.chunks) == [c for c, p in zip(store, store.paths) if p != path]
+    assert hit['source'] == '[Doc1]'
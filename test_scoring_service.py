@@ -0,0 +1,38 @@
+import asyncio
+
+import pandas as pd
+
+from scoring_service import MicroBatcher, ScoringService
+
+def test_bad_record_only_fails_its_own_request(model_paths):
+    service = ScoringService(**model_paths, max_wait_ms=50)
+    records = pd.read_csv('data/test_gpt.csv').head(8).drop(columns=['split']).to_dict('records')
+    records[3]['age'] = 'forty'
+    records[5]['premium'] = None
+
+    async def run():
+        service.batcher.start()
+        try:
+            return await asyncio.gather(*(service.handle_score(r) for r in records))
+        finally:
+            await service.batcher.stop()
+    responses = asyncio.run(run())
+    assert [status for status, _ in responses] == [200, 200, 200, 400, 200, 400, 200, 200]
+    assert 'age' in responses[3][1]['error'] and 'premium' in responses[5][1]['error']
+    assert service.batcher.batches == 1 and service.batcher._task is None
+
+def test_failed_batch_falls_back_to_single_records():
+    def process_batch(records):
+        if 'bad' in records:
+            raise ValueError("bad record")
+        return [r.upper() for r in records]
+
+    async def run():
+        batcher = MicroBatcher(process_batch, max_wait_ms=50)
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit(r) for r in ['a', 'bad', 'c']), return_exceptions=True)
+        finally:
+            await batcher.stop()
+    a, bad, c = asyncio.run(run())
+    assert (a, c) == ('A', 'C') and isinstance(bad, ValueError)
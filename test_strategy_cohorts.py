@@ -0,0 +1,29 @@
+import re
+
+from strategy_cohorts import fill_placeholders, group_cohorts
+from strategy_contract import CustomerContext
+from strategy_prompt import StrategyPromptBuilder
+
+def _context(policy_id, p_lapse, premium, policy_age=40, calls=0):
+    return CustomerContext(policy_id=policy_id, month='2023-12', policy_age=policy_age, premium_amount=premium,
+                           payment_status='Late', customer_calls=calls, claim_count=0, p_lapse=p_lapse,
+                           risk_tier=StrategyPromptBuilder.determine_risk_tier(p_lapse))
+
+def test_cohorts_share_query_and_fan_out():
+    contexts = [_context('P1', 0.81, 120.0), _context('P2', 0.93, 180.0, calls=3),
+                _context('P3', 0.85, 150.0, calls=2), _context('P4', 0.50, 90.0), _context('P5', 0.90, 99.0, 47)]
+    cohorts = group_cohorts(contexts)
+    assert [[c.policy_id for c in cohort.members] for cohort in cohorts] == [['P1'], ['P2', 'P3'], ['P4'], ['P5']]
+    
+    cohort = cohorts[1]
+    representative = cohort.representative()
+    assert round(representative.p_lapse, 6) == 0.89 and representative.premium_amount == 165.0
+    # The members' queries only differ in the printed probability
+    strip = lambda context: re.sub(r"probability \d\.\d\d", '', context.to_retrieval_query())
+    assert len({strip(c) for c in cohort.members + [representative]}) == 1
+    
+    messages = StrategyPromptBuilder.build_cohort_messages(cohort, [{'source': 'a.md', 'chunk': "Call them."}])
+    assert "Customer Cohort (2 policies)" in messages[1]['content'] and "Call them." in messages[1]['content']
+    template = "Hi [[policy_id]], your premium of $[[premium_amount]] (risk [[p_lapse]])"
+    assert [fill_placeholders(template, c) for c in cohort.members] == [
+        "Hi P2, your premium of $180.0 (risk 0.93)", "Hi P3, your premium of $150.0 (risk 0.85)"]
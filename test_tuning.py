@@ -0,0 +1,16 @@
+import optuna
+
+import train_model
+
+def test_parallel_workers_use_the_chosen_pruner(tmp_path):
+    storage = f"sqlite:///{tmp_path / 'study.db'}"
+    cache_dir = tmp_path / 'cache'
+    data = train_model.prepare_datasets(verbose=False, use_cache=False)
+    study, _ = train_model.tune_hyperparameters(data, n_trials=16, n_workers=2, storage=storage,
+                                                study_name='no_pruning', pruner='none', backend='native',
+                                                use_cache=False, cache_dir=str(cache_dir))
+    states = [t.state for t in study.get_trials(deepcopy=False)]
+    assert len(states) >= 16
+    assert optuna.trial.TrialState.PRUNED not in states
+    # use_cache=False reaches the workers: none of them wrote a cache entry
+    assert not cache_dir.exists()
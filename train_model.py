@@ -1,3 +1,7 @@
+import argparse
+import multiprocessing
+import os
+import time
 import pandas as pd
 import numpy as np
 import xgboost as xgb
@@ -7,12 +11,46 @@ import json
 import joblib
 import matplotlib.pyplot as plt
 from sklearn.metrics import average_precision_score, precision_score, roc_auc_score
-from sklearn.preprocessing import OrdinalEncoder
+
+import feature_cache
+from fast_scorer import LOOKUP_TABLE_PATH, MODEL_PATH, TRANSFORMER_PATH, FastScorer, LookupTable
+from feature_transformer import FeatureTransformer
+
+SPLIT_FILES = ['train_gpt.csv', 'val_gpt.csv', 'test_gpt.csv']
+TARGET = 'lapse_next_3m'
+DROP_COLS = ['policy_id', 'month', 'split', 'post_event_notice_sent', TARGET]
+CAT_COLS = ['region', 'age', 'premium', 'tenure_m'] # All binned features
+META_COLS = ['month'] # Kept next to train/val features for incremental refreshes
+# Test rows sampled for the SHAP summary: global importance converges long before the full test set
+SHAP_SAMPLE = 2000
+# Monthly refreshes append trees; past this many boosting rounds the next refresh re-tunes from scratch
+MAX_REFRESH_ROUNDS = 1000
+
+# Feature binning into intervals (right-closed, as pd.cut)
+BIN_SPECS = {
+    # Age binning into 4 intervals
+    'age': {'bins': [0, 30, 45, 60, 150],
+            'labels': ['18-30', '31-45', '46-60', '61+']},
+    # Premium binning into 5 intervals
+    'premium': {'bins': [0, 100, 150, 200, 300, 10000],
+                'labels': ['<100', '100-150', '150-200', '200-300', '300+']},
+    # Tenure binning into 5 intervals (months)
+    'tenure_m': {'bins': [-1, 6, 12, 24, 48, 10000],
+                 'labels': ['0-6m', '6-12m', '12-24m', '24-48m', '48m+']},
+}
+
+# Optional coverage binning (the README ranges); with it every model input has a finite domain
+COVERAGE_BIN_SPEC = {'bins': [0, 10000, 25000, 50000, 100000, 100000000],
+                     'labels': ['<10k', '10k-25k', '25k-50k', '50k-100k', '100k+']}
+
+def feature_spec(bin_coverage=False):
+    """(bin_specs, cat_cols) for the transformer, optionally with coverage binned too."""
+    if not bin_coverage:
+        return BIN_SPECS, CAT_COLS
+    return {**BIN_SPECS, 'coverage': COVERAGE_BIN_SPEC}, CAT_COLS + ['coverage']
 
 def load_data(data_dir='data'):
-    train = pd.read_csv(f'{data_dir}/train_gpt.csv')
-    val = pd.read_csv(f'{data_dir}/val_gpt.csv')
-    test = pd.read_csv(f'{data_dir}/test_gpt.csv')
+    train, val, test = (pd.read_csv(os.path.join(data_dir, f)) for f in SPLIT_FILES)
     return train, val, test
 
 def precision_at_k(y_true, y_prob, k_percent):
@@ -25,75 +63,123 @@ def precision_at_k(y_true, y_prob, k_percent):
     top_k = df.head(k)
     return top_k['true'].mean()
 
-def train_xgboost_optuna():
+class XGBoostPruningCallback(xgb.callback.TrainingCallback):
+    """
+    Reports the validation logloss of every boosting round to Optuna and
+    stops the trial early when the pruner decides it is not promising.
+    """
+    def __init__(self, trial, data_name='validation_0', metric_name='logloss'):
+        self.trial = trial
+        self.data_name = data_name
+        self.metric_name = metric_name
+
+    def after_iteration(self, model, epoch, evals_log):
+        # The study maximizes AUC-PR, so report negated logloss to keep the
+        # "higher is better" direction the pruner expects.
+        value = -evals_log[self.data_name][self.metric_name][-1]
+        self.trial.report(value, epoch)
+        if self.trial.should_prune():
+            raise optuna.TrialPruned(f"Pruned at boosting round {epoch}")
+        return False
+
+def make_pruner(name):
+    if name is None or name == 'none':
+        return optuna.pruners.NopPruner()
+    if name == 'median':
+        return optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=20)
+    if name == 'hyperband':
+        return optuna.pruners.HyperbandPruner(min_resource=20, max_resource=1000, reduction_factor=3)
+    raise ValueError(f"Unknown pruner: {name}")
+
+def feature_config(bin_coverage=False):
+    """Everything that shapes the encoded matrices besides the input files (the feature cache key)."""
+    bin_specs, cat_cols = feature_spec(bin_coverage)
+    return {
+        'bin_specs': bin_specs,
+        'cat_cols': cat_cols,
+        'target': TARGET,
+        'drop_cols': DROP_COLS,
+        'meta_cols': META_COLS,
+        'transformer': FeatureTransformer(bin_specs, cat_cols).config(),
+    }
+
+def _build_frames(data_dir, verbose, bin_coverage=False):
     # 1. Load
-    train, val, test = load_data()
+    train, val, test = load_data(data_dir)
     
     # 2. Prepare cols
-    target = 'lapse_next_3m'
-    drop_cols = ['policy_id', 'month', 'split', 'post_event_notice_sent', target]
+    features = [c for c in train.columns if c not in DROP_COLS]
     
-    features = [c for c in train.columns if c not in drop_cols]
+    if verbose:
+        print(f"Train: {train.shape}, Val: {val.shape}, Test: {test.shape}")
     
-    print(f"Features: {features}")
-    print(f"Train: {train.shape}, Val: {val.shape}, Test: {test.shape}")
+    # Binning + category codes for all categorical features, fitted on train only
+    bin_specs, cat_cols = feature_spec(bin_coverage)
+    transformer = FeatureTransformer(bin_specs, cat_cols).fit(train, features)
     
-    # Feature binning into intervals
-    def bin_features(df):
-        df = df.copy()
-        
-        # Age binning into 4 intervals
-        df['age'] = pd.cut(df['age'], 
-                          bins=[0, 30, 45, 60, 150], 
-                          labels=['18-30', '31-45', '46-60', '61+'],
-                          right=True)
-        
-        # Premium binning into 5 intervals
-        df['premium'] = pd.cut(df['premium'], 
-                              bins=[0, 100, 150, 200, 300, 10000], 
-                              labels=['<100', '100-150', '150-200', '200-300', '300+'],
-                              right=True)
-        
-        # Tenure binning into 5 intervals (months)
-        df['tenure_m'] = pd.cut(df['tenure_m'], 
-                               bins=[-1, 6, 12, 24, 48, 10000], 
-                               labels=['0-6m', '6-12m', '12-24m', '24-48m', '48m+'],
-                               right=True)
-        return df
+    # Transform all datasets
+    for df in (train, val, test):
+        df[cat_cols] = transformer.transform(df)[cat_cols]
     
-    train = bin_features(train)
-    val = bin_features(val)
-    test = bin_features(test)
+    frames = {
+        'train': train[features + [TARGET] + META_COLS],
+        'val': val[features + [TARGET] + META_COLS],
+        'test': test,
+    }
+    return frames, {'features': features, 'transformer': transformer}
+
+def prepare_datasets(data_dir='data', verbose=True, use_cache=True, cache_dir=feature_cache.DEFAULT_CACHE_DIR,
+                     bin_coverage=False):
+    """
+    Loads the train/val/test splits, bins and encodes them.
+    Returns a dict with the feature matrices, targets, the encoded test frame and the fitted transformer.
     
-    # Cat encoding - use single encoder for all categorical features
-    cat_cols = ['region', 'age', 'premium', 'tenure_m'] # All binned features
+    With use_cache the encoded columns are stored in cache_dir, keyed on the CSV contents and
+    feature_config(), and memory-mapped back on later runs instead of re-parsing and re-binning.
+    bin_coverage also bins coverage into the README ranges (needed for the lookup table scorer).
+    """
+    build = lambda: _build_frames(data_dir, verbose, bin_coverage)
+    if use_cache:
+        paths = [os.path.join(data_dir, f) for f in SPLIT_FILES]
+        frames, objects = feature_cache.cached_build(paths, feature_config(bin_coverage), build, cache_dir)
+    else:
+        frames, objects = build()
     
-    # Fit one encoder for all categorical columns
-    encoder = OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1)
-    encoder.fit(train[cat_cols])
+    features = objects['features']
+    train, val, test = frames['train'], frames['val'], frames['test']
+    if verbose:
+        print(f"Features: {features}")
     
-    # Transform all datasets
-    train[cat_cols] = encoder.transform(train[cat_cols])
-    val[cat_cols] = encoder.transform(val[cat_cols])
-    test[cat_cols] = encoder.transform(test[cat_cols])
+    return {
+        'features': features,
+        'X_train': train[features], 'y_train': train[TARGET],
+        'X_val': val[features], 'y_val': val[TARGET],
+        'X_test': test[features], 'y_test': test[TARGET],
+        'test': test,
+        'train_months': train['month'],
+        'val_months': val['month'],
+        'transformer': objects['transformer'],
+    }
 
+def suggest_params(trial):
+    """Search space shared by both training backends."""
+    return {
+        'learning_rate': trial.suggest_float('learning_rate', 0.01, 0.3),
+        'max_depth': trial.suggest_int('max_depth', 3, 10),
+        'subsample': trial.suggest_float('subsample', 0.5, 1.0),
+        'colsample_bytree': trial.suggest_float('colsample_bytree', 0.5, 1.0),
+    }
 
-    X_train, y_train = train[features], train[target]
-    X_val, y_val = val[features], val[target]
-    X_test, y_test = test[features], test[target]
-    
-    # 3. Optuna
+def make_objective(X_train, y_train, X_val, y_val, n_jobs=-1):
     def objective(trial):
         params = {
             'n_estimators': 1000,
-            'learning_rate': trial.suggest_float('learning_rate', 0.01, 0.3),
-            'max_depth': trial.suggest_int('max_depth', 3, 10),
-            'subsample': trial.suggest_float('subsample', 0.5, 1.0),
-            'colsample_bytree': trial.suggest_float('colsample_bytree', 0.5, 1.0),
+            **suggest_params(trial),
             'random_state': 42,
-            'n_jobs': -1,
+            'n_jobs': n_jobs,
             'early_stopping_rounds': 50,
-            'eval_metric': 'logloss' # using logloss as proxy for general perf, custom pr-auc is slower
+            'eval_metric': 'logloss', # using logloss as proxy for general perf, custom pr-auc is slower
+            'callbacks': [XGBoostPruningCallback(trial)]
         }
         
         # XGBClassifier with early stopping
@@ -103,22 +189,209 @@ def train_xgboost_optuna():
         preds = clf.predict_proba(X_val)[:, 1]
         score = average_precision_score(y_val, preds)
         return score
+    return objective
 
+def build_dmatrices(data, native_categorical=False):
+    """
+    Quantizes train/val once per run. The validation matrix reuses the training quantile cuts,
+    and both are shared by every tuning trial and the final model.
+    """
+    X_train, X_val = data['X_train'], data['X_val']
+    if native_categorical:
+        X_train = data['transformer'].as_categorical(X_train)
+        X_val = data['transformer'].as_categorical(X_val)
+    
+    dtrain = xgb.QuantileDMatrix(X_train, data['y_train'], enable_categorical=native_categorical)
+    dval = xgb.QuantileDMatrix(X_val, data['y_val'], ref=dtrain, enable_categorical=native_categorical)
+    return dtrain, dval
+
+def train_native(params, dtrain, dval, n_jobs=-1, callbacks=None):
+    """xgb.train equivalent of the XGBClassifier fit used by the sklearn backend."""
+    booster_params = {
+        'objective': 'binary:logistic',
+        'eval_metric': 'logloss',
+        'seed': 42,
+        'nthread': n_jobs,
+        **params
+    }
+    return xgb.train(booster_params, dtrain, num_boost_round=1000, evals=[(dval, 'validation_0')],
+                     early_stopping_rounds=50, callbacks=callbacks, verbose_eval=False)
+
+def make_native_objective(dtrain, dval, y_val, n_jobs=-1):
+    def objective(trial):
+        booster = train_native(suggest_params(trial), dtrain, dval, n_jobs=n_jobs,
+                               callbacks=[XGBoostPruningCallback(trial)])
+        preds = booster.predict(dval, iteration_range=(0, booster.best_iteration + 1))
+        return average_precision_score(y_val, preds)
+    return objective
+
+def booster_to_classifier(booster):
+    """Wraps a native booster in an XGBClassifier so the existing predict_proba scoring path can load it."""
+    model = xgb.XGBClassifier()
+    model.load_model(bytearray(booster.save_raw('json')))
+    return model
+
+def _build_objective(data, backend, native_categorical, n_jobs=-1, dmatrices=None):
+    if backend == 'native':
+        dtrain, dval = dmatrices or build_dmatrices(data, native_categorical)
+        return make_native_objective(dtrain, dval, data['y_val'], n_jobs=n_jobs)
+    if backend == 'sklearn':
+        return make_objective(data['X_train'], data['y_train'], data['X_val'], data['y_val'], n_jobs=n_jobs)
+    raise ValueError(f"Unknown backend: {backend}")
+
+def _finished_trials(study):
+    states = (optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)
+    return len(study.get_trials(deepcopy=False, states=states))
+
+def _max_trials_callback(n_trials):
+    states = (optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)
+    return optuna.study.MaxTrialsCallback(n_trials, states=states)
+
+def _tuning_worker(data_dir, storage, study_name, n_trials, xgb_n_jobs, backend, native_categorical,
+                   bin_coverage=False, pruner=None, use_cache=True, cache_dir=feature_cache.DEFAULT_CACHE_DIR):
+    """Entry point of one tuning process: loads its own data and pulls trials from the shared study."""
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    data = prepare_datasets(data_dir, verbose=False, use_cache=use_cache, cache_dir=cache_dir,
+                            bin_coverage=bin_coverage)
+    # The pruner is not stored with the study, so every worker needs its own
+    study = optuna.load_study(study_name=study_name, storage=storage, pruner=make_pruner(pruner))
+    objective = _build_objective(data, backend, native_categorical, n_jobs=xgb_n_jobs)
+    study.optimize(objective, callbacks=[_max_trials_callback(n_trials)])
+
+def tune_hyperparameters(data, data_dir='data', n_trials=30, n_workers=1, storage=None,
+                         study_name='lapse_xgb', pruner=None, backend='sklearn',
+                         native_categorical=False, dmatrices=None, bin_coverage=False, use_cache=True,
+                         cache_dir=feature_cache.DEFAULT_CACHE_DIR):
+    """
+    Runs the Optuna search and returns (study, tuning_stats).
+
+    n_trials is the total number of finished (complete or pruned) trials the study should hold,
+    so re-running against the same storage resumes an interrupted search instead of starting over.
+    With n_workers > 1 the trials run in separate processes sharing the study through the storage;
+    each process builds its own DMatrix once when the native backend is used, and loads the
+    data with the same use_cache/cache_dir as the caller.
+    """
+    if n_workers > 1 and storage is None:
+        storage = 'sqlite:///optuna_lapse.db'
+        print(f"Parallel tuning needs a shared study storage, using {storage}")
+    
+    study = optuna.create_study(direction='maximize', study_name=study_name, storage=storage,
+                                pruner=make_pruner(pruner), load_if_exists=storage is not None)
+    done_before = _finished_trials(study)
+    if done_before:
+        print(f"Resuming study '{study_name}' with {done_before} finished trials")
+    
+    start = time.time()
+    if n_trials > done_before:
+        if n_workers > 1:
+            xgb_n_jobs = max(1, (os.cpu_count() or 1) // n_workers)
+            ctx = multiprocessing.get_context('spawn')
+            workers = [ctx.Process(target=_tuning_worker,
+                                   args=(data_dir, storage, study_name, n_trials, xgb_n_jobs,
+                                         backend, native_categorical, bin_coverage, pruner, use_cache,
+                                         cache_dir))
+                       for _ in range(n_workers)]
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+        else:
+            objective = _build_objective(data, backend, native_categorical, dmatrices=dmatrices)
+            study.optimize(objective, callbacks=[_max_trials_callback(n_trials)])
+    wall_time = time.time() - start
+    
+    trials = study.get_trials(deepcopy=False)
+    n_run = _finished_trials(study) - done_before
+    stats = {
+        'wall_time_s': wall_time,
+        'trials_run': n_run,
+        'trials_per_min': n_run / (wall_time / 60) if wall_time > 0 else 0.0,
+        'pruned': sum(t.state == optuna.trial.TrialState.PRUNED for t in trials),
+        'n_workers': n_workers,
+    }
+    print(f"Tuning: {n_run} trials in {wall_time:.1f}s ({stats['trials_per_min']:.1f} trials/min, "
+          f"{stats['pruned']} pruned in study, {n_workers} worker(s))")
+    return study, stats
+
+def global_importance(model, transformer, X, sample_size=SHAP_SAMPLE, approximate=False, seed=42):
+    """
+    Mean absolute SHAP value per feature from the booster's own pred_contribs on a random sample of
+    sample_size rows of X (encoded features; every row when sample_size is None or X is smaller).
+    approximate uses per-path (Saabas) attributions. Returns (importance sorted descending,
+    contributions of the sample, the sampled rows).
+    """
+    if sample_size and len(X) > sample_size:
+        X = X.sample(sample_size, random_state=seed)
+    scorer = FastScorer(model, transformer)
+    contribs = scorer.contributions_encoded(X.to_numpy(dtype=np.float64), approximate)[:, :-1]
+    importance = pd.DataFrame({
+        'feature': scorer.features,
+        'mean_abs_shap': np.abs(contribs).mean(axis=0)
+    }).sort_values('mean_abs_shap', ascending=False)
+    return importance, contribs, X
+
+def train_xgboost_optuna(n_trials=30, n_workers=1, storage=None, study_name='lapse_xgb', pruner=None,
+                         backend='sklearn', native_categorical=False, use_cache=True, lookup_table=False,
+                         shap_sample=SHAP_SAMPLE, approximate_shap=False, data_dir='data'):
+    """
+    backend='sklearn' fits XGBClassifier on pandas frames for every trial.
+    backend='native' builds the QuantileDMatrix once and trains every trial and the final model
+    with xgb.train; native_categorical lets XGBoost split on the binned columns as categories.
+    lookup_table bins coverage as well and saves the model's prediction for every feature
+    combination to LOOKUP_TABLE_PATH (see fast_scorer.LookupTable).
+    The SHAP summary is computed on shap_sample test rows (None for all), see global_importance.
+    The scored test set and the SHAP analysis are written to data_dir (test_scored.csv, DISCUSSION.md).
+    """
+    if native_categorical and backend != 'native':
+        raise ValueError("native_categorical requires backend='native'")
+    
+    data = prepare_datasets(data_dir, use_cache=use_cache, bin_coverage=lookup_table)
+    X_train, y_train = data['X_train'], data['y_train']
+    X_val, y_val = data['X_val'], data['y_val']
+    X_test, y_test = data['X_test'], data['y_test']
+    test, transformer = data['test'], data['transformer']
+    
+    dmatrices = None
+    if backend == 'native':
+        start = time.time()
+        dmatrices = build_dmatrices(data, native_categorical)
+        print(f"Built train/val QuantileDMatrix in {time.time() - start:.2f}s")
+    
+    # 3. Optuna
     print("Starting Optuna...")
-    study = optuna.create_study(direction='maximize')
-    study.optimize(objective, n_trials=30)
+    study, _ = tune_hyperparameters(data, data_dir=data_dir, n_trials=n_trials, n_workers=n_workers, storage=storage,
+                                    study_name=study_name, pruner=pruner, backend=backend,
+                                    native_categorical=native_categorical, dmatrices=dmatrices,
+                                    bin_coverage=lookup_table, use_cache=use_cache)
     
     print("Best params:", study.best_params)
     
     # 4. Final Train
-    best_params = study.best_params
-    best_params['n_estimators'] = 1000
-    best_params['random_state'] = 42
-    best_params['n_jobs'] = -1
-    best_params['early_stopping_rounds'] = 50
+    best_params = dict(study.best_params)
+    if backend == 'native':
+        booster = train_native(best_params, *dmatrices)
+        model = booster_to_classifier(booster)
+        if native_categorical:
+            X_test = transformer.as_categorical(X_test)
+    else:
+        best_params['n_estimators'] = 1000
+        best_params['random_state'] = 42
+        best_params['n_jobs'] = -1
+        best_params['early_stopping_rounds'] = 50
+        
+        model = xgb.XGBClassifier(**best_params)
+        model.fit(X_train, y_train, eval_set=[(X_val, y_val)], verbose=False)
     
-    model = xgb.XGBClassifier(**best_params)
-    model.fit(X_train, y_train, eval_set=[(X_val, y_val)], verbose=False)
+    # Record what the model has seen so monthly refreshes can continue boosting from it: val months
+    # steered early stopping and test months the evaluation, so a refresh must start after both
+    if native_categorical:
+        X_val = transformer.as_categorical(X_val)
+    val_auc_pr = average_precision_score(y_val, model.predict_proba(X_val)[:, 1])
+    seen_through = max(data['train_months'].max(), data['val_months'].max(), data['test']['month'].max())
+    model.get_booster().set_attr(trained_through=str(data['train_months'].max()),
+                                 seen_through=str(seen_through),
+                                 val_auc_pr=str(val_auc_pr),
+                                 train_params=json.dumps(study.best_params))
     
     # 5. Evaluate on Test
     probs = model.predict_proba(X_test)[:, 1]
@@ -136,37 +409,38 @@ def train_xgboost_optuna():
     
     # Save predictions
     test['p_lapse_3_m'] = probs
-    test.to_csv('data/test_scored.csv', index=False)
-    print("Saved data/test_scored.csv with predictions")
+    scored_path = os.path.join(data_dir, 'test_scored.csv')
+    test.to_csv(scored_path, index=False)
+    print(f"Saved {scored_path} with predictions")
     
     # 6. Save Artifacts
-    joblib.dump(model, 'churn_model_xgb.joblib')
-    joblib.dump(encoder, 'feature_encoder.joblib')
+    joblib.dump(model, MODEL_PATH)
+    joblib.dump(transformer, TRANSFORMER_PATH)
     with open('metrics.json', 'w') as f:
         json.dump(metrics, f, indent=2)
+    
+    if lookup_table:
+        domains = {'has_agent': [0, 1], 'is_smoker': [0, 1],
+                   'dependents': np.arange(int(X_train['dependents'].max()) + 1)}
+        build_lookup_table(model, transformer, domains, data['X_test'])
         
     # 7. SHAP
-    explainer = shap.TreeExplainer(model)
-    shap_values = explainer.shap_values(X_test)
+    start = time.time()
+    feature_importance, shap_values, X_shap = global_importance(model, transformer, data['X_test'], shap_sample,
+                                                                approximate_shap)
+    print(f"SHAP values for {len(X_shap):,} of {len(X_test):,} test rows in {time.time() - start:.2f}s")
     
     plt.figure()
-    shap.summary_plot(shap_values, X_test, plot_type="bar", show=False)
+    shap.summary_plot(shap_values, X_shap, plot_type="bar", show=False)
     plt.savefig('shap_summary.png', bbox_inches='tight')
     print("Saved shap_summary.png")
 
     # Automated SHAP Analysis
-    # shap_values is (n_samples, n_features). Mean absolute value per feature.
-    mean_abs_shap = np.abs(shap_values).mean(axis=0)
-    feature_importance = pd.DataFrame({
-        'feature': features,
-        'mean_abs_shap': mean_abs_shap
-    }).sort_values('mean_abs_shap', ascending=False)
-    
     top_3 = feature_importance.head(3)
     
     analysis_text = f"""
 ### SHAP Analysis
-The global feature importance (mean absolute SHAP value) indicates the top drivers of lapse risk:
+The global feature importance (mean absolute SHAP value over {len(X_shap):,} sampled test policies) indicates the top drivers of lapse risk:
 1. **{top_3.iloc[0]['feature']}**: Primary driver.
 2. **{top_3.iloc[1]['feature']}**: Secondary driver.
 3. **{top_3.iloc[2]['feature']}**: Tertiary driver.
@@ -175,9 +449,181 @@ See `shap_summary.png` for the full bar plot.
 """
     
     # Append to DISCUSSION.md
-    with open('data/DISCUSSION.md', 'a', encoding='utf-8') as f:
+    discussion_path = os.path.join(data_dir, 'DISCUSSION.md')
+    with open(discussion_path, 'a', encoding='utf-8') as f:
         f.write(analysis_text)
-    print("Appended SHAP analysis to data/DISCUSSION.md")
+    print(f"Appended SHAP analysis to {discussion_path}")
+    return model
+
+def build_lookup_table(model, transformer, discrete_domains, X_check, path=LOOKUP_TABLE_PATH):
+    """
+    Builds and saves the dense prediction table, then checks it against the full model on X_check
+    (encoded features). Rows outside the table's domain are scored by the model either way.
+    """
+    start = time.time()
+    scorer = FastScorer(model, transformer)
+    table = LookupTable.build(scorer, discrete_domains)
+    table.save(path)
+    
+    X = X_check.to_numpy(dtype=np.float64)
+    max_err = float(np.abs(table.lookup(X, fallback=scorer.predict_encoded) - scorer.predict_encoded(X)).max())
+    print(f"Saved {path}: {table.table.size:,} cells in {time.time() - start:.2f}s, "
+          f"max |table - model| on {len(X):,} rows = {max_err:.2e}")
+    return table, max_err
+
+def month_index(months):
+    """'2023-07' -> 2023 * 12 + 6, so month distances are plain differences."""
+    months = pd.to_datetime(pd.Series(months), format='%Y-%m')
+    return (months.dt.year * 12 + months.dt.month - 1).to_numpy()
+
+def recency_weights(months, halflife):
+    """Sample weight halves every `halflife` months back from the newest month."""
+    idx = month_index(months)
+    return 0.5 ** ((idx.max() - idx) / halflife)
+
+def roll_splits(data_dir, new, out_dir):
+    """
+    Writes SPLIT_FILES to out_dir with the new rows added: months in order, the newest ones to test
+    and the ones before them to val (as many months as the current val/test files hold), the rest
+    to train. A re-tune on out_dir trains on the data a refresh would have used.
+    """
+    train, val, test = load_data(data_dir)
+    panel = pd.concat([train, val, test, new[train.columns]], ignore_index=True)
+    months = sorted(panel['month'].unique())
+    n_val, n_test = val['month'].nunique(), test['month'].nunique()
+    split = np.where(panel['month'].isin(months[-n_test:]), 'test',
+                     np.where(panel['month'].isin(months[-(n_val + n_test):-n_test]), 'val', 'train'))
+    os.makedirs(out_dir, exist_ok=True)
+    for name, file_name in zip(['train', 'val', 'test'], SPLIT_FILES):
+        part = panel[split == name]
+        if 'split' in part:
+            part = part.assign(split=name)
+        part.to_csv(os.path.join(out_dir, file_name), index=False)
+    return out_dir
+
+def incremental_update(new_data_path, n_rounds=50, recency_halflife=None, degradation_tol=0.05,
+                       data_dir='data', max_rounds=MAX_REFRESH_ROUNDS, **retune_kwargs):
+    """
+    Monthly refresh: continues boosting the saved model on the months after the last one it has
+    seen (its val/test months, or the newest month of the last refresh), instead of re-running
+    the Optuna study over the full history.
+    
+    The newest arriving month is held out: the model is boosted on the months before it and scored
+    there. If that AUC-PR is more than degradation_tol below the value recorded at the last full
+    tune, a full re-tune (train_xgboost_optuna(**retune_kwargs)) runs instead on the splits rolled
+    forward over the new months (roll_splits) and its model is returned. Otherwise the refresh is
+    repeated on all new months and saved. At least two new months are needed.
+    
+    Every refresh adds n_rounds trees, so the model keeps growing; once it would exceed max_rounds
+    boosting rounds the full re-tune runs instead, which starts a fresh model. The re-tune uses its
+    own study ('<study_name>-retune-<newest month>') so trials from earlier runs in the same
+    storage don't count towards its n_trials.
+    """
+    start = time.time()
+    model = joblib.load(MODEL_PATH)
+    transformer = joblib.load(TRANSFORMER_PATH)
+    booster = model.get_booster()
+    attrs = booster.attributes()
+    if 'seen_through' not in attrs:
+        raise ValueError(f"{MODEL_PATH} has no training metadata, run a full training first")
+    
+    new = pd.read_csv(new_data_path)
+    new = new[new['month'] > attrs['seen_through']]
+    months = sorted(new['month'].unique())
+    if len(months) < 2:
+        print(f"Need at least two months after {attrs['seen_through']} in {new_data_path} (the newest is held "
+              f"out to check the refresh), found {months or 'none'}; model unchanged")
+        return model
+    
+    def retune():
+        retune_dir = roll_splits(data_dir, new, os.path.join(data_dir, f"retune-{months[-1]}"))
+        study_name = f"{retune_kwargs.pop('study_name', 'lapse_xgb')}-retune-{months[-1]}"
+        print(f"Running a full re-tune on {retune_dir} (study '{study_name}')")
+        return train_xgboost_optuna(data_dir=retune_dir, study_name=study_name, **retune_kwargs)
+    
+    # Drop the trees grown past the early-stopping optimum, then keep boosting on the new months only
+    if 'best_iteration' in attrs:
+        booster = booster[: int(attrs['best_iteration']) + 1]
+    if booster.num_boosted_rounds() + n_rounds > max_rounds:
+        print(f"The model has {booster.num_boosted_rounds()} boosting rounds, another {n_rounds} would exceed "
+              f"max_rounds={max_rounds}")
+        return retune()
+    
+    fit, holdout = new[new['month'] < months[-1]], new[new['month'] == months[-1]]
+    print(f"Refreshing on {len(fit)} rows from months {months[:-1]}, checking on {len(holdout)} rows from {months[-1]}")
+    
+    native_categorical = 'c' in (booster.feature_types or [])
+    encode = lambda rows: (transformer.as_categorical(transformer.transform(rows)) if native_categorical
+                           else transformer.transform(rows))
+    params = {'objective': 'binary:logistic', 'seed': 42, **json.loads(attrs.get('train_params', '{}'))}
+    
+    def refresh(rows):
+        weights = recency_weights(rows['month'], recency_halflife) if recency_halflife else None
+        drows = xgb.DMatrix(encode(rows), rows[TARGET], weight=weights, enable_categorical=native_categorical)
+        return booster_to_classifier(xgb.train(params, drows, num_boost_round=n_rounds, xgb_model=booster))
+    
+    reference_auc_pr = float(attrs['val_auc_pr'])
+    holdout_auc_pr = average_precision_score(holdout[TARGET], refresh(fit).predict_proba(encode(holdout))[:, 1])
+    print(f"Held-out {months[-1]} AUC-PR: {holdout_auc_pr:.4f} (reference {reference_auc_pr:.4f}, "
+          f"refresh took {time.time() - start:.2f}s)")
+    
+    if reference_auc_pr - holdout_auc_pr > degradation_tol:
+        print(f"Held-out AUC-PR dropped by more than {degradation_tol}")
+        return retune()
+    
+    # The check passed: boost on every new month, the held-out one included
+    updated = refresh(new)
+    # Keep the reference from the last full tune so gradual drift still triggers a re-tune
+    updated.get_booster().set_attr(trained_through=months[-1], seen_through=months[-1],
+                                   val_auc_pr=attrs['val_auc_pr'],
+                                   train_params=attrs.get('train_params', '{}'))
+    joblib.dump(updated, MODEL_PATH)
+    print(f"Saved refreshed model to {MODEL_PATH} ({updated.get_booster().num_boosted_rounds()} boosting rounds)")
+    
+    # A table built for the old trees would be rejected by FastScorer, so refresh it too
+    if os.path.exists(LOOKUP_TABLE_PATH):
+        previous = LookupTable.load(LOOKUP_TABLE_PATH)
+        build_lookup_table(updated, transformer, previous.discrete_domains(transformer), transformer.transform(new))
+    return updated
 
 if __name__ == "__main__":
-    train_xgboost_optuna()
+    parser = argparse.ArgumentParser(description="Train the lapse model with Optuna tuning.")
+    parser.add_argument('--n-trials', type=int, default=30)
+    parser.add_argument('--workers', type=int, default=1, help="Number of tuning processes")
+    parser.add_argument('--storage', default=None, help="Optuna storage URL, e.g. sqlite:///optuna_lapse.db")
+    parser.add_argument('--study-name', default='lapse_xgb')
+    parser.add_argument('--pruner', choices=['none', 'median', 'hyperband'], default='none')
+    parser.add_argument('--backend', choices=['sklearn', 'native'], default='sklearn',
+                        help="'native' trains on a QuantileDMatrix built once per run")
+    parser.add_argument('--native-categorical', action='store_true',
+                        help="Split on binned columns as categories (native backend only)")
+    parser.add_argument('--no-cache', action='store_true', help="Rebuild features from the CSVs")
+    parser.add_argument('--lookup-table', action='store_true',
+                        help=f"Bin coverage too and save every prediction to {LOOKUP_TABLE_PATH}")
+    parser.add_argument('--shap-sample', type=int, default=SHAP_SAMPLE,
+                        help="Test rows sampled for the SHAP summary (0 for all)")
+    parser.add_argument('--approximate-shap', action='store_true',
+                        help="Per-path (Saabas) contributions instead of exact TreeSHAP for the summary")
+    parser.add_argument('--incremental', metavar='CSV', default=None,
+                        help="Continue boosting the saved model on the new months in CSV")
+    parser.add_argument('--incremental-rounds', type=int, default=50)
+    parser.add_argument('--max-rounds', type=int, default=MAX_REFRESH_ROUNDS,
+                        help="Re-tune from scratch once a refresh would grow the model past this many rounds")
+    parser.add_argument('--recency-halflife', type=float, default=None,
+                        help="Weight newer months higher, halving every N months")
+    parser.add_argument('--degradation-tol', type=float, default=0.05,
+                        help="Max validation AUC-PR drop before a refresh falls back to a full re-tune")
+    args = parser.parse_args()
+    
+    tuning_kwargs = dict(n_trials=args.n_trials, n_workers=args.workers, storage=args.storage,
+                         study_name=args.study_name, pruner=args.pruner, backend=args.backend,
+                         native_categorical=args.native_categorical, use_cache=not args.no_cache,
+                         lookup_table=args.lookup_table)
+    if args.incremental:
+        incremental_update(args.incremental, n_rounds=args.incremental_rounds,
+                           recency_halflife=args.recency_halflife, degradation_tol=args.degradation_tol,
+                           max_rounds=args.max_rounds,
+                           **tuning_kwargs)
+    else:
+        train_xgboost_optuna(shap_sample=args.shap_sample or None, approximate_shap=args.approximate_shap,
+                             **tuning_kwargs)